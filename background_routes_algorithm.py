@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from qgis.core import (QgsProcessing,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingOutputNumber,
+                       QgsProcessingOutputVectorLayer,
+                       QgsCoordinateTransform,
+                       QgsPointXY)
+
+from .pathfinder_algorithm import PathfinderAlgorithm
+from .pathfinder_constants import ENGINE_AUTOMATIC, ENGINE_NAMES, DEFAULT_MEMORY_BUDGET_MB
+
+
+class BackgroundRoutesAlgorithm(PathfinderAlgorithm):
+    """
+    This algorithm queues one grid path search per line of a route request layer, from the line's first vertex to
+    its last, as background tasks. It returns as soon as the routes are queued; the task manager runs them
+    concurrently and each path is added to a shared route layer as it finishes, while the interface stays
+    responsive.
+    """
+
+    INPUT_ROUTES = 'INPUT_ROUTES'
+    INPUT_ENGINE = 'INPUT_ENGINE'
+    INPUT_MEMORY_BUDGET = 'INPUT_MEMORY_BUDGET'
+    OUTPUT_QUEUED = 'OUTPUT_QUEUED'
+
+    def initAlgorithm(self, config):
+        self.add_image_parameters()
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT_ROUTES,
+                self.tr('Route Requests (start at the first vertex, end at the last)'),
+                [QgsProcessing.TypeVectorLine]
+            )
+        )
+
+        self.add_surface_parameters()
+
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_ENGINE,
+                self.tr("Search Engine"),
+                ENGINE_NAMES,
+                defaultValue=ENGINE_AUTOMATIC
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_MEMORY_BUDGET,
+                self.tr('Memory Budget per Route (MB)'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=DEFAULT_MEMORY_BUDGET_MB,
+                minValue=1
+            )
+        )
+
+        self.addOutput(QgsProcessingOutputVectorLayer(self.OUTPUT, self.tr('Route layer')))
+        self.addOutput(QgsProcessingOutputNumber(self.OUTPUT_QUEUED, self.tr('Routes queued')))
+
+    def flags(self):
+        # Tasks are submitted, and the shared route layer added to the project, from the main thread
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Here is where the processing itself takes place.
+        """
+        from .route_tasks import shared_route_layer, submit_route
+
+        self.parse_surface_inputs(parameters, context)
+        engine = self.parameterAsEnum(parameters, self.INPUT_ENGINE, context)
+        memory_budget = self.parameterAsDouble(parameters, self.INPUT_MEMORY_BUDGET, context) * 2 ** 20
+
+        source = self.parameterAsSource(parameters, self.INPUT_ROUTES, context)
+        if source is None:
+            raise ValueError(self.tr("A route request layer is required"))
+        transform = QgsCoordinateTransform(source.sourceCrs(), self.crs, context.transformContext())
+        route_layer = shared_route_layer(self.crs)
+
+        # Every task shares self.spec, so the surfaces are evaluated once by whichever route needs them first
+        queued = 0
+        for feature in source.getFeatures():
+            if feedback.isCanceled():
+                break
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                feedback.pushInfo(self.tr("Skipping route {}: it has no geometry").format(feature.id()))
+                continue
+            geometry.transform(transform)
+            vertices = list(geometry.vertices())
+            start = QgsPointXY(vertices[0])
+            end = QgsPointXY(vertices[-1])
+            if not self.bounding_rect.contains(start) or not self.bounding_rect.contains(end):
+                feedback.pushInfo(self.tr("Skipping route {}: it does not start and end within the first raster "
+                                          "image").format(feature.id()))
+                continue
+
+            submit_route(self.spec, self.geotransform, route_layer, feature.id(), (start.x(), start.y()),
+                         (end.x(), end.y()), engine, memory_budget)
+            queued += 1
+
+        feedback.pushInfo(self.tr("Queued {} routes; paths are added to the layer '{}' as they finish").format(
+            queued, route_layer.name()))
+        return {self.OUTPUT: route_layer.id(), self.OUTPUT_QUEUED: queued}
+
+    def name(self):
+        """
+        Returns the algorithm name, used for identifying the algorithm. This
+        string should be fixed for the algorithm, and must not be localised.
+        The name should be unique within each provider. Names should contain
+        lowercase alphanumeric characters only and no spaces or other
+        formatting characters.
+        """
+        return 'Queue Routes (Background)'
+
+    def createInstance(self):
+        return BackgroundRoutesAlgorithm()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Benchmarks of the search engines over reproducible synthetic rasters.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Times one per-pixel evaluation of a few typical formulas, comparing the tree-walking interpreter with the
+ compiled closures the lazy searches use. Run it from the directory containing the plugin folder as
+     python -m image_pathfinder.benchmarks.formula_benchmark
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import argparse
+import sys
+import timeit
+import typing as t
+import numpy as np
+
+from ..formulas import parse_formula, evaluate_formula, compile_pixel_formula
+from ..pathfinder_core import SurfaceSpec
+
+FORMULAS = (
+    "val1",
+    "1 + val2 * 4",
+    "(val1 >= 1) * (val1 <= 8)",
+    "1 + (val2 - 3) ** 2 / (1 + val1 * val1)",
+    "1 + x * 0.01 + -y * 0.02 + val1 * val2 - 3 * 2",
+)
+DEFAULT_SIZE = 256
+DEFAULT_EVALUATIONS = 20000
+
+
+def time_per_evaluation(evaluate: t.Callable[[int, int], float], pixels: t.Sequence[t.Tuple[int, int]],
+                        repeat: int = 3) -> float:
+    """
+    Returns the best time, over repeat runs, of one evaluation in seconds.
+    """
+    def run():
+        for x, y in pixels:
+            evaluate(x, y)
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / len(pixels)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="formula_benchmark", description=__doc__.split('"""')[0])
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Width and height of the input rasters")
+    parser.add_argument("--evaluations", type=int, default=DEFAULT_EVALUATIONS,
+                        help="Pixels evaluated per timing run (default: {})".format(DEFAULT_EVALUATIONS))
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the input rasters and pixels (default: 0)")
+    return parser
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    spec = SurfaceSpec([rng.integers(0, 10, (args.size, args.size)).astype(np.float64),
+                        rng.uniform(1, 10, (args.size, args.size))])
+    arrays = dict(spec.band_variables)
+    pixels = [(int(x), int(y)) for x, y in rng.integers(args.size, size=(args.evaluations, 2))]
+
+    print("{:<48} {:>14} {:>14} {:>8}".format("formula", "interpreted", "compiled", "speedup"))
+    for formula in FORMULAS:
+        node = parse_formula(formula)
+        interpreted = time_per_evaluation(
+            lambda x, y: evaluate_formula(formula, spec.get_expression_vars((x, y)), node), pixels)
+        compiled = time_per_evaluation(compile_pixel_formula(formula, node, arrays), pixels)
+        print("{:<48} {:>11.0f} ns {:>11.0f} ns {:>7.1f}x".format(
+            formula, interpreted * 1e9, compiled * 1e9, interpreted / compiled))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
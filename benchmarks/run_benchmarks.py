@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Times every search engine on synthetic surfaces for single-pair, one-to-many and cost-distance queries, and writes
+ the results as JSON. Run it from the directory containing the plugin folder as
+     python -m image_pathfinder.benchmarks.run_benchmarks --output results.json
+ and pass an earlier results file as --baseline to fail on regressions.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import typing as t
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .. import numba_search
+from ..fast_marching import FastSweepingSolver, trace_path
+from ..pathfinder_core import (ENGINE_PYTHON, ENGINE_NUMBA, ENGINE_DELTA_STEPPING, EXHAUSTED, SurfaceSpec,
+                               create_search, run_search, reconstruct_path)
+from .surfaces import SURFACES, generate_surface
+
+ENGINE_EIKONAL = "eikonal"
+# Each engine with the priority queue it orders its frontier with
+ENGINES = {
+    "python": (ENGINE_PYTHON, "binary heap (heapq)"),
+    "numba": (ENGINE_NUMBA, "binary heap (array)"),
+    "delta-stepping": (ENGINE_DELTA_STEPPING, "cost buckets"),
+    ENGINE_EIKONAL: (ENGINE_EIKONAL, "none (fast sweeping)")
+}
+QUERIES = ("pair", "one-to-many", "cost-distance")
+
+DEFAULT_SIZES = (256, 1024)
+# The pure Python engine takes minutes per query past this many pixels, so larger cases skip it unless asked for
+DEFAULT_PYTHON_MAX_PIXELS = 1024 * 1024
+DEFAULT_TIMEOUT = 600
+# Number of targets of a one-to-many query
+ONE_TO_MANY_TARGETS = 16
+# Relative drop in expansions per second, or difference in path cost, reported as a regression
+DEFAULT_REGRESSION_TOLERANCE = 0.2
+COST_TOLERANCE = 1e-6
+
+
+def peak_rss_megabytes() -> t.Optional[float]:
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return max_rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def query_points(query: str, mask: np.ndarray, rng: np.random.Generator) -> t.Tuple[
+        t.List[t.Tuple[int, int]], t.List[t.Tuple[int, int]]]:
+    """
+    Picks the sources and targets of a query. Pairs run corner to corner, one-to-many queries from one corner to
+    random pixels, and cost-distance queries from all four corners. The chosen pixels are made traversable.
+    """
+    size = mask.shape[0]
+    if query == "pair":
+        sources, targets = [(0, 0)], [(size - 1, size - 1)]
+    elif query == "one-to-many":
+        sources = [(0, 0)]
+        targets = [(int(x), int(y)) for x, y in rng.integers(0, size, (ONE_TO_MANY_TARGETS, 2))]
+    else:
+        sources, targets = [(0, 0), (size - 1, 0), (0, size - 1), (size - 1, size - 1)], []
+    for x, y in sources + targets:
+        mask[y, x] = True
+    return sources, targets
+
+
+def run_case(surface: str, size: int, engine: str, query: str, seed: int) -> t.Dict[str, t.Any]:
+    """
+    Runs one benchmark case. Meant to run in a fresh process, so that the peak RSS only covers this case.
+    """
+    record: t.Dict[str, t.Any] = {
+        "surface": surface, "size": size, "engine": engine, "queue": ENGINES[engine][1], "query": query,
+        "seed": seed
+    }
+
+    started = time.perf_counter()
+    cost, mask = generate_surface(surface, size, seed)
+    sources, targets = query_points(query, mask, np.random.default_rng(seed + 1))
+    spec = SurfaceSpec.from_surfaces(cost, mask)
+    end = targets[0] if query == "pair" else None
+    record["generate_time"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if engine == ENGINE_EIKONAL:
+        solver = FastSweepingSolver(spec.build_cost(), spec.build_mask(), sources)
+        record["setup_time"] = time.perf_counter() - started
+        started = time.perf_counter()
+        solver.solve()
+        record["search_time"] = time.perf_counter() - started
+        # Each sweep updates every traversable pixel once
+        record["expansions"] = solver.sweeps * int(np.count_nonzero(mask))
+        cost_so_far = solver.arrival_time
+        found = end is None or np.isfinite(cost_so_far[end[1], end[0]])
+        if end is not None and found:
+            started = time.perf_counter()
+            trace_path(cost_so_far, (sources[0][0] + 0.5, sources[0][1] + 0.5), (end[0] + 0.5, end[1] + 0.5))
+            record["reconstruct_time"] = time.perf_counter() - started
+    else:
+        if engine == "numba":
+            # Load or compile the kernel outside the timings; a fresh process has not done so yet
+            compile_started = time.perf_counter()
+            warm_up = SurfaceSpec.from_surfaces(np.ones((2, 2)), np.ones((2, 2), bool))
+            run_search(create_search(ENGINE_NUMBA, warm_up, None, [(0, 0)], (1, 1)))
+            record["compile_time"] = time.perf_counter() - compile_started
+            started = time.perf_counter()
+        search = create_search(ENGINES[engine][0], spec, mask, sources, end)
+        record["setup_time"] = time.perf_counter() - started
+        started = time.perf_counter()
+        status = run_search(search)
+        record["search_time"] = time.perf_counter() - started
+        record["expansions"] = int(search.expansions)
+        cost_so_far = np.asarray(search.cost_so_far) if not getattr(search, "sparse", False) else None
+        found = status != EXHAUSTED or end is None
+        if end is not None and found:
+            started = time.perf_counter()
+            reconstruct_path(search.came_from, sources[0], end)
+            record["reconstruct_time"] = time.perf_counter() - started
+
+    record["wall_time"] = record["setup_time"] + record["search_time"] + record.get("reconstruct_time", 0.0)
+    record["expansions_per_sec"] = record["expansions"] / record["search_time"] if record["search_time"] > 0 \
+        else None
+    if not found:
+        record["status"] = "no path"
+        record["cost"] = None
+    elif query == "pair":
+        record["status"] = "ok"
+        record["cost"] = float(cost_so_far[end[1], end[0]])
+    elif query == "one-to-many":
+        record["status"] = "ok"
+        record["cost"] = [float(cost_so_far[y, x]) for x, y in targets]
+    else:
+        record["status"] = "ok"
+        reached = cost_so_far[np.isfinite(cost_so_far)]
+        record["cost"] = float(reached.max()) if reached.size else None
+    record["peak_rss_mb"] = peak_rss_megabytes()
+    return record
+
+
+def _case_worker(connection, args):
+    try:
+        connection.send(run_case(*args))
+    except Exception as e:  # Reported as the case's status rather than aborting the whole run
+        connection.send({"status": "error", "error": "{}: {}".format(type(e).__name__, e)})
+    finally:
+        connection.close()
+
+
+def run_isolated(surface: str, size: int, engine: str, query: str, seed: int, timeout: float) -> t.Dict[str, t.Any]:
+    """
+    Runs a case in a freshly spawned process, so that each case's peak RSS and compilation state are independent
+    of the others, and abandons it after timeout seconds.
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_case_worker, args=(sender, (surface, size, engine, query, seed)))
+    process.start()
+    sender.close()
+
+    record = {"surface": surface, "size": size, "engine": engine, "queue": ENGINES[engine][1], "query": query,
+              "seed": seed}
+    if receiver.poll(timeout):
+        try:
+            record.update(receiver.recv())
+        except EOFError:
+            record.update(status="error", error="Benchmark process exited with code {}".format(process.exitcode))
+    else:
+        process.terminate()
+        record.update(status="timeout")
+    process.join()
+    return record
+
+
+def environment_info() -> t.Dict[str, t.Any]:
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "numba": numba_search.numba.__version__ if numba_search.NUMBA_AVAILABLE else None
+    }
+
+
+def case_key(record: t.Dict[str, t.Any]) -> t.Tuple:
+    return record["surface"], record["size"], record["engine"], record["query"], record["seed"]
+
+
+def find_regressions(results: t.List[t.Dict[str, t.Any]], baseline: t.List[t.Dict[str, t.Any]],
+                     tolerance: float) -> t.List[str]:
+    """
+    Compares results with those of an earlier run. Cases that got slower by more than the tolerance, that no longer
+    succeed, or whose path costs changed are reported.
+    """
+    previous = {case_key(r): r for r in baseline}
+    regressions = []
+    for record in results:
+        old = previous.get(case_key(record))
+        if old is None or old.get("status") != "ok":
+            continue
+        name = "{surface} {size} {engine} {query}".format(**record)
+        if record.get("status") != "ok":
+            regressions.append("{}: status is {}".format(name, record.get("status")))
+            continue
+        if old.get("expansions_per_sec") and record.get("expansions_per_sec") is not None and \
+                record["expansions_per_sec"] < old["expansions_per_sec"] * (1 - tolerance):
+            regressions.append("{}: {:.0f} expansions/s, down from {:.0f}".format(
+                name, record["expansions_per_sec"], old["expansions_per_sec"]))
+        # The eikonal solver's costs are approximations of the continuous problem, not grid path costs
+        if record["engine"] != ENGINE_EIKONAL and not np.allclose(
+                np.asarray(record["cost"], np.float64), np.asarray(old["cost"], np.float64),
+                rtol=COST_TOLERANCE, equal_nan=True):
+            regressions.append("{}: cost {} differs from {}".format(name, record["cost"], old["cost"]))
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="run_benchmarks", description=__doc__.split('"""')[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES,
+                        help="Side lengths of the square surfaces, up to 20000 (default: {})".format(
+                            " ".join(map(str, DEFAULT_SIZES))))
+    parser.add_argument("--surfaces", nargs="+", choices=tuple(SURFACES), default=tuple(SURFACES))
+    parser.add_argument("--engines", nargs="+", choices=tuple(ENGINES), default=tuple(ENGINES))
+    parser.add_argument("--queries", nargs="+", choices=QUERIES, default=QUERIES)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the surface generators (default: 0)")
+    parser.add_argument("--python-max-pixels", type=int, default=DEFAULT_PYTHON_MAX_PIXELS,
+                        help="Skip the Python engine on surfaces larger than this (default: {})".format(
+                            DEFAULT_PYTHON_MAX_PIXELS))
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="Seconds before a case is abandoned (default: {})".format(DEFAULT_TIMEOUT))
+    parser.add_argument("--output", "-o", default="benchmark_results.json",
+                        help="JSON file to write the results to (default: benchmark_results.json)")
+    parser.add_argument("--baseline", help="Results of an earlier run to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_REGRESSION_TOLERANCE,
+                        help="Relative slowdown reported as a regression (default: {})".format(
+                            DEFAULT_REGRESSION_TOLERANCE))
+    return parser
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    engines = list(args.engines)
+    if "numba" in engines and not numba_search.NUMBA_AVAILABLE:
+        print("Numba is not installed, skipping the numba engine", file=sys.stderr)
+        engines.remove("numba")
+
+    results = []
+    for size in args.sizes:
+        for surface in args.surfaces:
+            for query in args.queries:
+                for engine in engines:
+                    if engine == "python" and size * size > args.python_max_pixels:
+                        continue
+                    record = run_isolated(surface, size, engine, query, args.seed, args.timeout)
+                    results.append(record)
+                    print("{:>6} {:<8} {:<14} {:<14} {:<8} {:>9} {:>14} {:>9}".format(
+                        size, surface, query, engine, record["status"],
+                        "{:.3f}s".format(record["wall_time"]) if "wall_time" in record else "-",
+                        "{:.0f}/s".format(record["expansions_per_sec"]) if record.get("expansions_per_sec")
+                        else "-",
+                        "{:.0f} MB".format(record["peak_rss_mb"]) if record.get("peak_rss_mb") else "-"),
+                        file=sys.stderr)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment_info(), "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Reproducible synthetic cost surfaces for the benchmarks.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import typing as t
+import numpy as np
+
+# Fraction of pixels blocked by the random obstacles of the maze surface, and the spacing of its walls
+MAZE_OBSTACLE_DENSITY = 0.15
+MAZE_WALL_SPACING = 16
+MAZE_GAPS_PER_WALL = 4
+
+# Octaves of the fractal DEM, and the slope-to-cost scale applied to it
+DEM_OCTAVES = 8
+DEM_PERSISTENCE = 0.5
+DEM_RELIEF = 500.0
+SLOPE_COST_SCALE = 10.0
+
+
+def uniform_surface(size: int, rng: np.random.Generator) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Unit cost everywhere, which gives A* its best case: the heuristic is exact along many equally cheap paths.
+    """
+    return np.ones((size, size), np.float64), np.ones((size, size), bool)
+
+
+def noise_surface(size: int, rng: np.random.Generator) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Independent costs uniform in [1, 10), so the heuristic is loose and the search expands a wide region.
+    """
+    return rng.uniform(1, 10, (size, size)), np.ones((size, size), bool)
+
+
+def maze_surface(size: int, rng: np.random.Generator) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Unit cost with untraversable horizontal walls, each crossable through a few random gaps, over a field of random
+    single-pixel obstacles. Paths have to detour far from the straight line.
+    """
+    mask = rng.random((size, size)) >= MAZE_OBSTACLE_DENSITY
+    for row in range(MAZE_WALL_SPACING, size - 1, MAZE_WALL_SPACING):
+        mask[row, :] = False
+        gaps = rng.integers(0, size, MAZE_GAPS_PER_WALL)
+        mask[row, gaps] = True
+        # Clear the pixels either side of each gap so that obstacles cannot plug it
+        mask[row - 1, gaps] = True
+        mask[row + 1, gaps] = True
+    return np.ones((size, size), np.float64), mask
+
+
+def fractal_dem(size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Generates a fractal terrain by summing octaves of bilinearly interpolated value noise, each with twice the
+    frequency and half the amplitude of the one before.
+    """
+    dem = np.zeros((size, size), np.float32)
+    amplitude = 1.0
+    for octave in range(DEM_OCTAVES):
+        cells = 2 ** (octave + 1)
+        lattice = rng.random((cells + 1, cells + 1)).astype(np.float32)
+        coords = np.linspace(0, cells, size, endpoint=False, dtype=np.float32)
+        index = coords.astype(np.int64)
+        frac = coords - index
+        rows = lattice[index] * (1 - frac)[:, np.newaxis] + lattice[index + 1] * frac[:, np.newaxis]
+        dem += amplitude * (rows[:, index] * (1 - frac) + rows[:, index + 1] * frac)
+        amplitude *= DEM_PERSISTENCE
+    return dem * np.float32(DEM_RELIEF)
+
+
+def slope_surface(size: int, rng: np.random.Generator) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Cost rising with the slope of a fractal DEM, like the slope maps the plugin is typically run on.
+    """
+    grad_y, grad_x = np.gradient(fractal_dem(size, rng))
+    slope = np.hypot(grad_x, grad_y)
+    return 1 + SLOPE_COST_SCALE * slope.astype(np.float64), np.ones((size, size), bool)
+
+
+SURFACES: t.Dict[str, t.Callable[[int, np.random.Generator], t.Tuple[np.ndarray, np.ndarray]]] = {
+    "uniform": uniform_surface,
+    "noise": noise_surface,
+    "maze": maze_surface,
+    "slope": slope_surface
+}
+
+
+def generate_surface(name: str, size: int, seed: int = 0) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Generates a size x size surface. The same name, size and seed always give the same surface.
+
+    :returns: The cost array and the traversability mask
+    """
+    return SURFACES[name](size, np.random.default_rng(seed))
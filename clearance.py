@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import math
+import typing as t
+import numpy as np
+
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+
+def _distance_separable(obstacles: np.ndarray, pixel_size: t.Tuple[float, float], max_distance: float) -> np.ndarray:
+    """
+    Computes the Euclidean distance transform with NumPy only, in two passes. The first finds each pixel's distance to
+    the nearest obstacle in its column with cumulative scans. The second takes, for each pixel, the nearest of those
+    column distances over the columns within max_distance, one whole-grid operation per column offset.
+
+    :returns: The squared distances, exact up to max_distance and larger than it beyond
+    """
+    height, width = obstacles.shape
+    rows = np.arange(height, dtype=np.float64)[:, np.newaxis]
+    previous = np.maximum.accumulate(np.where(obstacles, rows, -np.inf), axis=0)
+    following = np.minimum.accumulate(np.where(obstacles, rows, np.inf)[::-1], axis=0)[::-1]
+    column_distance = np.minimum(rows - previous, following - rows) * pixel_size[1]
+    column_distance = column_distance ** 2
+
+    squared = column_distance.copy()
+    max_offset = width - 1 if math.isinf(max_distance) else min(width - 1, int(max_distance // pixel_size[0]))
+    for offset in range(1, max_offset + 1):
+        step = (offset * pixel_size[0]) ** 2
+        np.minimum(squared[:, offset:], column_distance[:, :-offset] + step, out=squared[:, offset:])
+        np.minimum(squared[:, :-offset], column_distance[:, offset:] + step, out=squared[:, :-offset])
+    return squared
+
+
+def obstacle_distance(mask: np.ndarray, pixel_size: t.Tuple[float, float] = (1.0, 1.0),
+                      max_distance: float = math.inf) -> np.ndarray:
+    """
+    Computes the Euclidean distance from the centre of every pixel to the centre of the nearest untraversable pixel.
+    Pixels beyond the edges of the grid are not obstacles.
+
+    :param pixel_size: The width and height of a pixel, in the units of the distances
+    :param max_distance: The farthest distance of interest. Larger distances are reported as inf, which lets the
+                         NumPy fallback stop looking further away
+    :returns: A float64 array, 0 on untraversable pixels and inf where no untraversable pixel is within max_distance
+    """
+    obstacles = ~np.asarray(mask, bool)
+    if not np.any(obstacles):
+        return np.full(obstacles.shape, np.inf)
+
+    if ndimage is not None:
+        distance = ndimage.distance_transform_edt(~obstacles, sampling=(pixel_size[1], pixel_size[0]))
+    else:
+        distance = np.sqrt(_distance_separable(obstacles, pixel_size, max_distance))
+    distance[distance > max_distance] = np.inf
+    return distance
+
+
+def proximity_penalty(distance: np.ndarray, proximity_cost: float, proximity_distance: float) -> np.ndarray:
+    """
+    The cost added to entering pixels near untraversable ones: proximity_cost next to an obstacle, falling linearly
+    to nothing at proximity_distance.
+    """
+    return proximity_cost * np.clip(1 - distance / proximity_distance, 0, 1)
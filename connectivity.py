@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import hashlib
+import threading
+import typing as t
+from collections import OrderedDict
+import numpy as np
+
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+# Number of label rasters kept in memory, keyed by mask fingerprint
+LABEL_CACHE_SIZE = 4
+
+_label_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+# Guards _label_cache, which searches running in background tasks share
+_label_cache_lock = threading.Lock()
+
+
+def mask_fingerprint(mask: np.ndarray, connectivity: int = 4) -> str:
+    """
+    Hashes a traversability mask (bit-packed, so hashing reads an eighth of the mask's size) together with its shape
+    and the connectivity it will be labeled with.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.array(mask.shape + (connectivity,), np.int64).tobytes())
+    digest.update(np.packbits(np.ascontiguousarray(mask, bool)).tobytes())
+    return digest.hexdigest()
+
+
+def _label_union_find(mask: np.ndarray, connectivity: int) -> np.ndarray:
+    """
+    Labels connected components with NumPy only, by repeatedly hooking the root of the larger index of every
+    traversable edge onto the smaller one and then pointer jumping until every pixel points at its root.
+    """
+    height, width = mask.shape
+    flat_mask = mask.ravel()
+    index = np.arange(height * width, dtype=np.int64).reshape(height, width)
+
+    offsets = [(0, 1), (1, 0)]
+    if connectivity == 8:
+        offsets += [(1, 1), (1, -1)]
+    edge_u = []
+    edge_v = []
+    for dy, dx in offsets:
+        u = index[:height - dy, max(0, -dx):width - max(0, dx)]
+        v = index[dy:, max(0, dx):width - max(0, -dx)]
+        both = mask[:height - dy, max(0, -dx):width - max(0, dx)] & mask[dy:, max(0, dx):width - max(0, -dx)]
+        edge_u.append(u[both])
+        edge_v.append(v[both])
+    edge_u = np.concatenate(edge_u)
+    edge_v = np.concatenate(edge_v)
+
+    parent = np.arange(height * width, dtype=np.int64)
+    while True:
+        root_u = parent[edge_u]
+        root_v = parent[edge_v]
+        differ = root_u != root_v
+        if not np.any(differ):
+            break
+        np.minimum.at(parent, np.maximum(root_u[differ], root_v[differ]), np.minimum(root_u[differ], root_v[differ]))
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    labels = np.zeros(height * width, np.int32)
+    _, inverse = np.unique(parent[flat_mask], return_inverse=True)
+    labels[flat_mask] = inverse.ravel() + 1
+    return labels.reshape(height, width)
+
+
+def label_components(mask: np.ndarray, connectivity: int = 4) -> np.ndarray:
+    """
+    Labels the connected components of the traversable pixels.
+
+    :param connectivity: 4 for pixels joined by edges, as in the grid search, or 8 to also join them by corners
+    :returns: An int32 array with 0 for untraversable pixels and a distinct positive label per component
+    """
+    if connectivity not in (4, 8):
+        raise ValueError("Connectivity must be 4 or 8")
+
+    if ndimage is not None:
+        structure = ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2)
+        labels, _ = ndimage.label(mask, structure=structure, output=np.int32)
+        return labels
+    return _label_union_find(np.asarray(mask, bool), connectivity)
+
+
+def get_component_labels(mask: np.ndarray, connectivity: int = 4) -> np.ndarray:
+    """
+    Returns the component labels of the mask, reusing the labels from an earlier call with an identical mask.
+    """
+    key = mask_fingerprint(mask, connectivity)
+    with _label_cache_lock:
+        if key in _label_cache:
+            _label_cache.move_to_end(key)
+            return _label_cache[key]
+
+    labels = label_components(mask, connectivity)
+    labels.setflags(write=False)
+    with _label_cache_lock:
+        _label_cache[key] = labels
+        while len(_label_cache) > LABEL_CACHE_SIZE:
+            _label_cache.popitem(last=False)
+    return labels
+
+
+def components_of(labels: np.ndarray, *positions: t.Tuple[int, int]) -> t.List[int]:
+    return [int(labels[pos[1], pos[0]]) for pos in positions]
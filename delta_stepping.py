@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import typing as t
+import numpy as np
+
+from .pathfinder_core import FOUND, EXHAUSTED, PAUSED, NEIGHBOR_DX, NEIGHBOR_DY
+
+
+class DeltaSteppingSearch:
+    """
+    Dijkstra's algorithm in the delta-stepping formulation. Instead of settling one pixel at a time, every tentative
+    cost in [i * delta, (i + 1) * delta) is settled together: the bucket's pixels relax all of their neighbors with
+    whole-array NumPy operations, and the pixels whose cost dropped but stayed inside the bucket are relaxed again
+    until the bucket is stable.
+
+    Within one direction the relaxed targets are all distinct, so each relaxation is a plain gather, compare and
+    scatter with no per-pixel Python work. Direction-dependent costs, one array per direction in NEIGHBORS, are
+    gathered from the array of the direction being relaxed.
+    """
+    USES_HEURISTIC = False
+    # cost, mask, cost_so_far, came_from and settled
+    STATE_BYTES_PER_PIXEL = 8 + 1 + 8 + 2 + 1
+    # Buckets settled per step
+    STEP_SIZE = 50
+
+    def __init__(self, cost: np.ndarray, mask: np.ndarray, sources: t.Sequence[t.Tuple[int, int]],
+                 end: t.Optional[t.Tuple[int, int]] = None, delta: t.Optional[float] = None):
+        self.height, self.width = cost.shape[-2:]
+        self.cost = np.ascontiguousarray(cost, np.float64).reshape(-1, self.width * self.height)
+        self.mask = np.ascontiguousarray(mask, np.bool_).ravel()
+        self.end = end
+
+        if delta is None:
+            # A bucket width around the typical step cost keeps the number of re-relaxations per bucket low. The
+            # mean is taken one direction at a time, so that only a boolean mask is allocated next to the costs
+            total, count = 0.0, 0
+            for direction_cost in self.cost:
+                # Steps from outside the grid, or without an elevation, cost inf
+                traversable = self.mask & np.isfinite(direction_cost)
+                total += float(np.sum(direction_cost, where=traversable))
+                count += int(np.count_nonzero(traversable))
+            delta = total / count if count else 1.0
+        self.delta = max(delta, np.finfo(np.float64).tiny)
+
+        self.cost_so_far_flat = np.full(self.width * self.height, np.inf, np.float64)
+        self.came_from_flat = np.zeros(self.width * self.height, np.ushort)
+        self.settled = np.zeros(self.width * self.height, bool)
+
+        source_indices = np.array([s[1] * self.width + s[0] for s in sources], np.int64)
+        self.cost_so_far_flat[source_indices] = 0
+        self.pending = np.unique(source_indices)
+
+        self.min_heuristic = 0 if end is None else \
+            min(abs(s[0] - end[0]) + abs(s[1] - end[1]) for s in sources)
+        self.buckets_settled = 0
+        self.expansions = 0
+        self.pushes = int(self.pending.size)
+        self.stale_pops = 0
+        self.cost_evaluations = 0
+        self.peak_frontier = int(self.pending.size)
+
+    @property
+    def cost_so_far(self) -> np.ndarray:
+        return self.cost_so_far_flat.reshape(self.height, self.width)
+
+    @property
+    def came_from(self) -> np.ndarray:
+        return self.came_from_flat.reshape(self.height, self.width)
+
+    def memory_bytes(self) -> int:
+        """
+        Returns the bytes held by the search state and the pending pixels.
+        """
+        extra_cost_bytes = self.cost.nbytes - self.cost.itemsize * self.width * self.height
+        return self.width * self.height * self.STATE_BYTES_PER_PIXEL + extra_cost_bytes + self.pending.nbytes
+
+    def closed_mask(self) -> np.ndarray:
+        """
+        Flags the pixels which have been reached and are no longer pending, which includes the pixels closed by the
+        search whose state was restored.
+        """
+        closed = np.isfinite(self.cost_so_far_flat)
+        closed[self.pending] = False
+        return closed.reshape(self.height, self.width)
+
+    def compact(self):
+        # The pending pixels are deduplicated after every bucket, so there is nothing stale to drop
+        pass
+
+    def restore(self, cost_so_far: np.ndarray, came_from: np.ndarray, open_pixels: t.Sequence[t.Tuple[int, int]]):
+        """
+        Replaces the search state with the accumulated costs and direction codes of an earlier search, and makes
+        open_pixels the pending pixels, so that the search resumes where the earlier one stopped.
+        """
+        self.cost_so_far_flat = np.array(cost_so_far, np.float64).ravel()
+        self.came_from_flat = np.array(came_from, np.ushort).ravel()
+        self.settled = np.zeros(self.width * self.height, bool)
+        self.pending = np.unique(np.array([pos[1] * self.width + pos[0] for pos in open_pixels], np.int64))
+
+        self.min_heuristic = 0
+        if self.end is not None and self.pending.size:
+            self.min_heuristic = int((np.abs(self.pending % self.width - self.end[0]) +
+                                      np.abs(self.pending // self.width - self.end[1])).min())
+        self.pushes += int(self.pending.size)
+        self.peak_frontier = max(self.peak_frontier, int(self.pending.size))
+
+    def relax(self, active: np.ndarray) -> np.ndarray:
+        """
+        Relaxes the neighbors of every pixel in active.
+
+        :returns: The unique flat indices of the pixels whose cost was lowered
+        """
+        self.expansions += active.size
+        xs = active % self.width
+        ys = active // self.width
+        improved = []
+        for d in range(4):
+            next_xs = xs + NEIGHBOR_DX[d]
+            next_ys = ys + NEIGHBOR_DY[d]
+            in_bounds = (next_xs >= 0) & (next_xs < self.width) & (next_ys >= 0) & (next_ys < self.height)
+            sources = active[in_bounds]
+            targets = next_ys[in_bounds] * self.width + next_xs[in_bounds]
+            self.cost_evaluations += int(np.count_nonzero(self.mask[targets]))
+
+            new_cost = self.cost_so_far_flat[sources] + self.cost[d if self.cost.shape[0] > 1 else 0, targets]
+            better = self.mask[targets] & (new_cost < self.cost_so_far_flat[targets])
+            targets = targets[better]
+            self.cost_so_far_flat[targets] = new_cost[better]
+            self.came_from_flat[targets] = d + 1
+            improved.append(targets)
+
+        improved = np.unique(np.concatenate(improved))
+        self.pushes += improved.size
+        if self.end is not None and improved.size:
+            heuristic = np.abs(improved % self.width - self.end[0]) + np.abs(improved // self.width - self.end[1])
+            self.min_heuristic = min(self.min_heuristic, int(heuristic.min()))
+        return improved
+
+    def settle_bucket(self):
+        """
+        Settles every pixel in the lowest non-empty bucket.
+        """
+        pending_cost = self.cost_so_far_flat[self.pending]
+        min_cost = pending_cost.min()
+        upper_bound = (np.floor(min_cost / self.delta) + 1) * self.delta
+        if upper_bound <= min_cost:
+            # The division rounded down for a cost on a bucket boundary, which would leave the bucket empty
+            upper_bound += self.delta
+
+        in_bucket = pending_cost < upper_bound
+        active = self.pending[in_bucket]
+        later = [self.pending[~in_bucket]]
+        members = [active]
+
+        while active.size:
+            improved = self.relax(active)
+            in_bucket = self.cost_so_far_flat[improved] < upper_bound
+            active = improved[in_bucket]
+            members.append(active)
+            later.append(improved[~in_bucket])
+
+        members = np.concatenate(members)
+        self.settled[members] = True
+        # Pixels relaxed again after their cost dropped within the bucket are the counterpart of stale heap pops
+        self.stale_pops += members.size - np.unique(members).size
+        later = np.unique(np.concatenate(later))
+        self.pending = later[~self.settled[later]]
+        self.peak_frontier = max(self.peak_frontier, int(self.pending.size))
+        self.buckets_settled += 1
+
+    def step(self, max_buckets: int) -> int:
+        """
+        Settles up to max_buckets buckets.
+
+        :returns: FOUND, EXHAUSTED or PAUSED
+        """
+        end_index = None if self.end is None else self.end[1] * self.width + self.end[0]
+        for _ in range(max_buckets):
+            if end_index is not None and self.settled[end_index]:
+                return FOUND
+            if self.pending.size == 0:
+                return EXHAUSTED
+            self.settle_bucket()
+
+        if end_index is not None and self.settled[end_index]:
+            return FOUND
+        return PAUSED if self.pending.size else EXHAUSTED
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from qgis.core import (QgsFeature,
+                       QgsGeometry,
+                       QgsPoint)
+
+from .pathfinder_algorithm import PathfinderAlgorithm
+
+
+class EikonalPathfinderAlgorithm(PathfinderAlgorithm):
+    """
+    This algorithm solves the eikonal equation over the cost surface to find the cheapest continuous route between
+    two points, then traces it by gradient descent on the arrival time. Unlike the grid search the route is not
+    constrained to pixel edges, so it is free of the staircase artifacts of 4-connected paths on smooth cost surfaces.
+    """
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Here is where the processing itself takes place.
+        """
+        from .pathfinder_core import (SearchCanceled, find_eikonal_path, translated_error, world_to_continuous_pixel,
+                                      continuous_pixel_to_world)
+        from .query_cache import query_key
+
+        self.parse_grid_inputs(parameters, context)
+        self.parse_endpoint_inputs(parameters, context)
+        start = world_to_continuous_pixel(self.start_point.x(), self.start_point.y(), self.geotransform)
+        end = world_to_continuous_pixel(self.end_point.x(), self.end_point.y(), self.geotransform)
+
+        # A stored result has no footprint, so runs asking for one always solve
+        cache = None
+        key = None
+        if self.parameterAsBool(parameters, self.INPUT_USE_CACHE, context) and self.footprint_path is None:
+            cache = self.open_query_cache()
+            key = query_key(self.query_fingerprint(parameters, context, start=list(start), end=list(end)))
+            stored = cache.get(key)
+            if stored is not None:
+                feedback.pushInfo(self.tr("Reusing the stored result of an identical query"))
+                return self.write_path(stored["coordinates"], None)
+
+        self.load_surfaces(parameters, context)
+        try:
+            result = find_eikonal_path(
+                self.spec, start, end,
+                is_canceled=feedback.isCanceled,
+                on_message=lambda message: feedback.pushInfo(self.tr(message))
+            )
+        except SearchCanceled:
+            raise RuntimeError("Task Cancelled")
+        except (ValueError, RuntimeError) as e:
+            raise translated_error(e, self.tr) from e
+
+        coordinates = [list(continuous_pixel_to_world(p, self.geotransform)) for p in result.pixels]
+        if cache is not None:
+            cache.put(key, {"coordinates": coordinates, "cost": result.cost})
+        return self.write_path(coordinates, result.footprint)
+
+    def write_path(self, coordinates, footprint):
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPolyline([QgsPoint(*c) for c in coordinates]))
+        self.output_sink.addFeature(feature)
+
+        results = {self.OUTPUT: self.output_id}
+        results.update(self.write_footprint(footprint))
+        return results
+
+    def name(self):
+        """
+        Returns the algorithm name, used for identifying the algorithm. This
+        string should be fixed for the algorithm, and must not be localised.
+        The name should be unique within each provider. Names should contain
+        lowercase alphanumeric characters only and no spaces or other
+        formatting characters.
+        """
+        return 'Find Path (Eikonal)'
+
+    def createInstance(self):
+        return EikonalPathfinderAlgorithm()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import math
+import typing as t
+import numpy as np
+
+# The four sweep orderings of the fast sweeping method, as (row step, column step)
+SWEEP_ORDERS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+# Length of each gradient descent step, in pixels
+TRACE_STEP = 0.5
+
+
+class FastSweepingSolver:
+    """
+    Solves the eikonal equation |grad T| = cost over the traversable pixels with the fast sweeping method, giving
+    the arrival time T of the cheapest continuous (not grid-constrained) route from the sources to every pixel.
+
+    Each sweep visits the grid in one of four diagonal orderings. Every pixel on an anti-diagonal only depends on
+    pixels of the previous anti-diagonal in that ordering, so each anti-diagonal is updated as one vectorized
+    Godunov upwind update.
+    """
+
+    def __init__(self, cost: np.ndarray, mask: np.ndarray, sources: t.Sequence[t.Tuple[int, int]],
+                 tolerance: float = 1e-9):
+        self.height, self.width = cost.shape
+        self.cost = np.asarray(cost, np.float64)
+        self.mask = np.asarray(mask, bool).copy()
+        self.tolerance = tolerance
+
+        # Padding with a ring of unreachable pixels removes all bounds checks from the updates
+        self.arrival_padded = np.full((self.height + 2, self.width + 2), np.inf, np.float64)
+        for source in sources:
+            self.arrival_padded[source[1] + 1, source[0] + 1] = 0
+            self.mask[source[1], source[0]] = False  # Sources are fixed, never updated
+
+        self.sweeps = 0
+        self.sweeps_since_change = 0
+
+    @property
+    def arrival_time(self) -> np.ndarray:
+        return self.arrival_padded[1:-1, 1:-1]
+
+    @property
+    def converged(self) -> bool:
+        return self.sweeps_since_change >= len(SWEEP_ORDERS)
+
+    def sweep(self) -> float:
+        """
+        Runs a single sweep, in the next of the four orderings.
+
+        :returns: The largest decrease of any arrival time during the sweep
+        """
+        row_step, col_step = SWEEP_ORDERS[self.sweeps % len(SWEEP_ORDERS)]
+        arrival = self.arrival_padded
+        max_change = 0.0
+
+        for diagonal in range(self.height + self.width - 1):
+            i = np.arange(max(0, diagonal - self.width + 1), min(self.height - 1, diagonal) + 1)
+            rows = i if row_step > 0 else self.height - 1 - i
+            cols = diagonal - i if col_step > 0 else self.width - 1 - (diagonal - i)
+
+            updatable = self.mask[rows, cols]
+            rows = rows[updatable]
+            cols = cols[updatable]
+            if rows.size == 0:
+                continue
+
+            padded_rows = rows + 1
+            padded_cols = cols + 1
+            a = np.minimum(arrival[padded_rows - 1, padded_cols], arrival[padded_rows + 1, padded_cols])
+            b = np.minimum(arrival[padded_rows, padded_cols - 1], arrival[padded_rows, padded_cols + 1])
+            f = self.cost[rows, cols]
+
+            with np.errstate(invalid='ignore'):
+                # Where a and b differ by at least f (or one of them is unreachable) the route arrives along an axis
+                one_sided = np.minimum(a, b) + f
+                diff = a - b
+                two_sided = (a + b + np.sqrt(np.maximum(2 * f * f - diff * diff, 0))) / 2
+                candidate = np.where(np.abs(diff) >= f, one_sided, two_sided)
+                candidate = np.where(np.isinf(a) & np.isinf(b), np.inf, candidate)
+
+            old = arrival[padded_rows, padded_cols]
+            improved = candidate < old
+            if np.any(improved):
+                max_change = max(max_change, float(np.max(np.where(
+                    np.isinf(old[improved]), np.inf, old[improved] - candidate[improved]))))
+                arrival[padded_rows[improved], padded_cols[improved]] = candidate[improved]
+
+        self.sweeps += 1
+        if max_change > self.tolerance:
+            self.sweeps_since_change = 0
+        else:
+            self.sweeps_since_change += 1
+        return max_change
+
+    def solve(self, max_sweeps: int = 1000) -> np.ndarray:
+        while not self.converged and self.sweeps < max_sweeps:
+            self.sweep()
+        return self.arrival_time
+
+
+def descent_directions(arrival: np.ndarray) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the upwind gradient of the arrival time field, normalized to unit length. Pixels with no downhill
+    neighbor (sources and unreachable pixels) get a zero gradient.
+    """
+    padded = np.pad(arrival, 1, constant_values=np.inf)
+    left, right = padded[1:-1, :-2], padded[1:-1, 2:]
+    up, down = padded[:-2, 1:-1], padded[2:, 1:-1]
+
+    with np.errstate(invalid='ignore'):
+        grad_x = np.where(left < right, arrival - left, right - arrival)
+        grad_x = np.where((np.minimum(left, right) < arrival) & np.isfinite(grad_x), grad_x, 0)
+        grad_y = np.where(up < down, arrival - up, down - arrival)
+        grad_y = np.where((np.minimum(up, down) < arrival) & np.isfinite(grad_y), grad_y, 0)
+
+    norm = np.hypot(grad_x, grad_y)
+    norm[norm == 0] = 1
+    return grad_x / norm, grad_y / norm
+
+
+def trace_path(arrival: np.ndarray, start: t.Tuple[float, float],
+               end: t.Tuple[float, float]) -> t.List[t.Tuple[float, float]]:
+    """
+    Traces the route from end back to start by gradient descent on the arrival time field. Positions are continuous
+    pixel coordinates, with the pixel (x, y) covering [x, x + 1) x [y, y + 1).
+
+    Where the interpolated gradient vanishes or points into an untraversable pixel, the trace falls back to stepping
+    to the center of the lowest neighboring pixel, which always exists for a reachable pixel other than the source.
+
+    :returns: The route as a list of continuous pixel coordinates, ordered from end to start
+    """
+    height, width = arrival.shape
+    grad_x, grad_y = descent_directions(arrival)
+    start_cell = (min(int(start[0]), width - 1), min(int(start[1]), height - 1))
+
+    pos_x, pos_y = end
+    path = [(pos_x, pos_y)]
+    max_steps = int(8 * (width + height) / TRACE_STEP)
+    # Past max_steps only strictly descending pixel steps are taken, so at most one more step per pixel is needed
+    for _ in range(max_steps + width * height + 1):
+        cell = (min(int(pos_x), width - 1), min(int(pos_y), height - 1))
+        if cell == start_cell or math.hypot(pos_x - start[0], pos_y - start[1]) <= 1:
+            break
+
+        # Bilinear interpolation of the direction field between the four nearest pixel centers
+        base_x = math.floor(pos_x - 0.5)
+        base_y = math.floor(pos_y - 0.5)
+        frac_x = pos_x - 0.5 - base_x
+        frac_y = pos_y - 0.5 - base_y
+        dir_x = dir_y = 0.0
+        for dx, dy, weight in ((0, 0, (1 - frac_x) * (1 - frac_y)), (1, 0, frac_x * (1 - frac_y)),
+                               (0, 1, (1 - frac_x) * frac_y), (1, 1, frac_x * frac_y)):
+            x = base_x + dx
+            y = base_y + dy
+            if 0 <= x < width and 0 <= y < height and np.isfinite(arrival[y, x]):
+                dir_x += weight * grad_x[y, x]
+                dir_y += weight * grad_y[y, x]
+
+        norm = math.hypot(dir_x, dir_y)
+        next_x = pos_x - TRACE_STEP * dir_x / norm if norm > 1e-6 else pos_x
+        next_y = pos_y - TRACE_STEP * dir_y / norm if norm > 1e-6 else pos_y
+        next_cell = (int(next_x), int(next_y))
+        if norm <= 1e-6 or len(path) > max_steps or not (0 <= next_cell[0] < width and 0 <= next_cell[1] < height) \
+                or arrival[next_cell[1], next_cell[0]] > arrival[cell[1], cell[0]]:
+            next_cell = min(
+                ((cell[0] + dx, cell[1] + dy) for dx, dy in ((0, 1), (1, 0), (0, -1), (-1, 0))
+                 if 0 <= cell[0] + dx < width and 0 <= cell[1] + dy < height),
+                key=lambda c: arrival[c[1], c[0]]
+            )
+            next_x, next_y = next_cell[0] + 0.5, next_cell[1] + 0.5
+
+        pos_x, pos_y = float(next_x), float(next_y)
+        path.append((pos_x, pos_y))
+    else:
+        raise RuntimeError("Gradient descent did not reach the start")
+
+    path.append(start)
+    return path
@@ -3,7 +3,9 @@
 
 import ast
 import operator
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional, Set
+
+import numpy as np
 
 
 def byte_offset_to_char_offset(source: str, byte_offset: int) -> int:
@@ -57,6 +59,35 @@ def parse_formula(formula: str):
         node = ast.parse(formula, "<string>", mode="eval")
     except SyntaxError as e:
         raise FormulaSyntaxError.from_syntax_error(e, "Could not parse")
+    return fold_constants(formula, node)
+
+
+def formula_variables(node: ast.AST) -> Set[str]:
+    """
+    Lists the names of the variables a parsed formula refers to, without evaluating it.
+    """
+    return {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+
+
+def fold_constants(source: str, node: ast.AST) -> ast.AST:
+    """
+    Replaces every operation whose operands are all constants with its value, so that it is computed once instead
+    of for every pixel. Operations which fail, or use unsupported syntax, are left for evaluate_formula to report.
+    """
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            setattr(node, field, fold_constants(source, value))
+        elif isinstance(value, list):
+            setattr(node, field, [fold_constants(source, v) if isinstance(v, ast.AST) else v for v in value])
+
+    if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Compare)) and \
+            all(isinstance(child, ast.Constant) for child in ast.iter_child_nodes(node)
+                if not isinstance(child, (ast.operator, ast.unaryop, ast.cmpop))):
+        try:
+            value = eval_node(source, node, {})
+        except Exception:
+            return node
+        return ast.copy_location(ast.Constant(value=value), node)
     return node
 
 
@@ -71,20 +102,10 @@ def evaluate_formula(formula: str, vars: Dict[str, Any], parsed_node=None) -> fl
 
 
 def eval_node(source: str, node: ast.AST, vars: Dict[str, Any]) -> float:
-    EVALUATORS = {
-        ast.Expression: eval_expression,
-        ast.Constant: eval_constant,
-        ast.Name: eval_name,
-        ast.BinOp: eval_binop,
-        ast.UnaryOp: eval_unaryop,
-        ast.Compare: eval_cmpop
-    }
-
-    for ast_type, evaluator in EVALUATORS.items():
-        if isinstance(node, ast_type):
-            return evaluator(source, node, vars)
-
-    raise FormulaSyntaxError.from_ast_node(source, node, "This syntax is not supported")
+    evaluator = EVALUATORS.get(type(node))
+    if evaluator is None:
+        raise FormulaSyntaxError.from_ast_node(source, node, "This syntax is not supported")
+    return evaluator(source, node, vars)
 
 
 def eval_expression(source: str, node: ast.Expression, vars: Dict[str, Any]) -> float:
@@ -100,56 +121,64 @@ def eval_constant(source: str, node: ast.Constant, vars: Dict[str, Any]) -> floa
 
 def eval_name(source: str, node: ast.Name, vars: Dict[str, Any]) -> float:
     try:
-        return float(vars[node.id])
+        value = vars[node.id]
     except KeyError:
         raise FormulaSyntaxError.from_ast_node(source, node, f"Undefined variable: {node.id}")
 
+    # Whole arrays may be passed in to evaluate the formula over every pixel at once
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float64, copy=False)
+    return float(value)
 
-def eval_binop(source: str, node: ast.BinOp, vars: Dict[str, Any]) -> float:
-    OPERATIONS = {
-        ast.Add: operator.add,
-        ast.Sub: operator.sub,
-        ast.Mult: operator.mul,
-        ast.Div: operator.truediv,
-        ast.Pow: operator.pow,
-    }
 
+BINARY_OPERATIONS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+
+
+def eval_binop(source: str, node: ast.BinOp, vars: Dict[str, Any]) -> float:
     left_value = eval_node(source, node.left, vars)
     right_value = eval_node(source, node.right, vars)
 
     try:
-        apply = OPERATIONS[type(node.op)]
+        apply = BINARY_OPERATIONS[type(node.op)]
     except KeyError:
         raise FormulaSyntaxError.from_ast_node(source, node, f"Operations of type {type(node.op)} are not supported")
 
     return apply(left_value, right_value)
 
 
-def eval_unaryop(source: str, node: ast.UnaryOp, vars: Dict[str, Any]) -> float:
-    OPERATIONS = {
-        ast.USub: operator.neg,
-    }
+UNARY_OPERATIONS = {
+    ast.USub: operator.neg,
+}
 
+
+def eval_unaryop(source: str, node: ast.UnaryOp, vars: Dict[str, Any]) -> float:
     operand_value = eval_node(source, node.operand, vars)
 
     try:
-        apply = OPERATIONS[type(node.op)]
+        apply = UNARY_OPERATIONS[type(node.op)]
     except KeyError:
         raise FormulaSyntaxError.from_ast_node(source, node, f"Operations of type {type(node.op)} are not supported")
 
     return apply(operand_value)
 
 
-def eval_cmpop(source: str, node: ast.Compare, vars: Dict[str, Any]) -> float:
-    OPERATIONS = {
-        ast.Eq: operator.eq,
-        ast.NotEq: operator.ne,
-        ast.Lt: operator.lt,
-        ast.LtE: operator.le,
-        ast.Gt: operator.gt,
-        ast.GtE: operator.ge
-    }
+COMPARISON_OPERATIONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge
+}
+
 
+def eval_cmpop(source: str, node: ast.Compare, vars: Dict[str, Any]) -> float:
     vals = [eval_node(source, node.left, vars)]
 
     for c in node.comparators:
@@ -160,9 +189,136 @@ def eval_cmpop(source: str, node: ast.Compare, vars: Dict[str, Any]) -> float:
     result = True
     for i in range(len(ops)):
         try:
-            apply = OPERATIONS[type(ops[i])]
-            result = result and apply(vals[i], vals[i+1])
+            apply = COMPARISON_OPERATIONS[type(ops[i])]
+            result = result & apply(vals[i], vals[i+1])
         except KeyError:
             raise FormulaSyntaxError.from_ast_node(source, node, f"Operations of type {type(node.op)} are not supported")
 
-    return result
+    # Comparisons yield 1 or 0, so they can be used in arithmetic like any other value. Boolean arrays would not
+    # support negation and subtraction
+    if isinstance(result, np.ndarray):
+        return result.astype(np.float64)
+    return float(result)
+
+
+EVALUATORS = {
+    ast.Expression: eval_expression,
+    ast.Constant: eval_constant,
+    ast.Name: eval_name,
+    ast.BinOp: eval_binop,
+    ast.UnaryOp: eval_unaryop,
+    ast.Compare: eval_cmpop
+}
+
+
+PixelEvaluator = Callable[[int, int], float]
+
+
+def compile_pixel_formula(formula: str, node: ast.AST, arrays: Dict[str, np.ndarray]) -> PixelEvaluator:
+    """
+    Compiles a parsed formula into nested closures which evaluate it at one pixel, given as its column x and row y.
+    Variables other than x and y are looked up in arrays once, here, so evaluating allocates no dictionaries and
+    does no type dispatch. Errors are reported exactly as evaluate_formula reports them: any syntax the compiler
+    does not handle is left to eval_node, which raises the same error it always has.
+    """
+    evaluate = compile_node(formula, node, arrays)
+
+    def evaluate_pixel(x: int, y: int) -> float:
+        try:
+            return evaluate(x, y)
+        except FormulaSyntaxError:
+            raise
+        except Exception as e:
+            raise FormulaRuntimeError(f"Evaluation failed: {e}")
+
+    return evaluate_pixel
+
+
+def compile_node(source: str, node: ast.AST, arrays: Dict[str, np.ndarray]) -> PixelEvaluator:
+    compiler = COMPILERS.get(type(node))
+    evaluate = compiler(source, node, arrays) if compiler is not None else None
+    if evaluate is not None:
+        return evaluate
+
+    def interpret(x, y):
+        vars_dict = {"x": x, "y": y}
+        for name, arr in arrays.items():
+            vars_dict[name] = arr[y][x]
+        return eval_node(source, node, vars_dict)
+
+    return interpret
+
+
+def compile_expression(source: str, node: ast.Expression, arrays: Dict[str, np.ndarray]) -> PixelEvaluator:
+    return compile_node(source, node.body, arrays)
+
+
+def compile_constant(source: str, node: ast.Constant, arrays: Dict[str, np.ndarray]) -> Optional[PixelEvaluator]:
+    if not isinstance(node.value, (int, float)):
+        return None
+    value = float(node.value)
+    return lambda x, y: value
+
+
+def compile_name(source: str, node: ast.Name, arrays: Dict[str, np.ndarray]) -> Optional[PixelEvaluator]:
+    # Array variables shadow the coordinates, as they would in the dictionary passed to evaluate_formula
+    if node.id in arrays:
+        arr = arrays[node.id]
+        return lambda x, y: float(arr[y, x])
+    if node.id == "x":
+        return lambda x, y: float(x)
+    if node.id == "y":
+        return lambda x, y: float(y)
+    return None
+
+
+def compile_binop(source: str, node: ast.BinOp, arrays: Dict[str, np.ndarray]) -> Optional[PixelEvaluator]:
+    apply = BINARY_OPERATIONS.get(type(node.op))
+    if apply is None:
+        return None
+    left = compile_node(source, node.left, arrays)
+    if isinstance(node.right, ast.Constant) and isinstance(node.right.value, (int, float)):
+        right_value = float(node.right.value)
+        return lambda x, y: apply(left(x, y), right_value)
+    right = compile_node(source, node.right, arrays)
+    return lambda x, y: apply(left(x, y), right(x, y))
+
+
+def compile_unaryop(source: str, node: ast.UnaryOp, arrays: Dict[str, np.ndarray]) -> Optional[PixelEvaluator]:
+    apply = UNARY_OPERATIONS.get(type(node.op))
+    if apply is None:
+        return None
+    operand = compile_node(source, node.operand, arrays)
+    return lambda x, y: apply(operand(x, y))
+
+
+def compile_cmpop(source: str, node: ast.Compare, arrays: Dict[str, np.ndarray]) -> Optional[PixelEvaluator]:
+    applies = [COMPARISON_OPERATIONS.get(type(op)) for op in node.ops]
+    if None in applies:
+        return None
+    operands = [compile_node(source, operand, arrays) for operand in [node.left] + node.comparators]
+
+    if len(applies) == 1:
+        apply = applies[0]
+        left, right = operands
+        return lambda x, y: float(apply(left(x, y), right(x, y)))
+
+    def compare_chain(x, y):
+        # Every operand is evaluated, without short-circuiting, as in eval_cmpop
+        vals = [operand(x, y) for operand in operands]
+        result = True
+        for i, apply in enumerate(applies):
+            result = result & apply(vals[i], vals[i + 1])
+        return float(result)
+
+    return compare_chain
+
+
+COMPILERS = {
+    ast.Expression: compile_expression,
+    ast.Constant: compile_constant,
+    ast.Name: compile_name,
+    ast.BinOp: compile_binop,
+    ast.UnaryOp: compile_unaryop,
+    ast.Compare: compile_cmpop
+}
@@ -30,51 +30,20 @@ __copyright__ = '(C) 2022 by Noah Mollerstuen'
 
 __revision__ = '$Format:%H$'
 
-import math
-import typing as t
-import numpy as np
-from qgis.core import (QgsProject,
-                       QgsProcessing,
+from qgis.core import (QgsProcessingParameterEnum,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingParameterFileDestination,
+                       QgsProcessingOutputNumber,
                        QgsFeature,
                        QgsGeometry,
-                       QgsPoint,
-                       QgsRectangle)
+                       QgsPoint)
 
-from .pathfinder_algorithm import PathfinderAlgorithm, PriorityQueue
+from .pathfinder_algorithm import PathfinderAlgorithm
+from .pathfinder_constants import ENGINE_AUTOMATIC, ENGINE_NAMES, DEFAULT_MEMORY_BUDGET_MB
+from .instrumentation import PhaseTimer, COUNTER_NAMES, profiled
 
-DIRECTION_MAPPING = {
-    (0, 1): 1,  # 0 is reserved for None
-    (1, 0): 2,
-    (0, -1): 3,
-    (-1, 0): 4
-}
-DIRECTION_MAPPING_INV = {v: k for k, v in DIRECTION_MAPPING.items()}
-NEIGHBORS = ((0, 1), (1, 0), (0, -1), (-1, 0))
-
-
-def point_to_pixel(point: QgsPoint, img_bounds: QgsRectangle, img_width: int, img_height: int) -> (int, int):
-    return (
-        math.floor((point.x() - img_bounds.xMinimum()) / img_bounds.width() * img_width),
-        img_height - 1 - math.floor((point.y() - img_bounds.yMinimum()) / img_bounds.height() * img_height)
-    )
-
-
-def pixel_to_point(pix: (int, int), img_bounds: QgsRectangle, img_width: int, img_height: int) -> QgsPoint:
-    return QgsPoint(
-        (pix[0] + 0.5) / img_width * img_bounds.width() + img_bounds.xMinimum(),
-        (img_height - 1 - pix[1] + 0.5) / img_height * img_bounds.height() + img_bounds.yMinimum()
-    )
-
-
-def a_star_heuristic(pos1: (int, int), pos2: (int, int)) -> int:
-    return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
-
-
-def get_neighbors(pos: (int, int), max_x, max_y):
-    return [
-        p for p in (((pos[0] + n[0], pos[1] + n[1]), n) for n in NEIGHBORS) if
-        0 <= p[0][0] < max_x and 0 <= p[0][1] < max_y
-    ]
+# Phases of a run, as named in PhaseTimer and find_path's timings
+PHASES = ("load", "precompute", "search", "reconstruct", "write")
 
 
 class GridPathfinderAlgorithm(PathfinderAlgorithm):
@@ -83,103 +52,161 @@ class GridPathfinderAlgorithm(PathfinderAlgorithm):
     custom expressions cost and traversability of the image. The output paths are constrained to the pixel grid.
     """
 
+    INPUT_ENGINE = 'INPUT_ENGINE'
+    INPUT_MEMORY_BUDGET = 'INPUT_MEMORY_BUDGET'
+    INPUT_PROFILE = 'INPUT_PROFILE'
+    INPUT_WINDOW_MARGIN = 'INPUT_WINDOW_MARGIN'
+
+    def initAlgorithm(self, config):
+        super().initAlgorithm(config)
+
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_ENGINE,
+                self.tr("Search Engine"),
+                ENGINE_NAMES,
+                defaultValue=ENGINE_AUTOMATIC
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_MEMORY_BUDGET,
+                self.tr('Memory Budget (MB)'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=DEFAULT_MEMORY_BUDGET_MB,
+                minValue=1
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_WINDOW_MARGIN,
+                self.tr('Search Window Margin (pixels)'),
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.INPUT_PROFILE,
+                self.tr('Profile Output'),
+                self.tr('cProfile statistics (*.prof);;tracemalloc snapshot (*.tracemalloc)'),
+                optional=True,
+                createByDefault=False
+            )
+        )
+
+        for phase in PHASES:
+            self.addOutput(QgsProcessingOutputNumber(
+                self.timing_output(phase), self.tr("Time spent in phase '{}' (s)").format(phase)))
+        for counter in COUNTER_NAMES:
+            self.addOutput(QgsProcessingOutputNumber(counter.upper(), self.tr(counter.replace("_", " ").capitalize())))
+
+    @staticmethod
+    def timing_output(phase: str) -> str:
+        return "TIME_" + phase.upper()
+
     def processAlgorithm(self, parameters, context, feedback):
         """
         Here is where the processing itself takes place.
         """
-        self.parse_inputs(parameters, context)
-
-        start_pos = point_to_pixel(self.start_point, self.bounding_rect, self.grid_width, self.grid_height)
-        if not self.is_traversable(start_pos):
-            raise ValueError(self.tr("Starting point must be traversable"))
-        end_pos = point_to_pixel(self.end_point, self.bounding_rect, self.grid_width, self.grid_height)
-        if not self.is_traversable(end_pos):
-            raise ValueError(self.tr("Ending point must be traversable"))
-
-        # A* Algorithm
-        frontier = PriorityQueue()
-        frontier.put(start_pos, 0)
-
-        came_from = np.empty((self.grid_height, self.grid_width), np.ushort)
-        came_from[start_pos[1]][start_pos[0]] = 0
-
-        cost_so_far = np.full((self.grid_height, self.grid_width), np.inf, np.float64)
-        cost_so_far[start_pos[1]][start_pos[0]] = 0
-
-        starting_heuristic = a_star_heuristic(start_pos, end_pos)
-        min_heuristic = starting_heuristic
-
-        warned_inadmissible_heuristic = False
-
-        print("Starting A*")
-        while True:
-            if feedback.isCanceled():
-                raise RuntimeError("Task Cancelled")
-            feedback.setProgress((1 - min_heuristic / starting_heuristic) * 100)
-
-            if frontier.empty():
-                raise ValueError(self.tr("No path found"))
-            current = frontier.get()
-
-            if len(frontier) > 100000:
-                print(frontier.elements)
-                raise RuntimeError(self.tr("Max queue length exceeded"))
-
-            if current == end_pos:
-                break
-
-            neighbors = [n for n in get_neighbors(current, self.grid_width, self.grid_height) if
-                         self.is_traversable(n[0])]
-            for next_pos, direction in neighbors:
-                add_cost = self.get_cost(next_pos)
-                if not warned_inadmissible_heuristic and add_cost < 1:
-                    warned_inadmissible_heuristic = True
-                    feedback.pushInfo(
-                        self.tr("[WARNING] Custom cost expression is less than 1, path may not be optimal!"))
-
-                new_cost = cost_so_far[current[1]][current[0]] + add_cost
-                if new_cost < cost_so_far[next_pos[1]][next_pos[0]]:
-                    cost_so_far[next_pos[1]][next_pos[0]] = new_cost
-                    heuristic = a_star_heuristic(next_pos, end_pos)
-                    min_heuristic = min(min_heuristic, heuristic)
-                    frontier.put(next_pos, new_cost + heuristic)
-                    came_from[next_pos[1]][next_pos[0]] = DIRECTION_MAPPING[direction]
-
-        print("Reconstructing path")
-        current_point = end_pos
-        last_point = None
-        path = []
-        while True:
-            if feedback.isCanceled():
-                raise RuntimeError("Task Cancelled")
-            delta_code = came_from[current_point[1]][current_point[0]]
-            if delta_code == 0:
-                next_point = None
-            else:
-                delta = DIRECTION_MAPPING_INV[delta_code]
-                next_point = (current_point[0] - delta[0], current_point[1] - delta[1])
-            if last_point is None or next_point is None or \
-                    next_point[0] - current_point[0] != current_point[0] - last_point[0] or \
-                    next_point[1] - current_point[1] != current_point[1] - last_point[1]:
-                path.append(pixel_to_point(current_point, self.bounding_rect, self.grid_width, self.grid_height))
-
-            if current_point == start_pos:
-                break
-            last_point = current_point
-            current_point = next_point
-
-        # Add a feature in the sink
-        feature = QgsFeature()
-        feature.setGeometry(QgsGeometry.fromPolyline(path))
-        self.output_sink.addFeature(feature)
-
-        # Return the results of the algorithm. In this case our only result is
-        # the feature sink which contains the processed features, but some
-        # algorithms may return multiple feature sinks, calculated numeric
-        # statistics, etc. These should all be included in the returned
-        # dictionary, with keys matching the feature corresponding parameter
-        # or output names.
-        return {self.OUTPUT: self.output_id}
+        with profiled(self.parameterAsFileOutput(parameters, self.INPUT_PROFILE, context)):
+            return self.find_path(parameters, context, feedback)
+
+    def find_path(self, parameters, context, feedback):
+        # The engines, NumPy and GDAL are imported on the first run rather than when QGIS registers the algorithm
+        from .pathfinder_core import SearchCanceled, find_path, translated_error, world_to_pixel, pixel_to_world
+        from .query_cache import query_key
+
+        timer = PhaseTimer()
+        with timer.phase("load"):
+            self.parse_grid_inputs(parameters, context)
+            self.parse_endpoint_inputs(parameters, context)
+        engine = self.parameterAsEnum(parameters, self.INPUT_ENGINE, context)
+        memory_budget = self.parameterAsDouble(parameters, self.INPUT_MEMORY_BUDGET, context) * 2 ** 20
+        # Left empty, the whole grid is read and searched
+        window_margin = None
+        try:
+            window_margin = int(self.parameterAsString(parameters, self.INPUT_WINDOW_MARGIN, context))
+        except ValueError:
+            pass
+
+        start_pos = world_to_pixel(self.start_point.x(), self.start_point.y(), self.geotransform,
+                                   self.grid_width, self.grid_height)
+        end_pos = world_to_pixel(self.end_point.x(), self.end_point.y(), self.geotransform,
+                                 self.grid_width, self.grid_height)
+
+        # A stored result has no footprint, so runs asking for one always search
+        cache = None
+        key = None
+        if self.parameterAsBool(parameters, self.INPUT_USE_CACHE, context) and self.footprint_path is None:
+            cache = self.open_query_cache()
+            key = query_key(self.query_fingerprint(parameters, context, start=list(start_pos), end=list(end_pos),
+                                                   engine=engine, memory_budget=memory_budget,
+                                                   window_margin=window_margin))
+            stored = cache.get(key)
+            if stored is not None:
+                feedback.pushInfo(self.tr("Reusing the stored result of an identical query"))
+                return self.write_results(stored, None, timer, feedback)
+
+        with timer.phase("load"):
+            self.load_surfaces(parameters, context, streaming=window_margin is not None)
+
+        try:
+            result = find_path(self.spec, start_pos, end_pos, engine, memory_budget,
+                               is_canceled=feedback.isCanceled,
+                               on_progress=feedback.setProgress,
+                               on_message=lambda message: feedback.pushInfo(self.tr(message)),
+                               keep_footprint=self.footprint_path is not None,
+                               window_margin=window_margin)
+        except SearchCanceled:
+            raise RuntimeError("Task Cancelled")
+        except (ValueError, RuntimeError) as e:
+            raise translated_error(e, self.tr) from e
+        timer.timings.update(result.timings)
+
+        stored = {
+            "coordinates": [list(pixel_to_world(p, self.geotransform)) for p in result.pixels],
+            "cost": result.cost,
+            "engine": result.engine,
+            "counters": result.counters
+        }
+        if cache is not None:
+            cache.put(key, stored)
+        return self.write_results(stored, result.footprint, timer, feedback)
+
+    def write_results(self, stored, footprint, timer: PhaseTimer, feedback):
+        """
+        Writes a path, whether just found or stored by an identical earlier query, and reports its statistics.
+        """
+        with timer.phase("write"):
+            path = [QgsPoint(*c) for c in stored["coordinates"]]
+
+            # Add a feature in the sink
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromPolyline(path))
+            self.output_sink.addFeature(feature)
+            results = {self.OUTPUT: self.output_id}
+            results.update(self.write_footprint(footprint))
+
+        feedback.pushInfo(self.tr("Engine: {}, path cost: {}").format(stored["engine"], stored["cost"]))
+        feedback.pushInfo(self.tr("Timings: {}").format(", ".join(
+            "{} {:.3f}s".format(phase, timer.timings.get(phase, 0.0)) for phase in PHASES)))
+        feedback.pushInfo(self.tr("Counters: {}").format(", ".join(
+            "{} {}".format(counter.replace("_", " "), stored["counters"][counter]) for counter in COUNTER_NAMES)))
+
+        # Return the results of the algorithm. Along with the feature sink
+        # which contains the path and the optional footprint raster, these are the time spent in each phase of
+        # the run and the search's counters, with keys matching the outputs
+        # declared in initAlgorithm. A reused result reports the counters of the search that found it.
+        for phase in PHASES:
+            results[self.timing_output(phase)] = timer.timings.get(phase, 0.0)
+        for counter in COUNTER_NAMES:
+            results[counter.upper()] = stored["counters"][counter]
+        return results
 
     def name(self):
         """
@@ -32,6 +32,8 @@ __revision__ = '$Format:%H$'
 
 from qgis.core import QgsProcessingProvider
 from .grid_pathfinder_algorithm import GridPathfinderAlgorithm
+from .eikonal_pathfinder_algorithm import EikonalPathfinderAlgorithm
+from .background_routes_algorithm import BackgroundRoutesAlgorithm
 # from .any_angle_pathfinder_algorithm import AnyAnglePathfinderAlgorithm
 
 
@@ -55,6 +57,8 @@ class PathfinderProvider(QgsProcessingProvider):
         Loads all algorithms belonging to this provider.
         """
         self.addAlgorithm(GridPathfinderAlgorithm())
+        self.addAlgorithm(EikonalPathfinderAlgorithm())
+        self.addAlgorithm(BackgroundRoutesAlgorithm())
         # self.addAlgorithm(AnyAnglePathfinderAlgorithm())
 
     def id(self):
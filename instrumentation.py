@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Timing, counters and profiling of pathfinding runs.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import contextlib
+import cProfile
+import time
+import tracemalloc
+import typing as t
+
+# Counters kept by every search engine, in the order they are reported
+COUNTER_NAMES = ("expansions", "pushes", "stale_pops", "cost_evaluations", "peak_frontier")
+
+PROFILE_EXTENSION = ".prof"
+TRACEMALLOC_EXTENSION = ".tracemalloc"
+# Frames kept per allocation in tracemalloc snapshots
+TRACEMALLOC_FRAMES = 16
+
+
+class PhaseTimer:
+    """
+    Accumulates the wall time spent in named phases of a run, in the order the phases were first entered.
+    """
+
+    def __init__(self):
+        self.timings: t.Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def search_counters(search) -> t.Dict[str, int]:
+    return {name: int(getattr(search, name)) for name in COUNTER_NAMES}
+
+
+@contextlib.contextmanager
+def profiled(path: t.Optional[str]):
+    """
+    Profiles the enclosed code and writes the result to path: cProfile statistics, readable with pstats or
+    snakeviz, when path ends in .prof, and otherwise a tracemalloc snapshot, readable with
+    tracemalloc.Snapshot.load. Does nothing when path is empty.
+    """
+    if not path:
+        yield
+        return
+
+    if path.lower().endswith(PROFILE_EXTENSION):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+        return
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        yield
+    finally:
+        tracemalloc.take_snapshot().dump(path)
+        if not already_tracing:
+            tracemalloc.stop()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import typing as t
+import numpy as np
+
+from .pathfinder_core import FOUND, EXHAUSTED, PAUSED, NEIGHBOR_DX, NEIGHBOR_DY
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+INITIAL_HEAP_SIZE = 1024
+
+
+def _jit(fn):
+    # cache=True writes the compiled kernel next to this module so that later QGIS sessions skip compilation
+    if numba is None:
+        return fn
+    return numba.njit(cache=True, nogil=True)(fn)
+
+
+@_jit
+def _heap_push(heap_pri, heap_node, size, priority, node):
+    if size == heap_pri.shape[0]:
+        new_pri = np.empty(size * 2, np.float64)
+        new_node = np.empty(size * 2, np.int64)
+        new_pri[:size] = heap_pri
+        new_node[:size] = heap_node
+        heap_pri = new_pri
+        heap_node = new_node
+
+    i = size
+    while i > 0:
+        parent = (i - 1) >> 1
+        if heap_pri[parent] <= priority:
+            break
+        heap_pri[i] = heap_pri[parent]
+        heap_node[i] = heap_node[parent]
+        i = parent
+    heap_pri[i] = priority
+    heap_node[i] = node
+    return heap_pri, heap_node, size + 1
+
+
+@_jit
+def _heap_pop(heap_pri, heap_node, size):
+    top_pri = heap_pri[0]
+    top_node = heap_node[0]
+    size -= 1
+    last_pri = heap_pri[size]
+    last_node = heap_node[size]
+
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and heap_pri[child + 1] < heap_pri[child]:
+            child += 1
+        if heap_pri[child] >= last_pri:
+            break
+        heap_pri[i] = heap_pri[child]
+        heap_node[i] = heap_node[child]
+        i = child
+    if size > 0:
+        heap_pri[i] = last_pri
+        heap_node[i] = last_node
+    return top_pri, top_node, size
+
+
+@_jit
+def _a_star_kernel(cost, mask, width, height, end, cost_so_far, came_from,
+                   heap_pri, heap_node, heap_size, max_expansions, min_heuristic, peak_frontier):
+    """
+    Runs A* over flattened arrays until the end is reached, the frontier runs dry or max_expansions nodes have been
+    expanded. A negative end index runs plain Dijkstra over every reachable pixel. cost has one row of pixel costs,
+    or one per direction in NEIGHBORS holding the cost of stepping into each pixel in that direction.
+
+    Along with the search state, returns the number of expansions, heap pushes, stale pops and cost evaluations
+    made by this call, and the largest heap size seen so far.
+    """
+    end_x = end % width if end >= 0 else 0
+    end_y = end // width if end >= 0 else 0
+    directional = cost.shape[0] > 1
+
+    expansions = 0
+    pushes = 0
+    stale_pops = 0
+    evaluations = 0
+    while heap_size > 0:
+        if expansions >= max_expansions:
+            return (PAUSED, heap_pri, heap_node, heap_size, expansions, min_heuristic,
+                    pushes, stale_pops, evaluations, peak_frontier)
+
+        priority, current, heap_size = _heap_pop(heap_pri, heap_node, heap_size)
+        if current == end:
+            return (FOUND, heap_pri, heap_node, heap_size, expansions, min_heuristic,
+                    pushes, stale_pops, evaluations, peak_frontier)
+
+        x = current % width
+        y = current // width
+        current_cost = cost_so_far[current]
+        if end >= 0:
+            # Skip stale entries left behind when a node's cost was lowered after it was pushed. The heuristic is
+            # summed before adding it to the cost so that the sum is rounded exactly as it was when pushed
+            if priority > current_cost + (abs(x - end_x) + abs(y - end_y)):
+                stale_pops += 1
+                continue
+        elif priority > current_cost:
+            stale_pops += 1
+            continue
+        expansions += 1
+
+        for d in range(4):
+            next_x = x + NEIGHBOR_DX[d]
+            next_y = y + NEIGHBOR_DY[d]
+            if next_x < 0 or next_x >= width or next_y < 0 or next_y >= height:
+                continue
+            next_pos = next_y * width + next_x
+            if not mask[next_pos]:
+                continue
+
+            evaluations += 1
+            new_cost = current_cost + cost[d if directional else 0, next_pos]
+            if new_cost < cost_so_far[next_pos]:
+                cost_so_far[next_pos] = new_cost
+                came_from[next_pos] = d + 1
+                if end >= 0:
+                    heuristic = abs(next_x - end_x) + abs(next_y - end_y)
+                    if heuristic < min_heuristic:
+                        min_heuristic = heuristic
+                else:
+                    heuristic = 0
+                heap_pri, heap_node, heap_size = _heap_push(heap_pri, heap_node, heap_size,
+                                                            new_cost + heuristic, next_pos)
+                pushes += 1
+                if heap_size > peak_frontier:
+                    peak_frontier = heap_size
+
+    return (EXHAUSTED, heap_pri, heap_node, heap_size, expansions, min_heuristic,
+            pushes, stale_pops, evaluations, peak_frontier)
+
+
+class NumbaSearch:
+    """
+    A* search over precomputed cost and traversability arrays, run by a compiled kernel. The search advances in
+    slices of a bounded number of expansions so that the caller can report progress and honour cancellation.
+
+    When no end is given, the search expands every reachable pixel, producing a full cost-distance surface from the
+    sources. cost is either one array of pixel costs or, for direction-dependent costs, one per direction in
+    NEIGHBORS.
+    """
+    # The Manhattan heuristic is only admissible when every step costs at least 1
+    USES_HEURISTIC = True
+    # cost, mask, cost_so_far and came_from
+    STATE_BYTES_PER_PIXEL = 8 + 1 + 8 + 2
+    # Expansions per step; the kernel is fast enough that progress updates would dominate with smaller steps
+    STEP_SIZE = 200000
+
+    def __init__(self, cost: np.ndarray, mask: np.ndarray, sources: t.Sequence[t.Tuple[int, int]],
+                 end: t.Optional[t.Tuple[int, int]] = None):
+        self.height, self.width = cost.shape[-2:]
+        self.cost = np.ascontiguousarray(cost, np.float64).reshape(-1, self.width * self.height)
+        self.mask = np.ascontiguousarray(mask, np.bool_).ravel()
+        self.end = -1 if end is None else end[1] * self.width + end[0]
+
+        self.cost_so_far_flat = np.full(self.width * self.height, np.inf, np.float64)
+        self.came_from_flat = np.zeros(self.width * self.height, np.ushort)
+
+        self.heap_pri = np.empty(INITIAL_HEAP_SIZE, np.float64)
+        self.heap_node = np.empty(INITIAL_HEAP_SIZE, np.int64)
+        self.heap_size = 0
+
+        self.min_heuristic = 0 if end is None else \
+            min(abs(s[0] - end[0]) + abs(s[1] - end[1]) for s in sources)
+        self.expansions = 0
+        self.pushes = len(sources)
+        self.stale_pops = 0
+        self.cost_evaluations = 0
+        self.peak_frontier = 0
+        for source in sources:
+            pos = source[1] * self.width + source[0]
+            self.cost_so_far_flat[pos] = 0
+            heuristic = 0 if end is None else abs(source[0] - end[0]) + abs(source[1] - end[1])
+            self.heap_pri, self.heap_node, self.heap_size = _heap_push(
+                self.heap_pri, self.heap_node, self.heap_size, float(heuristic), pos)
+        self.peak_frontier = self.heap_size
+
+    @property
+    def cost_so_far(self) -> np.ndarray:
+        return self.cost_so_far_flat.reshape(self.height, self.width)
+
+    @property
+    def came_from(self) -> np.ndarray:
+        return self.came_from_flat.reshape(self.height, self.width)
+
+    def memory_bytes(self) -> int:
+        """
+        Returns the bytes held by the search state and the heap, including the heap's unused capacity.
+        """
+        extra_cost_bytes = self.cost.nbytes - self.cost.itemsize * self.width * self.height
+        return (self.width * self.height * self.STATE_BYTES_PER_PIXEL + extra_cost_bytes +
+                self.heap_pri.nbytes + self.heap_node.nbytes)
+
+    def current_entries(self) -> np.ndarray:
+        """
+        Flags the heap entries which are not stale, that is whose priority matches their node's current cost.
+        """
+        pri = self.heap_pri[:self.heap_size]
+        node = self.heap_node[:self.heap_size]
+        priority_floor = self.cost_so_far_flat[node]
+        if self.end >= 0:
+            priority_floor = priority_floor + (np.abs(node % self.width - self.end % self.width) +
+                                               np.abs(node // self.width - self.end // self.width))
+        return pri <= priority_floor
+
+    def closed_mask(self) -> np.ndarray:
+        """
+        Flags the pixels which have been reached and are no longer on the frontier.
+        """
+        closed = np.isfinite(self.cost_so_far_flat)
+        closed[self.heap_node[:self.heap_size][self.current_entries()]] = False
+        return closed.reshape(self.height, self.width)
+
+    def compact(self):
+        """
+        Removes stale heap entries and shrinks the heap's capacity to fit the remaining entries. A sorted array is a
+        valid binary heap, so the heap is rebuilt with one vectorized sort.
+        """
+        pri = self.heap_pri[:self.heap_size]
+        node = self.heap_node[:self.heap_size]
+        current = self.current_entries()
+        order = np.argsort(pri[current], kind='stable')
+
+        self.heap_size = int(order.size)
+        self.heap_pri = np.empty(max(self.heap_size, INITIAL_HEAP_SIZE), np.float64)
+        self.heap_node = np.empty(max(self.heap_size, INITIAL_HEAP_SIZE), np.int64)
+        self.heap_pri[:self.heap_size] = pri[current][order]
+        self.heap_node[:self.heap_size] = node[current][order]
+
+    def restore(self, cost_so_far: np.ndarray, came_from: np.ndarray, open_pixels: t.Sequence[t.Tuple[int, int]]):
+        """
+        Replaces the search state with the accumulated costs and direction codes of an earlier search, and makes
+        open_pixels the frontier, so that the search resumes where the earlier one stopped.
+        """
+        self.cost_so_far_flat = np.array(cost_so_far, np.float64).ravel()
+        self.came_from_flat = np.array(came_from, np.ushort).ravel()
+
+        node = np.array([pos[1] * self.width + pos[0] for pos in open_pixels], np.int64)
+        heuristic = np.zeros(node.size, np.float64)
+        if self.end >= 0:
+            heuristic = (np.abs(node % self.width - self.end % self.width) +
+                         np.abs(node // self.width - self.end // self.width)).astype(np.float64)
+        pri = self.cost_so_far_flat[node] + heuristic
+        # As in compact, a sorted array is a valid binary heap
+        order = np.argsort(pri, kind='stable')
+        self.heap_size = int(node.size)
+        self.heap_pri = np.empty(max(self.heap_size, INITIAL_HEAP_SIZE), np.float64)
+        self.heap_node = np.empty(max(self.heap_size, INITIAL_HEAP_SIZE), np.int64)
+        self.heap_pri[:self.heap_size] = pri[order]
+        self.heap_node[:self.heap_size] = node[order]
+
+        self.min_heuristic = int(heuristic.min()) if heuristic.size else 0
+        self.pushes += self.heap_size
+        self.peak_frontier = max(self.peak_frontier, self.heap_size)
+
+    def step(self, max_expansions: int) -> int:
+        """
+        Advances the search by up to max_expansions expansions.
+
+        :returns: FOUND, EXHAUSTED or PAUSED
+        """
+        (status, self.heap_pri, self.heap_node, self.heap_size, expansions, self.min_heuristic,
+         pushes, stale_pops, evaluations, self.peak_frontier) = _a_star_kernel(
+            self.cost, self.mask, self.width, self.height, self.end, self.cost_so_far_flat, self.came_from_flat,
+            self.heap_pri, self.heap_node, self.heap_size, max_expansions, self.min_heuristic, self.peak_frontier
+        )
+        self.expansions += expansions
+        self.pushes += pushes
+        self.stale_pops += stale_pops
+        self.cost_evaluations += evaluations
+        return status
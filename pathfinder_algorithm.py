@@ -1,41 +1,41 @@
-import numpy as np
+import os
+
 from qgis.PyQt.QtCore import QCoreApplication
-from qgis.core import (QgsProject,
+from qgis.core import (QgsApplication,
                        QgsProcessing,
-                       QgsFeatureSink,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterRasterLayer,
+                       QgsProcessingParameterMultipleLayers,
+                       QgsProcessingParameterBoolean,
+                       QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterPoint,
                        QgsProcessingParameterEnum,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterString,
                        QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterRasterDestination,
+                       QgsRasterLayer,
+                       QgsCoordinateTransform,
                        QgsPoint,
                        QgsRectangle,
                        QgsWkbTypes,
                        QgsFields)
 import typing as t
-import heapq
-from osgeo import gdal
-
-from .formulas import parse_formula, evaluate_formula
-
-
-class PriorityQueue:
-    def __init__(self):
-        self.elements: t.List[t.Tuple[float, (int, int)]] = []
 
-    def empty(self) -> bool:
-        return not self.elements
+if t.TYPE_CHECKING:
+    import numpy as np
+    from .pathfinder_core import SurfaceSpec
+    from .query_cache import QueryCache
+    from .surface_cache import SurfaceCache
 
-    def put(self, item: (int, int), priority: float):
-        heapq.heappush(self.elements, (priority, item))
 
-    def get(self) -> (int, int):
-        return heapq.heappop(self.elements)[1]
-
-    def __len__(self):
-        return len(self.elements)
+def __getattr__(name):
+    # PriorityQueue used to be defined here and now lives in the core. It is looked up on first use, so that
+    # registering the algorithms does not import NumPy
+    if name == "PriorityQueue":
+        from . import pathfinder_core
+        return getattr(pathfinder_core, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 class PathfinderAlgorithm(QgsProcessingAlgorithm):
@@ -43,8 +43,10 @@ class PathfinderAlgorithm(QgsProcessingAlgorithm):
     # used when calling the algorithm from another algorithm, or when
     # calling from the QGIS console.
     OUTPUT = 'OUTPUT'
+    OUTPUT_FOOTPRINT = 'OUTPUT_FOOTPRINT'
 
     INPUT_IMAGES = ["INPUT_IMG" + str(i) for i in range(3)]
+    INPUT_EXTRA_IMAGES = 'INPUT_EXTRA_IMAGES'
     INPUT_POINT1 = 'INPUT_POINT1'
     INPUT_POINT2 = 'INPUT_POINT2'
     INPUT_MIN_VAL = 'INPUT_MIN_VAL'
@@ -53,24 +55,39 @@ class PathfinderAlgorithm(QgsProcessingAlgorithm):
     INPUT_COST_ENUM = 'INPUT_COST_ENUM'
     INPUT_TRAVERSABILITY_EXPRESSION = 'INPUT_TRAVERSABILITY_EXPRESSION'
     INPUT_COST_EXPRESSION = 'INPUT_COST_EXPRESSION'
+    INPUT_DEM_ENUM = 'INPUT_DEM_ENUM'
+    INPUT_SLOPE_EXPRESSION = 'INPUT_SLOPE_EXPRESSION'
+    INPUT_MIN_CLEARANCE = 'INPUT_MIN_CLEARANCE'
+    INPUT_PROXIMITY_COST = 'INPUT_PROXIMITY_COST'
+    INPUT_PROXIMITY_DISTANCE = 'INPUT_PROXIMITY_DISTANCE'
+    INPUT_REGION = 'INPUT_REGION'
+    INPUT_REGION_BUFFER = 'INPUT_REGION_BUFFER'
+    INPUT_USE_CACHE = 'INPUT_USE_CACHE'
 
     def __init__(self):
         super().__init__()
 
-        self.inp_arrs: t.List[np.ndarray] = []
+        self.inp_layers: t.List[t.Optional[QgsRasterLayer]] = []
+        self.basis_layer: t.Optional[QgsRasterLayer] = None
+        self.inp_arrs: t.List["np.ndarray"] = []
         self.bounding_rect: QgsRectangle = None
         self.grid_width: t.Optional[int] = None
         self.grid_height: t.Optional[int] = None
-        self.basis_arr: t.Optional[np.ndarray] = None
+        self.basis_arr: t.Optional["np.ndarray"] = None
 
         self.start_point: QgsPoint = None
         self.end_point: QgsPoint = None
 
+        self.geotransform = None
+
+        self.spec: t.Optional["SurfaceSpec"] = None
         self.is_traversable = None
         self.get_cost = None
 
         self.output_id = None
         self.output_sink = None
+        self.crs = None
+        self.footprint_path: t.Optional[str] = None
 
     def initAlgorithm(self, config):
         """
@@ -78,6 +95,52 @@ class PathfinderAlgorithm(QgsProcessingAlgorithm):
         with some other properties.
         """
 
+        self.add_image_parameters()
+
+        self.addParameter(
+            QgsProcessingParameterPoint(
+                self.INPUT_POINT1,
+                self.tr('Starting Point')
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterPoint(
+                self.INPUT_POINT2,
+                self.tr('Ending Point')
+            )
+        )
+
+        self.add_surface_parameters()
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT,
+                self.tr('Output layer')
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterRasterDestination(
+                self.OUTPUT_FOOTPRINT,
+                self.tr('Search footprint (accumulated cost of closed pixels)'),
+                optional=True,
+                createByDefault=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_USE_CACHE,
+                self.tr('Reuse Stored Results and Surfaces of Earlier Runs'),
+                defaultValue=True
+            )
+        )
+
+    def add_image_parameters(self):
+        """
+        Adds the input raster parameters.
+        """
         self.addParameter(
             QgsProcessingParameterRasterLayer(
                 self.INPUT_IMAGES[0],
@@ -102,19 +165,18 @@ class PathfinderAlgorithm(QgsProcessingAlgorithm):
         )
 
         self.addParameter(
-            QgsProcessingParameterPoint(
-                self.INPUT_POINT1,
-                self.tr('Starting Point')
-            )
-        )
-
-        self.addParameter(
-            QgsProcessingParameterPoint(
-                self.INPUT_POINT2,
-                self.tr('Ending Point')
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT_EXTRA_IMAGES,
+                self.tr('Further Input Images (val4, val5, ...)'),
+                QgsProcessing.TypeRaster,
+                optional=True
             )
         )
 
+    def add_surface_parameters(self):
+        """
+        Adds the parameters describing how traversability and cost derive from the input rasters.
+        """
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.INPUT_TRAVERSABILITY_ENUM,
@@ -176,115 +238,342 @@ class PathfinderAlgorithm(QgsProcessingAlgorithm):
         )
 
         self.addParameter(
-            QgsProcessingParameterFeatureSink(
-                self.OUTPUT,
-                self.tr('Output layer')
+            QgsProcessingParameterEnum(
+                self.INPUT_DEM_ENUM,
+                self.tr("Elevation Layer (Direction-Dependent Costs)"),
+                (
+                    "Primary",
+                    "Secondary",
+                    "Tertiary",
+                    "None"
+                ),
+                defaultValue=3
             )
         )
 
-    def get_expression_vars(self, pos: (int, int)) -> t.Dict[str, t.Any]:
-        vars_dict = {}
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INPUT_SLOPE_EXPRESSION,
+                self.tr('Custom Step Cost Expression (slope, dz, cost)'),
+                optional=True
+            )
+        )
 
-        x = pos[0]
-        y = pos[1]
-        vars_dict["x"] = x
-        vars_dict["y"] = y
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_MIN_CLEARANCE,
+                self.tr('Minimum Clearance from Untraversable Pixels (map units)'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0,
+                minValue=0
+            )
+        )
 
-        for i, arr in enumerate(self.inp_arrs):
-            if arr is not None:
-                s = str(i + 1)
-                vars_dict["val" + s] = arr[y][x]
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_PROXIMITY_COST,
+                self.tr('Extra Cost next to Untraversable Pixels'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0
+            )
+        )
 
-        return vars_dict
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_PROXIMITY_DISTANCE,
+                self.tr('Distance over which the Extra Cost Fades (map units)'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0,
+                minValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT_REGION,
+                self.tr('Search Region (polygons, or lines with a buffer)'),
+                [QgsProcessing.TypeVectorPolygon, QgsProcessing.TypeVectorLine],
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_REGION_BUFFER,
+                self.tr('Search Region Buffer (map units)'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0,
+                minValue=0
+            )
+        )
+
+    def write_footprint(self, footprint: "np.ndarray") -> t.Dict[str, str]:
+        """
+        Writes the search footprint raster, if one was requested, on the grid of the input images.
+
+        :returns: The entry for the footprint in the algorithm's results
+        """
+        if self.footprint_path is None:
+            return {}
+        from .raster_io import write_raster
+
+        write_raster(self.footprint_path, footprint, self.geotransform, self.crs.toWkt(), nodata=float("nan"))
+        return {self.OUTPUT_FOOTPRINT: self.footprint_path}
+
+    @staticmethod
+    def open_query_cache() -> "QueryCache":
+        """
+        Opens the store of finished queries' results, kept in the QGIS profile directory.
+        """
+        from .query_cache import QueryCache, QUERY_CACHE_FILENAME
+
+        return QueryCache(os.path.join(QgsApplication.qgisSettingsDirPath(), QUERY_CACHE_FILENAME))
+
+    @staticmethod
+    def open_surface_cache() -> "SurfaceCache":
+        """
+        Opens the store of evaluated cost and traversability surfaces, kept in the QGIS profile directory.
+        """
+        from .surface_cache import SurfaceCache, SURFACE_CACHE_DIRNAME
+
+        return SurfaceCache(os.path.join(QgsApplication.qgisSettingsDirPath(), SURFACE_CACHE_DIRNAME))
 
     def parse_inputs(self, parameters, context):
-        inp_layers = []
+        self.parse_grid_inputs(parameters, context)
+        self.parse_endpoint_inputs(parameters, context)
+        self.load_surfaces(parameters, context)
+
+    def parse_surface_inputs(self, parameters, context):
+        self.parse_grid_inputs(parameters, context)
+        self.load_surfaces(parameters, context)
+
+    def parse_grid_inputs(self, parameters, context) -> QgsRasterLayer:
+        """
+        Finds the input raster layers and the grid's georeferencing without reading any raster values.
+
+        :returns: The first input raster layer, which defines the grid
+        """
+        from .pathfinder_core import extent_to_geotransform
+
+        self.inp_layers = []
         basis_layer = None
         for i, code in enumerate(self.INPUT_IMAGES):
-            param = self.parameterAsRasterLayer(parameters, code, context)
-            inp_layers.append(param)
-            if basis_layer is None:
+            param = self.parameter_as_raster_layer(parameters, code, context)
+            self.inp_layers.append(param)
+            if basis_layer is None and param is not None:
                 basis_layer = i
         if basis_layer is None:
             raise ValueError(self.tr("At least one raster input is required"))
+        self.basis_layer = self.inp_layers[basis_layer]
+
+        for layer in self.parameterAsLayerList(parameters, self.INPUT_EXTRA_IMAGES, context):
+            self.inp_layers.append(layer)
+        for i, layer in enumerate(self.inp_layers):
+            if layer is not None and (layer.width(), layer.height()) != \
+                    (self.basis_layer.width(), self.basis_layer.height()):
+                raise ValueError(self.tr("Input image {} does not have the same size as the first input image").format(
+                    i + 1))
+
+        self.crs = self.basis_layer.crs()
+        self.bounding_rect = self.basis_layer.extent()
+        self.grid_width = self.basis_layer.width()
+        self.grid_height = self.basis_layer.height()
+        self.geotransform = extent_to_geotransform(
+            self.bounding_rect.xMinimum(), self.bounding_rect.yMinimum(),
+            self.bounding_rect.xMaximum(), self.bounding_rect.yMaximum(),
+            self.grid_width, self.grid_height
+        )
+        return self.basis_layer
 
-        self.inp_arrs = []
-        for layer in inp_layers:
-            if layer is not None:
-                img_ds = gdal.Open(layer.dataProvider().dataSourceUri())
-                self.inp_arrs.append(img_ds.GetRasterBand(1).ReadAsArray())
-            else:
-                self.inp_arrs.append(None)
-
+    def parameter_as_raster_layer(self, parameters, name, context) -> t.Optional[QgsRasterLayer]:
+        """
+        Like parameterAsRasterLayer, but also accepts the path of a folder of raster tiles or of a tile index, which
+        is opened as a virtual mosaic of its tiles, as raster_io.mosaic_uri describes.
+        """
+        layer = self.parameterAsRasterLayer(parameters, name, context)
+        value = parameters.get(name)
+        if layer is not None or not isinstance(value, str) or not value:
+            return layer
+
+        from .raster_io import mosaic_uri
+
+        uri = mosaic_uri(value)
+        if uri == value:
+            return None
+        layer = QgsRasterLayer(uri, os.path.basename(value.rstrip("/\\")), "gdal")
+        if not layer.isValid():
+            raise ValueError(self.tr("Could not open the tiles of {}").format(value))
+        return layer
+
+    def parse_endpoint_inputs(self, parameters, context):
+        """
+        Reads the starting and ending points and creates the outputs, once parse_grid_inputs has run.
+        """
         self.start_point = self.parameterAsPoint(parameters, self.INPUT_POINT1, context)
         self.end_point = self.parameterAsPoint(parameters, self.INPUT_POINT2, context)
 
-        traversability_enum = self.parameterAsEnum(parameters, self.INPUT_TRAVERSABILITY_ENUM, context)
-        traversability_layer = self.inp_arrs[traversability_enum] \
-            if traversability_enum < len(self.INPUT_IMAGES) else None
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, QgsFields(),
+                                             geometryType=QgsWkbTypes.Type.LineString,
+                                             crs=self.crs)
+        self.output_sink = sink
+        self.output_id = dest_id
+        self.footprint_path = self.parameterAsOutputLayer(parameters, self.OUTPUT_FOOTPRINT, context) or None
 
+        if not self.bounding_rect.contains(self.start_point):
+            raise ValueError(self.tr("Starting Point must be somewhere within the first raster image"))
+        if not self.bounding_rect.contains(self.end_point):
+            raise ValueError(self.tr("Ending Point must be somewhere within the first raster image"))
+
+    def surface_options(self, parameters, context) -> t.Dict[str, t.Any]:
+        """
+        Normalizes the traversability and cost parameters into SurfaceSpec's keyword arguments, dropping the ones
+        that SurfaceSpec would ignore, so that equivalent parameters give equal options.
+        """
+        traversability_enum = self.parameterAsEnum(parameters, self.INPUT_TRAVERSABILITY_ENUM, context)
+        traversability_layer = traversability_enum \
+            if traversability_enum < len(self.INPUT_IMAGES) and self.inp_layers[traversability_enum] is not None \
+            else None
+        traversability_min = None
+        traversability_max = None
+        traversability_expression = ""
         if traversability_layer is not None:
-            traversability_min = self.parameterAsString(parameters, self.INPUT_MIN_VAL, context)
             try:
-                traversability_min = float(traversability_min)
+                traversability_min = float(self.parameterAsString(parameters, self.INPUT_MIN_VAL, context))
             except ValueError:
-                traversability_min = None
-            transversability_max = self.parameterAsString(parameters, self.INPUT_MAX_VAL, context)
+                pass
             try:
-                traversability_max = float(transversability_max)
+                traversability_max = float(self.parameterAsString(parameters, self.INPUT_MAX_VAL, context))
             except ValueError:
-                traversability_max = None
-
-            if traversability_min is None and traversability_max is None:
-                self.is_traversable = lambda pos: True
-            elif traversability_max is not None:
-                self.is_traversable = lambda pos: traversability_layer[pos[1]][pos[0]] <= traversability_max
-            elif traversability_min is not None:
-                self.is_traversable = lambda pos: traversability_layer[pos[1]][pos[0]] >= traversability_min
-            else:
-                self.is_traversable = lambda pos: \
-                    traversability_min <= traversability_layer[pos[1]][pos[0]] <= traversability_max
-
+                pass
         else:
-            traversability_expression_str = self.parameterAsString(
-                parameters, self.INPUT_TRAVERSABILITY_EXPRESSION, context)
-            if traversability_expression_str == "":
-                self.is_traversable = lambda pos: True
-            else:
-                traversability_expression = parse_formula(traversability_expression_str)
-                self.is_traversable = lambda pos: evaluate_formula(
-                    traversability_expression_str, self.get_expression_vars(pos), traversability_expression
-                )
+            traversability_expression = self.parameterAsString(
+                parameters, self.INPUT_TRAVERSABILITY_EXPRESSION, context).strip()
 
         cost_enum = self.parameterAsEnum(parameters, self.INPUT_COST_ENUM, context)
-        cost_layer = self.inp_arrs[cost_enum] if cost_enum < len(self.INPUT_IMAGES) else None
-
-        if cost_layer is not None:
-            self.get_cost = lambda pos: cost_layer[pos[1]][pos[0]]
+        cost_layer = cost_enum if cost_enum < len(self.INPUT_IMAGES) and self.inp_layers[cost_enum] is not None \
+            else None
+        cost_expression = "" if cost_layer is not None else \
+            self.parameterAsString(parameters, self.INPUT_COST_EXPRESSION, context).strip()
+
+        dem_enum = self.parameterAsEnum(parameters, self.INPUT_DEM_ENUM, context)
+        dem_layer = dem_enum if dem_enum < len(self.INPUT_IMAGES) and self.inp_layers[dem_enum] is not None \
+            else None
+        slope_expression = "" if dem_layer is None else \
+            self.parameterAsString(parameters, self.INPUT_SLOPE_EXPRESSION, context).strip()
+
+        min_clearance = self.parameterAsDouble(parameters, self.INPUT_MIN_CLEARANCE, context)
+        proximity_cost = self.parameterAsDouble(parameters, self.INPUT_PROXIMITY_COST, context)
+        proximity_distance = self.parameterAsDouble(parameters, self.INPUT_PROXIMITY_DISTANCE, context)
+        if proximity_cost == 0 or proximity_distance <= 0:
+            proximity_cost = proximity_distance = 0.0
+
+        if dem_layer is not None or min_clearance > 0 or proximity_cost:
+            from .pathfinder_core import geotransform_pixel_size
+            # Slopes are rise over run, and clearances distances, with the run of a step in map units
+            pixel_size = geotransform_pixel_size(self.geotransform)
         else:
-            cost_expression_str = self.parameterAsString(parameters, self.INPUT_COST_EXPRESSION, context)
-            if cost_expression_str == "":
-                self.get_cost = lambda pos: 1
-            else:
-                cost_expression = parse_formula(cost_expression_str)
-                self.get_cost = lambda pos: evaluate_formula(
-                    cost_expression_str, self.get_expression_vars(pos), cost_expression
-                )
-
-        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, QgsFields(),
-                                             geometryType=QgsWkbTypes.Type.LineString,
-                                             crs=inp_layers[basis_layer].crs())
-        self.output_sink = sink
-        self.output_id = dest_id
-
-        self.bounding_rect = inp_layers[basis_layer].extent()
-        self.grid_width = self.inp_arrs[basis_layer].shape[1]
-        self.grid_height = self.inp_arrs[basis_layer].shape[0]
-
-        if not self.bounding_rect.contains(self.start_point):
-            raise ValueError(self.tr("Starting Point must be somewhere within the first raster image"))
-        if not self.bounding_rect.contains(self.end_point):
-            raise ValueError(self.tr("Ending Point must be somewhere within the first raster image"))
+            pixel_size = (1.0, 1.0)
+
+        return {
+            "traversability_layer": traversability_layer,
+            "traversability_min": traversability_min,
+            "traversability_max": traversability_max,
+            "traversability_expression": traversability_expression,
+            "cost_layer": cost_layer,
+            "cost_expression": cost_expression,
+            "dem_layer": dem_layer,
+            "slope_expression": slope_expression,
+            "pixel_size": pixel_size,
+            "min_clearance": min_clearance,
+            "proximity_cost": proximity_cost,
+            "proximity_distance": proximity_distance
+        }
+
+    def region_options(self, parameters, context) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Reads the search region's geometries, as WKT in the grid's CRS, and its buffer distance, once
+        parse_grid_inputs has run. Returns None when no region is given.
+        """
+        source = self.parameterAsSource(parameters, self.INPUT_REGION, context)
+        if source is None:
+            return None
+        transform = QgsCoordinateTransform(source.sourceCrs(), self.crs, context.transformContext())
+        geometries = []
+        for feature in source.getFeatures():
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                continue
+            geometry.transform(transform)
+            geometries.append(geometry.asWkt())
+        return {
+            "geometries": geometries,
+            "buffer": self.parameterAsDouble(parameters, self.INPUT_REGION_BUFFER, context)
+        }
+
+    def load_surfaces(self, parameters, context, streaming: bool = False):
+        """
+        Reads the raster bands which the traversability and cost options refer to and builds self.spec, once
+        parse_grid_inputs has run. Bands come from read_raster_cached, so runs over the same files share one
+        read-only copy of their values, unless they are too large for memory or streaming is set, and are read block
+        by block instead.
+        Pixels which any of the bands marks as nodata, by its nodata value, mask or alpha band, are untraversable,
+        and so are pixels outside the search region, which is rasterized into the grid.
+        Unless disabled, the evaluated surfaces are stored in the surface cache, and later runs over unchanged
+        inputs with the same options map them instead of evaluating them again.
+        """
+        from .pathfinder_core import SurfaceSpec, referenced_bands
+        from .query_cache import input_fingerprint
+        from .raster_io import open_bands, open_valid_masks, rasterize_region
+
+        options = self.surface_options(parameters, context)
+        sources = {}
+        for i, band in sorted(referenced_bands(**options)):
+            layer = self.inp_layers[i] if i < len(self.inp_layers) else None
+            if layer is None:
+                raise ValueError(self.tr("Input image {} was not given").format(i + 1))
+            if band > layer.bandCount():
+                raise ValueError(self.tr("Input image {} has {} bands, it has no band {}").format(
+                    i + 1, layer.bandCount(), band))
+            sources[(i, band)] = (layer.dataProvider().dataSourceUri(), band)
+        bands = open_bands(sources, streaming=streaming)
+        self.inp_arrs = [bands.get((i, 1)) for i in range(len(self.inp_layers))]
+
+        surface_cache = None
+        band_fingerprints = None
+        if self.parameterAsBool(parameters, self.INPUT_USE_CACHE, context):
+            surface_cache = self.open_surface_cache()
+            band_fingerprints = {key: input_fingerprint(uri) for key, (uri, _) in sources.items()}
+
+        region = self.region_options(parameters, context)
+        if region is not None:
+            region = rasterize_region(region["geometries"], self.geotransform, (self.grid_height, self.grid_width),
+                                      region["buffer"])
+
+        self.spec = SurfaceSpec(bands=bands, grid_shape=(self.grid_height, self.grid_width),
+                                surface_cache=surface_cache, band_fingerprints=band_fingerprints,
+                                valid_masks=open_valid_masks(sources, streaming=streaming), region=region, **options)
+        self.is_traversable = self.spec.is_traversable
+        self.get_cost = self.spec.get_cost
+
+    def query_fingerprint(self, parameters, context, **options) -> t.Dict[str, t.Any]:
+        """
+        Gathers the normalized parameters which decide a query's result, once parse_grid_inputs has run: the
+        algorithm, the inputs with their modification time and size, the grid, the surface options and any
+        algorithm-specific options such as the endpoints and the engine.
+        """
+        from .query_cache import input_fingerprint
+
+        fingerprint = {
+            "algorithm": self.name(),
+            "inputs": [input_fingerprint(layer.dataProvider().dataSourceUri()) if layer is not None else None
+                       for layer in self.inp_layers],
+            "geotransform": list(self.geotransform),
+            "grid": [self.grid_width, self.grid_height],
+            "surface": self.surface_options(parameters, context),
+            "region": self.region_options(parameters, context)
+        }
+        fingerprint.update(options)
+        return fingerprint
 
     def displayName(self):
         """
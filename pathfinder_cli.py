@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Command-line interface to the pathfinder, for batch jobs and servers without QGIS. Run it as
+     python -m image_pathfinder.pathfinder_cli INPUT.tif [INPUT.tif ...] --start X Y --end X Y
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+
+__revision__ = '$Format:%H$'
+
+import argparse
+import json
+import sys
+import typing as t
+
+import numpy as np
+
+from .pathfinder_core import (ENGINE_AUTOMATIC, ENGINE_PYTHON, ENGINE_NUMBA, ENGINE_DELTA_STEPPING, SurfaceSpec,
+                              referenced_bands, find_path, find_eikonal_path, world_to_pixel, world_to_continuous_pixel,
+                              pixel_to_world, continuous_pixel_to_world, geotransform_pixel_size, Region)
+from .pathfinder_constants import DEFAULT_MEMORY_BUDGET_MB
+from .query_cache import input_fingerprint
+from .surface_cache import SurfaceCache, DEFAULT_SURFACE_CACHE_MB
+
+ENGINE_EIKONAL = "eikonal"
+ENGINE_CHOICES = {
+    "auto": ENGINE_AUTOMATIC,
+    "python": ENGINE_PYTHON,
+    "numba": ENGINE_NUMBA,
+    "delta-stepping": ENGINE_DELTA_STEPPING,
+    ENGINE_EIKONAL: ENGINE_EIKONAL
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pathfinder_cli",
+        description="Finds the cheapest path between two points over raster images. Layers are numbered from 1 in "
+                    "the order the inputs are given, and expressions refer to their first bands as val1, val2, ... "
+                    "and to band B of input N as valN_B. Only the bands an expression refers to are read"
+    )
+    parser.add_argument("inputs", nargs="+", metavar="INPUT",
+                        help="Input rasters, all on the same grid. A folder of raster tiles or a tile index is read "
+                             "as a mosaic of its tiles")
+    parser.add_argument("--start", nargs=2, type=float, required=True, metavar=("X", "Y"),
+                        help="Starting point, in the map coordinates of the first input")
+    parser.add_argument("--end", nargs=2, type=float, required=True, metavar=("X", "Y"),
+                        help="Ending point, in the map coordinates of the first input")
+    parser.add_argument("--traversability-layer", type=int, default=1, metavar="N",
+                        help="Layer whose values decide traversability, or 0 to use --traversability-expression "
+                             "(default: 1)")
+    parser.add_argument("--min", type=float, default=1, help="Minimum traversable value (default: 1)")
+    parser.add_argument("--max", type=float, help="Maximum traversable value")
+    parser.add_argument("--traversability-expression", default="",
+                        help="Custom traversability expression, used when --traversability-layer is 0")
+    parser.add_argument("--cost-layer", type=int, default=2, metavar="N",
+                        help="Layer holding the cost of entering each pixel, or 0 to use --cost-expression "
+                             "(default: 2)")
+    parser.add_argument("--cost-expression", default="",
+                        help="Custom cost expression, used when --cost-layer is 0")
+    parser.add_argument("--dem-layer", type=int, default=0, metavar="N",
+                        help="Layer of elevations which make steps direction-dependent: the cost of each step is "
+                             "scaled by Tobler's hiking function of its slope, or replaced by --slope-expression. "
+                             "0 for none (default: 0)")
+    parser.add_argument("--slope-expression", default="",
+                        help="Custom cost of a step with --dem-layer, from the variables slope, dz and cost")
+    parser.add_argument("--min-clearance", type=float, default=0, metavar="DISTANCE",
+                        help="Smallest distance from untraversable pixels that the path may come, in map units "
+                             "(default: 0)")
+    parser.add_argument("--proximity-cost", type=float, default=0, metavar="COST",
+                        help="Cost added to entering pixels next to untraversable ones, falling linearly to 0 at "
+                             "--proximity-distance (default: 0)")
+    parser.add_argument("--proximity-distance", type=float, default=0, metavar="DISTANCE",
+                        help="Distance from untraversable pixels within which --proximity-cost applies, in map units "
+                             "(default: 0)")
+    parser.add_argument("--region", metavar="VECTOR",
+                        help="Vector dataset of polygons, or lines with --region-buffer, outside which the path may "
+                             "not go. Only the region's bounding window is searched")
+    parser.add_argument("--region-buffer", type=float, default=0, metavar="DISTANCE",
+                        help="Distance to grow the --region geometries by, in map units (default: 0)")
+    parser.add_argument("--window-margin", type=int, metavar="PIXELS",
+                        help="Only read and search the bounding box of the start and end, grown by this many pixels "
+                             "on each side, growing it further only while a cheaper path might leave it. The path "
+                             "is still optimal. Not used by the eikonal engine")
+    parser.add_argument("--engine", choices=tuple(ENGINE_CHOICES), default="auto",
+                        help="Search engine (default: auto)")
+    parser.add_argument("--memory-budget", type=float, default=DEFAULT_MEMORY_BUDGET_MB, metavar="MB",
+                        help="Maximum memory for the search state, in MB (default: {})".format(
+                            DEFAULT_MEMORY_BUDGET_MB))
+    parser.add_argument("--surface-cache", metavar="DIRECTORY",
+                        help="Directory to store evaluated cost and traversability surfaces in, and to reuse them "
+                             "from in later runs over unchanged inputs. Several processes may share it")
+    parser.add_argument("--surface-cache-size", type=float, default=DEFAULT_SURFACE_CACHE_MB, metavar="MB",
+                        help="Size of the stored surfaces beyond which the least recently used are deleted, in MB "
+                             "(default: {})".format(DEFAULT_SURFACE_CACHE_MB))
+    parser.add_argument("--output", "-o", help="GeoJSON file to write the path to (default: standard output)")
+    return parser
+
+
+def layer_index(number: int, count: int) -> t.Optional[int]:
+    if number == 0:
+        return None
+    if not 1 <= number <= count:
+        raise ValueError("Layer {} does not exist, there are {} inputs".format(number, count))
+    return number - 1
+
+
+def read_inputs(uris: t.Sequence[str], bands: t.Optional[t.Iterable[t.Tuple[int, int]]] = None,
+                streaming: bool = False) \
+        -> t.Tuple[t.Dict[t.Tuple[int, int], np.ndarray], t.Dict[t.Tuple[int, int], np.ndarray], t.Tuple[int, int],
+                   t.Tuple[float, ...], str]:
+    """
+    Reads some bands of the input rasters, checking every input is the same size as the first. Only the size of the
+    inputs is read until a band is needed. Bands too large to hold in memory are read block by block when the
+    surfaces are evaluated, as described in raster_io.open_bands. Bands with nodata pixels also have their validity
+    masks opened, as described in raster_io.open_valid_masks.
+
+    :param bands: (input index, band number) pairs as listed by referenced_bands, or None for the first band of
+                  every input
+    :param streaming: Whether to always read the bands on demand, for searches which only read a window of them
+    :returns: The bands keyed like bands, the validity masks of those with nodata pixels, the grid's (height, width),
+              and the geotransform and projection of the first input
+    """
+    from .raster_io import raster_info, open_bands, open_valid_masks
+
+    infos = [raster_info(uri) for uri in uris]
+    width, height, _, geotransform, projection = infos[0]
+    for uri, info in zip(uris, infos):
+        if info[:2] != (width, height):
+            raise ValueError("Input {} does not have the same size as the first input".format(uri))
+
+    if bands is None:
+        bands = [(i, 1) for i in range(len(uris))]
+    sources = {}
+    for i, band in sorted(bands):
+        if i >= len(uris):
+            raise ValueError("Input {} was not given, there are {} inputs".format(i + 1, len(uris)))
+        if band > infos[i][2]:
+            raise ValueError("Input {} has {} bands, it has no band {}".format(i + 1, infos[i][2], band))
+        sources[(i, band)] = (uris[i], band)
+    return (open_bands(sources, cached=False, streaming=streaming),
+            open_valid_masks(sources, cached=False, streaming=streaming), (height, width), geotransform, projection)
+
+
+def read_region(uri: t.Optional[str], buffer: float, geotransform: t.Sequence[float], grid_shape: t.Tuple[int, int],
+                projection: str) -> t.Optional[Region]:
+    """
+    Rasterizes the geometries of a vector dataset, grown by buffer map units, into the grid of the inputs, or
+    returns None when no dataset is given.
+    """
+    if not uri:
+        return None
+    from .raster_io import read_region_geometries, rasterize_region
+
+    return rasterize_region(read_region_geometries(uri, projection), geotransform, grid_shape, buffer)
+
+
+def surface_options(num_inputs: int, traversability_layer: int = 1, traversability_min: t.Optional[float] = 1,
+                    traversability_max: t.Optional[float] = None, traversability_expression: str = "",
+                    cost_layer: int = 2, cost_expression: str = "", dem_layer: int = 0,
+                    slope_expression: str = "", min_clearance: float = 0, proximity_cost: float = 0,
+                    proximity_distance: float = 0) -> t.Dict[str, t.Any]:
+    """
+    Converts layer numbers counted from 1, with 0 meaning the expression, into SurfaceSpec's keyword arguments. A
+    cost layer beyond the last input falls back to the cost expression, so the default cost layer 2 works with a
+    single input. A dem layer of 0 means costs do not depend on the direction.
+    """
+    return {
+        "traversability_layer": layer_index(traversability_layer, num_inputs),
+        "traversability_min": traversability_min,
+        "traversability_max": traversability_max,
+        "traversability_expression": traversability_expression,
+        "cost_layer": layer_index(cost_layer, num_inputs) if num_inputs >= cost_layer else None,
+        "cost_expression": cost_expression,
+        "dem_layer": layer_index(dem_layer, num_inputs),
+        "slope_expression": slope_expression,
+        "min_clearance": min_clearance,
+        "proximity_cost": proximity_cost,
+        "proximity_distance": proximity_distance
+    }
+
+
+def run(args: argparse.Namespace) -> t.Dict[str, t.Any]:
+    """
+    Runs the search described by parsed command-line arguments.
+
+    :returns: The path as a GeoJSON feature collection
+    """
+    options = surface_options(len(args.inputs), args.traversability_layer, args.min, args.max,
+                              args.traversability_expression, args.cost_layer, args.cost_expression, args.dem_layer,
+                              args.slope_expression, args.min_clearance, args.proximity_cost,
+                              args.proximity_distance)
+    engine = ENGINE_CHOICES[args.engine]
+    windowed = args.window_margin is not None and engine != ENGINE_EIKONAL
+    bands, valid_masks, (height, width), geotransform, projection = read_inputs(args.inputs,
+                                                                               referenced_bands(**options), windowed)
+    surface_cache = None
+    band_fingerprints = None
+    if args.surface_cache:
+        surface_cache = SurfaceCache(args.surface_cache, args.surface_cache_size * 2 ** 20)
+        band_fingerprints = {(i, band): input_fingerprint(args.inputs[i]) for i, band in bands}
+    spec = SurfaceSpec(bands=bands, grid_shape=(height, width), surface_cache=surface_cache,
+                       band_fingerprints=band_fingerprints, pixel_size=geotransform_pixel_size(geotransform),
+                       valid_masks=valid_masks, region=read_region(args.region, args.region_buffer, geotransform,
+                                                                   (height, width), projection), **options)
+
+    def on_message(message: str):
+        print(message, file=sys.stderr)
+
+    if engine == ENGINE_EIKONAL:
+        result = find_eikonal_path(spec, world_to_continuous_pixel(*args.start, geotransform),
+                                   world_to_continuous_pixel(*args.end, geotransform), on_message=on_message)
+        coordinates = [continuous_pixel_to_world(p, geotransform) for p in result.pixels]
+    else:
+        result = find_path(spec, world_to_pixel(*args.start, geotransform, width, height),
+                           world_to_pixel(*args.end, geotransform, width, height), engine,
+                           args.memory_budget * 2 ** 20, on_message=on_message, window_margin=args.window_margin)
+        coordinates = [pixel_to_world(p, geotransform) for p in result.pixels]
+
+    return {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [list(c) for c in coordinates]},
+            "properties": {"cost": result.cost, "engine": result.engine, "expansions": result.expansions}
+        }]
+    }
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        from .raster_io import limit_block_cache
+
+        # This process reads nothing but the inputs, so GDAL's caches only need to hold their tiles
+        limit_block_cache()
+        collection = run(args)
+    except (ValueError, RuntimeError) as e:
+        print("Error: {}".format(e), file=sys.stderr)
+        return 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(collection, f)
+    else:
+        json.dump(collection, sys.stdout)
+        sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
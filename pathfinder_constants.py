@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Options shared by the algorithms and the engines. This module must stay free of heavy imports: the Processing
+# provider imports it while QGIS starts, and the engines are only loaded when an algorithm first runs
+
+ENGINE_AUTOMATIC = 0
+ENGINE_PYTHON = 1
+ENGINE_NUMBA = 2
+ENGINE_DELTA_STEPPING = 3
+ENGINE_NAMES = (
+    "Automatic",
+    "A* (Python)",
+    "A* (Numba)",
+    "Delta-stepping Dijkstra (NumPy)"
+)
+
+DEFAULT_MEMORY_BUDGET_MB = 2048
@@ -0,0 +1,1581 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ The pathfinding engine, independent of QGIS. Everything here works on NumPy arrays, pixel coordinates and GDAL-style
+ geotransforms, so it can run in batch workers and benchmarks without a QGIS installation.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import math
+import os
+import re
+import threading
+import typing as t
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from .formulas import parse_formula, evaluate_formula, formula_variables, compile_pixel_formula
+from .connectivity import get_component_labels, components_of, mask_fingerprint
+from .clearance import obstacle_distance, proximity_penalty
+from .instrumentation import PhaseTimer, COUNTER_NAMES, search_counters
+from .query_cache import query_key
+from .pathfinder_constants import ENGINE_AUTOMATIC, ENGINE_PYTHON, ENGINE_NUMBA, ENGINE_DELTA_STEPPING, ENGINE_NAMES
+
+DIRECTION_MAPPING = {
+    (0, 1): 1,  # 0 is reserved for None
+    (1, 0): 2,
+    (0, -1): 3,
+    (-1, 0): 4
+}
+DIRECTION_MAPPING_INV = {v: k for k, v in DIRECTION_MAPPING.items()}
+NEIGHBORS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+# NEIGHBORS as arrays, for the vectorized and compiled engines
+NEIGHBOR_DX = np.array([n[0] for n in NEIGHBORS], np.int64)
+NEIGHBOR_DY = np.array([n[1] for n in NEIGHBORS], np.int64)
+
+# Formula variables holding input bands: val<input> for the first band, val<input>_<band> for any band
+BAND_VARIABLE = re.compile(r"val(\d+)(?:_(\d+))?")
+
+# Status codes returned by the step method of every search engine
+FOUND = 0
+EXHAUSTED = 1
+PAUSED = 2
+
+# Approximate sizes of the Python engine's state: the dense came_from and cost_so_far arrays per pixel, a
+# (priority, (x, y)) heap entry, and a SparseGrid entry
+PYTHON_STATE_BYTES_PER_PIXEL = 2 + 8
+PYTHON_FRONTIER_ENTRY_BYTES = 200
+PYTHON_SPARSE_ENTRY_BYTES = 250
+# After compacting the frontier, the search only continues if it is back under this fraction of the budget.
+# Otherwise it would compact again after a handful of pushes
+COMPACTION_TARGET = 0.9
+
+MAX_EIKONAL_SWEEPS = 1000
+# Factor by which a search window grows when the path might leave it
+WINDOW_GROWTH = 2
+
+# Largest lookup table an expression over integer bands is evaluated into, in entries: one 16-bit band, or two 8-bit
+# bands. Larger tables would take longer to fill than evaluating the expression over the grid
+MAX_LOOKUP_TABLE_ENTRIES = 2 ** 16
+# Tobler's hiking function: walking speed is proportional to exp(-TOBLER_STEEPNESS * |slope + TOBLER_SLOPE_OFFSET|)
+TOBLER_STEEPNESS = 3.5
+TOBLER_SLOPE_OFFSET = 0.05
+# Pixels per block when evaluating the surfaces. Each block's temporaries stay a few megabytes, and large grids have
+# enough blocks to keep every core busy
+BLOCK_PIXELS = 2 ** 18
+
+Geotransform = t.Tuple[float, float, float, float, float, float]
+
+if t.TYPE_CHECKING:
+    from .surface_cache import SurfaceCache
+
+
+class SearchCanceled(RuntimeError):
+    pass
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    def __init__(self, budget: float, used: int, expansions: int):
+        super().__init__("Memory budget of {} exceeded: {} in use after {} nodes expanded".format(
+            format_megabytes(budget), format_megabytes(used), expansions))
+        self.budget = budget
+        self.used = used
+        self.expansions = expansions
+
+
+def translated_error(error: Exception, translate: t.Callable[[str], str]) -> Exception:
+    """
+    Returns a ValueError or RuntimeError, as error is, with error's message passed through translate. Subclasses
+    such as MemoryBudgetExceeded take other constructor arguments, so they are not recreated.
+    """
+    error_type = ValueError if isinstance(error, ValueError) else RuntimeError
+    return error_type(translate(str(error)))
+
+
+def format_megabytes(num_bytes: float) -> str:
+    return "{:.1f} MB".format(num_bytes / 2 ** 20)
+
+
+def a_star_heuristic(pos1: (int, int), pos2: (int, int)) -> int:
+    return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
+
+
+def get_neighbors(pos: (int, int), max_x, max_y):
+    return [
+        p for p in (((pos[0] + n[0], pos[1] + n[1]), n) for n in NEIGHBORS) if
+        0 <= p[0][0] < max_x and 0 <= p[0][1] < max_y
+    ]
+
+
+def world_to_continuous_pixel(x: float, y: float, geotransform: Geotransform) -> (float, float):
+    """
+    Converts map coordinates to continuous pixel coordinates, where the pixel (col, row) covers
+    [col, col + 1) x [row, row + 1).
+    """
+    x0, dx, rx, y0, ry, dy = geotransform
+    det = dx * dy - rx * ry
+    u = x - x0
+    v = y - y0
+    return (u * dy - v * rx) / det, (v * dx - u * ry) / det
+
+
+def continuous_pixel_to_world(pix: (float, float), geotransform: Geotransform) -> (float, float):
+    x0, dx, rx, y0, ry, dy = geotransform
+    return x0 + pix[0] * dx + pix[1] * rx, y0 + pix[0] * ry + pix[1] * dy
+
+
+def world_to_pixel(x: float, y: float, geotransform: Geotransform, width: int, height: int) -> (int, int):
+    """
+    Converts map coordinates to the pixel containing them. Points on the far edges of the raster are assigned to the
+    last row or column.
+    """
+    col, row = world_to_continuous_pixel(x, y, geotransform)
+    return min(max(math.floor(col), 0), width - 1), min(max(math.floor(row), 0), height - 1)
+
+
+def pixel_to_world(pix: (int, int), geotransform: Geotransform) -> (float, float):
+    """
+    Returns the map coordinates of the center of a pixel.
+    """
+    return continuous_pixel_to_world((pix[0] + 0.5, pix[1] + 0.5), geotransform)
+
+
+def extent_to_geotransform(x_min: float, y_min: float, x_max: float, y_max: float, width: int,
+                           height: int) -> Geotransform:
+    return x_min, (x_max - x_min) / width, 0.0, y_max, 0.0, -(y_max - y_min) / height
+
+
+def geotransform_pixel_size(geotransform: Geotransform) -> t.Tuple[float, float]:
+    """
+    Returns the width and height of a pixel in map units, for a north-up geotransform.
+    """
+    return abs(geotransform[1]), abs(geotransform[5])
+
+
+class PriorityQueue:
+    def __init__(self):
+        self.elements: t.List[t.Tuple[float, (int, int)]] = []
+
+    def empty(self) -> bool:
+        return not self.elements
+
+    def put(self, item: (int, int), priority: float):
+        heapq.heappush(self.elements, (priority, item))
+
+    def get(self) -> (int, int):
+        return heapq.heappop(self.elements)[1]
+
+    def pop(self) -> t.Tuple[float, t.Tuple[int, int]]:
+        return heapq.heappop(self.elements)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def compact(self, is_current: t.Callable[[float, t.Tuple[int, int]], bool]):
+        """
+        Drops the entries for which is_current(priority, item) is False, such as stale entries left behind when an
+        item was pushed again with a lower priority.
+        """
+        self.elements = [e for e in self.elements if is_current(*e)]
+        heapq.heapify(self.elements)
+
+
+class SparseGrid(dict):
+    """
+    Per-pixel search state indexed like a 2D array, as grid[y, x], but only storing the pixels that have been set.
+    Used in place of full arrays when those would not fit in the memory budget.
+    """
+
+    def __init__(self, default):
+        super().__init__()
+        self.default = default
+
+    def __missing__(self, key):
+        return self.default
+
+
+def band_variable_name(input_index: int, band: int) -> str:
+    """
+    Names the formula variable holding a band of an input, counting inputs from 0 and bands from 1.
+    """
+    return "val{}".format(input_index + 1) if band == 1 else "val{}_{}".format(input_index + 1, band)
+
+
+def parse_band_variable(name: str) -> t.Optional[t.Tuple[int, int]]:
+    """
+    Inverts band_variable_name, also accepting val1_1 for val1.
+
+    :returns: The input index, counted from 0, and band number, or None if name does not refer to a band
+    """
+    match = BAND_VARIABLE.fullmatch(name)
+    if match is None or int(match.group(1)) < 1:
+        return None
+    return int(match.group(1)) - 1, int(match.group(2) or 1)
+
+
+def referenced_bands(traversability_layer: t.Optional[int] = None, traversability_expression: str = "",
+                     cost_layer: t.Optional[int] = None, cost_expression: str = "",
+                     dem_layer: t.Optional[int] = None, slope_expression: str = "",
+                     valid_bands: t.Optional[t.Sequence[t.Sequence[int]]] = None,
+                     **_) -> t.Set[t.Tuple[int, int]]:
+    """
+    Lists the bands, as (input index, band number) pairs, that a SurfaceSpec with these options reads. Takes the
+    same keyword arguments as SurfaceSpec, so that only these bands need to be loaded from disk.
+    """
+    bands = set()
+    for layer, expression in ((traversability_layer, traversability_expression), (cost_layer, cost_expression)):
+        if layer is not None:
+            bands.add((layer, 1))
+        elif expression:
+            bands.update(filter(None, map(parse_band_variable, formula_variables(parse_formula(expression)))))
+    if dem_layer is not None:
+        bands.add((dem_layer, 1))
+        if slope_expression:
+            bands.update(filter(None, map(parse_band_variable, formula_variables(parse_formula(slope_expression)))))
+    bands.update((i, band) for i, band in valid_bands or ())
+    return bands
+
+
+def tobler_factor(slope: np.ndarray) -> np.ndarray:
+    """
+    The time to walk a step with the given slope, rise over run in the direction of travel, relative to the fastest
+    slope, according to Tobler's hiking function. It is 1 on a 5% downhill and grows exponentially with steeper
+    slopes either way, so it never makes a step cheaper than on the fastest slope.
+    """
+    with np.errstate(over="ignore"):
+        return np.exp(TOBLER_STEEPNESS * np.abs(slope + TOBLER_SLOPE_OFFSET))
+
+
+def lookup_table_domain(arr: np.ndarray) -> t.Optional[np.ndarray]:
+    """
+    Lists every value an 8 or 16-bit integer array can hold, ordered by its unsigned bit pattern, so that viewing
+    arr as unsigned integers of the same size gives each pixel's position in the list.
+
+    :returns: The values, or None if arr has any other type
+    """
+    if arr.dtype.kind not in "ui" or arr.dtype.itemsize > 2:
+        return None
+    unsigned = np.dtype("u{}".format(arr.dtype.itemsize))
+    return np.arange(2 ** (8 * arr.dtype.itemsize), dtype=unsigned).view(arr.dtype)
+
+
+def lookup_table_index(blocks: t.Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Combines blocks of the bands of a lookup table, in the order of its axes, into each pixel's entry in the flat
+    table.
+    """
+    if len(blocks) == 1:
+        return blocks[0].view("u{}".format(blocks[0].dtype.itemsize))
+    index = np.zeros(blocks[0].shape, np.intp)
+    for block in blocks:
+        index *= 2 ** (8 * block.dtype.itemsize)
+        index += block.view("u{}".format(block.dtype.itemsize))
+    return index
+
+
+class Region:
+    """
+    The pixels a search is restricted to, such as a rasterized corridor or permit area. mask covers the window of
+    the grid whose top left pixel is (x_offset, y_offset), holding True inside the region; every pixel outside the
+    window is outside the region too.
+    """
+
+    def __init__(self, mask: np.ndarray, x_offset: int = 0, y_offset: int = 0):
+        self.mask = np.asarray(mask, bool)
+        self.x_offset = int(x_offset)
+        self.y_offset = int(y_offset)
+
+    def shifted(self, dx: int, dy: int) -> "Region":
+        return Region(self.mask, self.x_offset + dx, self.y_offset + dy)
+
+    def overlap(self, grid_height: int, grid_width: int) -> t.Optional[t.Tuple[slice, slice]]:
+        """
+        Returns the rows and columns of a grid that the mask's window covers, or None if it covers none.
+        """
+        rows = slice(max(self.y_offset, 0), min(self.y_offset + self.mask.shape[0], grid_height))
+        columns = slice(max(self.x_offset, 0), min(self.x_offset + self.mask.shape[1], grid_width))
+        if rows.start >= rows.stop or columns.start >= columns.stop:
+            return None
+        return rows, columns
+
+    def window_mask(self, rows: slice, columns: slice) -> np.ndarray:
+        return self.mask[rows.start - self.y_offset:rows.stop - self.y_offset,
+                         columns.start - self.x_offset:columns.stop - self.x_offset]
+
+    def bounds(self, grid_height: int, grid_width: int) -> t.Optional[t.Tuple[slice, slice]]:
+        """
+        Returns the rows and columns of the smallest window of a grid holding every pixel of the region, or None if
+        the region does not cover any pixel of the grid.
+        """
+        overlap = self.overlap(grid_height, grid_width)
+        if overlap is None:
+            return None
+        rows, columns = overlap
+        inside = self.window_mask(rows, columns)
+        inside_rows = np.flatnonzero(inside.any(axis=1))
+        inside_columns = np.flatnonzero(inside.any(axis=0))
+        if inside_rows.size == 0:
+            return None
+        return (slice(rows.start + int(inside_rows[0]), rows.start + int(inside_rows[-1]) + 1),
+                slice(columns.start + int(inside_columns[0]), columns.start + int(inside_columns[-1]) + 1))
+
+    def restrict(self, mask: np.ndarray):
+        """
+        Marks every pixel of a traversability mask over the whole grid that is outside the region as untraversable.
+        """
+        overlap = self.overlap(*mask.shape)
+        if overlap is None:
+            mask[...] = False
+            return
+        rows, columns = overlap
+        inside = mask[rows, columns] & self.window_mask(rows, columns)
+        mask[...] = False
+        mask[rows, columns] = inside
+
+    def fingerprint(self) -> t.List[t.Any]:
+        return [self.x_offset, self.y_offset, list(self.mask.shape), mask_fingerprint(self.mask)]
+
+
+class BandWindow:
+    """
+    A window of a band which is read on demand, like raster_io.RasterBand, indexed by the rows and columns of the
+    window. Only the window's columns are requested from the band.
+    """
+
+    def __init__(self, band, rows: slice, columns: slice):
+        self.band = band
+        self.rows = rows
+        self.columns = columns
+        self.shape = (rows.stop - rows.start, columns.stop - columns.start)
+        self.dtype = band.dtype
+        self.block_rows = getattr(band, "block_rows", 1)
+
+    @property
+    def nbytes(self) -> int:
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows, columns = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(self.shape[0])
+            rows = slice(self.rows.start + start, self.rows.start + max(stop, start), step)
+        else:
+            rows = self.rows.start + (rows + self.shape[0] if rows < 0 else rows)
+        return self.band[rows, self.columns][..., columns]
+
+
+def band_window(band, rows: slice, columns: slice):
+    """
+    Returns a window of a band: a view of an array in memory, or a BandWindow of a band read on demand.
+    """
+    if isinstance(band, np.ndarray):
+        return band[rows, columns]
+    return BandWindow(band, rows, columns)
+
+
+class SurfaceSpec:
+    """
+    Describes how the traversability and cost of every pixel derive from the input arrays: either directly from one
+    of the arrays (with an optional min/max range for traversability), from a formula over the arrays and the pixel
+    coordinates, or a constant when neither is given.
+
+    Formulas refer to the arrays as val1, val2, ... by their position in inp_arrs, which may contain None for missing
+    inputs. Further bands of multi-band inputs are passed in bands, keyed by input index and band number from 1, and
+    are named val1_2, val1_3, ...; val1_1 is another name for val1. Only the bands named by referenced_bands need to
+    be given, along with grid_shape when none are. Both lazy per-pixel evaluation (is_traversable, get_cost) and
+    vectorized evaluation over the whole grid (build_mask, build_cost) are available. The vectorized evaluation walks
+    the grid in blocks of rows on a thread pool, so bands may also be read on demand from disk, like
+    raster_io.RasterBand, by anything whose rows can be sliced into arrays. A spec is safe to share between threads:
+    shared_mask and shared_cost evaluate the surfaces once and hand every search the same read-only arrays.
+
+    Given a dem_layer of elevations, the cost is direction-dependent: build_cost evaluates one array per direction
+    in NEIGHBORS, holding the cost of stepping into each pixel in that direction. It is the cost of the pixel
+    entered, from the options above, scaled by tobler_factor of the step's slope. pixel_size gives the run of a step
+    along x and y in the elevations' units. A slope_expression replaces this with any formula of the variables
+    slope (rise over run in the direction of travel), dz (the rise) and cost (the cost of the pixel entered), along
+    with the bands and coordinates of the pixel entered.
+
+    Pixels closer than min_clearance to an untraversable pixel are untraversable as well, and when proximity_cost
+    and proximity_distance are given, entering a pixel within proximity_distance of an untraversable one costs up to
+    proximity_cost more, by proximity_penalty. Both measure distances between pixel centres, in the units of
+    pixel_size, from a distance transform of the traversability computed once before the surfaces are evaluated,
+    so per-pixel lookups of either surface read the evaluated arrays.
+
+    valid_masks gives, for the bands which have nodata pixels, arrays of which pixels hold data, keyed like bands and
+    sliceable like them, such as raster_io.RasterValidMask. Pixels where any of them is False are untraversable, so
+    the empty borders of a raster are pruned in the same pass that evaluates the traversability.
+
+    Given a region, every pixel outside it is untraversable. find_path and find_eikonal_path then search only the
+    region's bounding window, through window, which creates a spec over part of the grid. The pixels of a window's
+    spec are numbered from its corner, while its expressions see the coordinates of the full grid, which start at
+    origin.
+
+    Given a surface_cache and the input_fingerprint of every band as band_fingerprints, shared_mask and shared_cost
+    first look for the surfaces of an earlier spec with the same inputs and options, and store the surfaces they
+    evaluate for later specs, in this or any other process.
+    """
+
+    def __init__(self, inp_arrs: t.Sequence[t.Optional[np.ndarray]] = (),
+                 traversability_layer: t.Optional[int] = None,
+                 traversability_min: t.Optional[float] = None,
+                 traversability_max: t.Optional[float] = None,
+                 traversability_expression: str = "",
+                 cost_layer: t.Optional[int] = None,
+                 cost_expression: str = "",
+                 bands: t.Optional[t.Dict[t.Tuple[int, int], np.ndarray]] = None,
+                 grid_shape: t.Optional[t.Tuple[int, int]] = None,
+                 surface_cache: t.Optional["SurfaceCache"] = None,
+                 band_fingerprints: t.Optional[t.Dict[t.Tuple[int, int], t.Sequence[t.Any]]] = None,
+                 dem_layer: t.Optional[int] = None,
+                 slope_expression: str = "",
+                 pixel_size: t.Tuple[float, float] = (1.0, 1.0),
+                 min_clearance: float = 0.0,
+                 proximity_cost: float = 0.0,
+                 proximity_distance: float = 0.0,
+                 valid_masks: t.Optional[t.Dict[t.Tuple[int, int], np.ndarray]] = None,
+                 region: t.Optional[Region] = None,
+                 origin: t.Tuple[int, int] = (0, 0)):
+        self.inp_arrs = list(inp_arrs)
+        self.bands = {(i, 1): arr for i, arr in enumerate(self.inp_arrs) if arr is not None}
+        self.bands.update(bands or {})
+        if grid_shape is None:
+            if not self.bands:
+                raise ValueError("At least one input array is required")
+            grid_shape = next(iter(self.bands.values())).shape[:2]
+        self.grid_height, self.grid_width = grid_shape
+        # Formula variable names and the arrays they refer to
+        self.band_variables = [(band_variable_name(*key), arr) for key, arr in self.bands.items()]
+        self.band_variables += [(band_variable_name(i, 1) + "_1", arr) for (i, band), arr in self.bands.items()
+                                if band == 1]
+
+        self.traversability_layer = self.get_layer(traversability_layer)
+        self.traversability_min = traversability_min
+        self.traversability_max = traversability_max
+        self.traversability_expression_str = traversability_expression if self.traversability_layer is None else ""
+        self.traversability_expression = parse_formula(self.traversability_expression_str) \
+            if self.traversability_expression_str else None
+
+        self.cost_layer = self.get_layer(cost_layer)
+        self.cost_expression_str = cost_expression if self.cost_layer is None else ""
+        self.cost_expression = parse_formula(self.cost_expression_str) if self.cost_expression_str else None
+
+        self.dem_layer = self.get_layer(dem_layer)
+        self.slope_expression_str = slope_expression if self.dem_layer is not None else ""
+        self.slope_expression = parse_formula(self.slope_expression_str) if self.slope_expression_str else None
+        self.pixel_size = (float(pixel_size[0]), float(pixel_size[1]))
+        self.valid_masks = dict(valid_masks or {})
+        self.region = region
+        self.origin = (int(origin[0]), int(origin[1]))
+
+        self.min_clearance = max(float(min_clearance), 0.0)
+        has_proximity = proximity_cost != 0 and proximity_distance > 0
+        self.proximity_cost = float(proximity_cost) if has_proximity else 0.0
+        self.proximity_distance = float(proximity_distance) if has_proximity else 0.0
+
+        # The options each surface is evaluated from, in referenced_bands' keywords, which key its stored copies
+        traversability_options = {
+            "traversability_layer": traversability_layer,
+            "traversability_min": traversability_min if traversability_layer is not None else None,
+            "traversability_max": traversability_max if traversability_layer is not None else None,
+            "traversability_expression": self.traversability_expression_str,
+            "valid_bands": [list(key) for key in sorted(self.valid_masks)] or None
+        }
+        self.surface_options = {
+            "mask": dict(traversability_options, min_clearance=self.min_clearance or None,
+                         pixel_size=list(self.pixel_size) if self.min_clearance else None,
+                         region=region.fingerprint() if region is not None else None),
+            "cost": {"cost_layer": cost_layer, "cost_expression": self.cost_expression_str,
+                     "dem_layer": dem_layer, "slope_expression": self.slope_expression_str,
+                     "pixel_size": list(self.pixel_size) if self.dem_layer is not None or has_proximity else None,
+                     "proximity_cost": self.proximity_cost or None,
+                     "proximity_distance": self.proximity_distance or None}
+        }
+        if has_proximity:
+            # The penalty depends on the traversability, so its bands and options key the stored costs too
+            self.surface_options["cost"].update(traversability_options)
+        self.surface_cache = surface_cache
+        self.band_fingerprints = band_fingerprints
+        # The keyword arguments describing the surfaces, which windows of the spec share
+        self.options = {
+            "traversability_layer": traversability_layer, "traversability_min": traversability_min,
+            "traversability_max": traversability_max, "traversability_expression": traversability_expression,
+            "cost_layer": cost_layer, "cost_expression": cost_expression, "dem_layer": dem_layer,
+            "slope_expression": slope_expression, "pixel_size": self.pixel_size, "min_clearance": self.min_clearance,
+            "proximity_cost": self.proximity_cost, "proximity_distance": self.proximity_distance
+        }
+        # A spec over a margin around a window, and the window's rows and columns in it, which clearances of the
+        # window are measured in
+        self.clearance_source: t.Optional[t.Tuple["SurfaceSpec", slice, slice]] = None
+
+        self.is_traversable = self._make_is_traversable()
+        self.get_cost = self._make_get_cost()
+        # Direction-dependent costs are looked up per step in the evaluated arrays, since each needs two elevations
+        self.get_edge_cost = None if self.dem_layer is None else \
+            lambda pos, direction: self.shared_cost()[direction, pos[1], pos[0]]
+
+        self._surfaces_lock = threading.Lock()
+        self._mask: t.Optional[np.ndarray] = None
+        self._cost: t.Optional[np.ndarray] = None
+        # Guards _distance separately, since evaluating either surface under _surfaces_lock may need it
+        self._distance_lock = threading.Lock()
+        self._distance: t.Optional[np.ndarray] = None
+
+    def get_layer(self, index: t.Optional[int]) -> t.Optional[np.ndarray]:
+        if index is None:
+            return None
+        if (index, 1) not in self.bands:
+            raise ValueError("Input {} was not given".format(index + 1))
+        return self.bands[(index, 1)]
+
+    @classmethod
+    def from_surfaces(cls, cost: np.ndarray, mask: np.ndarray) -> "SurfaceSpec":
+        """
+        Creates a spec over an already computed cost array and boolean traversability mask.
+        """
+        return cls([np.asarray(cost, np.float64), np.asarray(mask, np.uint8)],
+                   traversability_layer=1, traversability_min=1, cost_layer=0)
+
+    @property
+    def in_memory(self) -> bool:
+        return all(isinstance(arr, np.ndarray) for arr in self.bands.values())
+
+    @property
+    def directional(self) -> bool:
+        return self.dem_layer is not None
+
+    @property
+    def cost_shape(self) -> t.Tuple[int, ...]:
+        """
+        The shape of build_cost's result: (grid_height, grid_width), or one such array per direction in NEIGHBORS.
+        """
+        if self.directional:
+            return len(NEIGHBORS), self.grid_height, self.grid_width
+        return self.grid_height, self.grid_width
+
+    def _make_is_traversable(self) -> t.Callable[[t.Tuple[int, int]], bool]:
+        if not self.in_memory or self.min_clearance or self.valid_masks or self.region is not None or \
+                self.origin != (0, 0):
+            # Bands read on demand would be read once per pixel, and the clearance of a pixel depends on the whole
+            # grid, so pixels are looked up in the evaluated surfaces. Nodata pixels and the region are applied in
+            # the same pass, and so are the coordinates of a window
+            return lambda pos: bool(self.shared_mask()[pos[1], pos[0]])
+
+        traversability_layer = self.traversability_layer
+        traversability_min = self.traversability_min
+        traversability_max = self.traversability_max
+
+        if traversability_layer is not None:
+            if traversability_min is None and traversability_max is None:
+                return lambda pos: True
+            elif traversability_min is not None and traversability_max is not None:
+                return lambda pos: traversability_min <= traversability_layer[pos[1]][pos[0]] <= traversability_max
+            elif traversability_max is not None:
+                return lambda pos: traversability_layer[pos[1]][pos[0]] <= traversability_max
+            else:
+                return lambda pos: traversability_layer[pos[1]][pos[0]] >= traversability_min
+
+        if self.traversability_expression is None:
+            return lambda pos: True
+        evaluate = compile_pixel_formula(self.traversability_expression_str, self.traversability_expression,
+                                         dict(self.band_variables))
+        return lambda pos: evaluate(pos[0], pos[1])
+
+    def _make_get_cost(self) -> t.Callable[[t.Tuple[int, int]], float]:
+        if (not self.in_memory or self.proximity_cost or self.origin != (0, 0)) and self.dem_layer is None:
+            return lambda pos: self.shared_cost()[pos[1], pos[0]]
+
+        cost_layer = self.cost_layer
+        if cost_layer is not None:
+            return lambda pos: cost_layer[pos[1]][pos[0]]
+
+        if self.cost_expression is None:
+            return lambda pos: 1
+        evaluate = compile_pixel_formula(self.cost_expression_str, self.cost_expression, dict(self.band_variables))
+        return lambda pos: evaluate(pos[0], pos[1])
+
+    def get_expression_vars(self, pos: (int, int)) -> t.Dict[str, t.Any]:
+        vars_dict = {}
+
+        x = pos[0]
+        y = pos[1]
+        vars_dict["x"] = x
+        vars_dict["y"] = y
+
+        for name, arr in self.band_variables:
+            vars_dict[name] = arr[y][x]
+
+        return vars_dict
+
+    def get_expression_arrays(self, rows: slice = slice(None)) -> t.Dict[str, t.Any]:
+        """
+        Like get_expression_vars, but with every variable holding the values for the whole grid, or for a block of
+        its rows. The coordinate variables are broadcastable row and column vectors rather than full arrays.
+        """
+        vars_dict = {
+            "x": np.arange(self.grid_width, dtype=np.float64)[np.newaxis, :] + self.origin[0],
+            "y": np.arange(self.grid_height, dtype=np.float64)[rows, np.newaxis] + self.origin[1]
+        }
+
+        # val1 and val1_1 are the same band, which is only read once
+        blocks = {}
+        for name, arr in self.band_variables:
+            if id(arr) not in blocks:
+                blocks[id(arr)] = arr[rows]
+            vars_dict[name] = blocks[id(arr)]
+
+        return vars_dict
+
+    def lookup_table(self, expression_str: str,
+                     expression) -> t.Optional[t.Tuple[np.ndarray, t.List[np.ndarray]]]:
+        """
+        Evaluates a formula over nothing but 8 or 16-bit integer bands once for every combination of values the
+        bands can hold. Classified rasters then need a single gather, table[index], instead of one full-grid
+        temporary per operation.
+
+        :returns: The flat float64 table and the bands that lookup_table_index combines into each pixel's entry in
+            it, or None if the formula uses the coordinates or other types of band, or the table would be too large
+        """
+        names = formula_variables(expression)
+        band_arrays = dict(self.band_variables)
+        # Formulas using x or y, or undefined variables, which evaluate_formula reports, are evaluated directly
+        if not names or not names <= band_arrays.keys():
+            return None
+
+        # val1 and val1_1 are the same band, so they share one axis of the table
+        arrays = []
+        for name in sorted(names):
+            if not any(band_arrays[name] is arr for arr in arrays):
+                arrays.append(band_arrays[name])
+        domains = [lookup_table_domain(arr) for arr in arrays]
+        if any(domain is None for domain in domains):
+            return None
+        table_shape = tuple(domain.size for domain in domains)
+        if int(np.prod(table_shape)) > min(MAX_LOOKUP_TABLE_ENTRIES, self.grid_width * self.grid_height):
+            return None
+
+        vars_dict = {}
+        for axis, (arr, domain) in enumerate(zip(arrays, domains)):
+            values = domain.reshape([-1 if i == axis else 1 for i in range(len(arrays))])
+            vars_dict.update((name, values) for name in names if band_arrays[name] is arr)
+        # Values which no pixel holds may divide by zero, which evaluating over the grid would not have warned about
+        with np.errstate(all="ignore"):
+            table = evaluate_formula(expression_str, vars_dict, expression)
+        table = np.broadcast_to(np.asarray(table, np.float64), table_shape).ravel()
+        return table, arrays
+
+    def block_slices(self) -> t.List[slice]:
+        """
+        Splits the grid into blocks of whole rows, of around BLOCK_PIXELS pixels. Bands read from disk are read in
+        whole native blocks.
+        """
+        rows = max(1, BLOCK_PIXELS // self.grid_width)
+        native_rows = max([getattr(arr, "block_rows", 1)
+                           for arr in list(self.bands.values()) + list(self.valid_masks.values())], default=1)
+        rows = max(native_rows, rows // native_rows * native_rows)
+        return [slice(start, min(start + rows, self.grid_height)) for start in range(0, self.grid_height, rows)]
+
+    def evaluate_blocks(self, evaluate_block: t.Callable[[slice], None], workers: t.Optional[int] = None):
+        """
+        Calls evaluate_block with every block of rows, in parallel on workers threads (one per core by default).
+        NumPy and GDAL release the GIL while they work on whole blocks, so blocks are evaluated and read
+        concurrently, and only one block's temporaries per thread are held at a time.
+        """
+        blocks = self.block_slices()
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(blocks) == 1:
+            for rows in blocks:
+                evaluate_block(rows)
+            return
+        with ThreadPoolExecutor(min(workers, len(blocks))) as pool:
+            # Consuming the results raises the first error of any block
+            list(pool.map(evaluate_block, blocks))
+
+    def build_mask(self, out: t.Optional[np.ndarray] = None, workers: t.Optional[int] = None,
+                   obstacles_only: bool = False) -> np.ndarray:
+        """
+        Evaluates the traversability of every pixel, block by block, into out or a new array. out may be a memory
+        mapped file, for grids too large for memory. Then removes the pixels too close to untraversable ones and
+        those outside the region, unless obstacles_only, which leaves the pixels that clearances are measured from.
+
+        :returns: A boolean array of shape (grid_height, grid_width)
+        """
+        mask = np.empty((self.grid_height, self.grid_width), bool) if out is None else out
+        layer = self.traversability_layer
+        lookup = None
+        if layer is None and self.traversability_expression is not None:
+            lookup = self.lookup_table(self.traversability_expression_str, self.traversability_expression)
+        if lookup is not None:
+            table, arrays = lookup
+            lookup = table != 0, arrays
+
+        def evaluate_block(rows: slice):
+            if layer is not None:
+                block = layer[rows]
+                mask[rows] = True
+                if self.traversability_min is not None:
+                    mask[rows] &= block >= self.traversability_min
+                if self.traversability_max is not None:
+                    mask[rows] &= block <= self.traversability_max
+            elif lookup is not None:
+                np.take(lookup[0], lookup_table_index([arr[rows] for arr in lookup[1]]), out=mask[rows], mode="clip")
+            elif self.traversability_expression is not None:
+                result = evaluate_formula(self.traversability_expression_str, self.get_expression_arrays(rows),
+                                          self.traversability_expression)
+                mask[rows] = np.asarray(result) != 0
+            else:
+                mask[rows] = True
+            for valid in self.valid_masks.values():
+                mask[rows] &= valid[rows]
+
+        self.evaluate_blocks(evaluate_block, workers)
+        if not obstacles_only:
+            if self.min_clearance:
+                mask &= self.clearance(mask) >= self.min_clearance
+            if self.region is not None:
+                self.region.restrict(mask)
+        return mask
+
+    def clearance(self, unobstructed_mask: t.Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the obstacle_distance of every pixel from the traversability before min_clearance is applied, as far
+        as min_clearance and proximity_distance look. It is computed on the first call, from unobstructed_mask if
+        given or build_mask otherwise, and reused until both surfaces are evaluated. A window measures it over its
+        clearance_source instead, so that obstacles just outside the window count.
+        """
+        with self._distance_lock:
+            if self._distance is None:
+                reach = max(self.min_clearance, self.proximity_distance)
+                if self.clearance_source is not None:
+                    source, rows, columns = self.clearance_source
+                    self._distance = obstacle_distance(source.build_mask(obstacles_only=True), self.pixel_size,
+                                                       reach)[rows, columns]
+                else:
+                    if unobstructed_mask is None:
+                        unobstructed_mask = self.build_mask(obstacles_only=True)
+                    self._distance = obstacle_distance(unobstructed_mask, self.pixel_size, reach)
+            return self._distance
+
+    def window(self, rows: slice, columns: slice) -> "SurfaceSpec":
+        """
+        Creates a spec over the window of the grid given by slices of its rows and columns, which reads and
+        evaluates nothing outside the window, beyond the margin that clearances need. Its surfaces are not stored
+        in the surface cache, but surfaces this spec has already evaluated are shared with it as views.
+        """
+        rows = slice(*rows.indices(self.grid_height)[:2])
+        columns = slice(*columns.indices(self.grid_width)[:2])
+        spec = self._window_spec(rows, columns, region=None if self.region is None else
+                                 self.region.shifted(-columns.start, -rows.start))
+        with self._surfaces_lock:
+            if self._mask is not None:
+                spec._mask = self._mask[rows, columns]
+            if self._cost is not None:
+                spec._cost = self._cost[..., rows, columns]
+        if spec.min_clearance or spec.proximity_cost:
+            reach = max(spec.min_clearance, spec.proximity_distance)
+            margin_x = int(math.ceil(reach / self.pixel_size[0]))
+            margin_y = int(math.ceil(reach / self.pixel_size[1]))
+            outer_rows = slice(max(rows.start - margin_y, 0), min(rows.stop + margin_y, self.grid_height))
+            outer_columns = slice(max(columns.start - margin_x, 0), min(columns.stop + margin_x, self.grid_width))
+            source = self._window_spec(outer_rows, outer_columns, min_clearance=0.0, proximity_cost=0.0)
+            spec.clearance_source = (source,
+                                     slice(rows.start - outer_rows.start, rows.stop - outer_rows.start),
+                                     slice(columns.start - outer_columns.start, columns.stop - outer_columns.start))
+        return spec
+
+    def _window_spec(self, rows: slice, columns: slice, **options) -> "SurfaceSpec":
+        return SurfaceSpec(bands={key: band_window(band, rows, columns) for key, band in self.bands.items()},
+                           grid_shape=(rows.stop - rows.start, columns.stop - columns.start),
+                           valid_masks={key: band_window(mask, rows, columns)
+                                        for key, mask in self.valid_masks.items()},
+                           origin=(self.origin[0] + columns.start, self.origin[1] + rows.start),
+                           **dict(self.options, **options))
+
+    def build_cost(self, out: t.Optional[np.ndarray] = None, workers: t.Optional[int] = None) -> np.ndarray:
+        """
+        Evaluates the cost of every pixel, block by block, into out or a new array. out may be a memory mapped
+        file, for grids too large for memory.
+
+        :returns: A float64 array of shape cost_shape
+        """
+        cost = np.empty(self.cost_shape, np.float64) if out is None else out
+        lookup = None
+        if self.cost_layer is None and self.cost_expression is not None:
+            lookup = self.lookup_table(self.cost_expression_str, self.cost_expression)
+        distance = self.clearance() if self.proximity_cost else None
+
+        def evaluate_block(rows: slice):
+            base = np.empty((rows.stop - rows.start, self.grid_width), np.float64) if self.directional \
+                else cost[rows]
+            if self.cost_layer is not None:
+                base[...] = self.cost_layer[rows]
+            elif lookup is not None:
+                np.take(lookup[0], lookup_table_index([arr[rows] for arr in lookup[1]]), out=base, mode="clip")
+            elif self.cost_expression is not None:
+                base[...] = evaluate_formula(self.cost_expression_str, self.get_expression_arrays(rows),
+                                             self.cost_expression)
+            else:
+                base[...] = 1
+            if distance is not None:
+                base += proximity_penalty(distance[rows], self.proximity_cost, self.proximity_distance)
+            if self.directional:
+                self.direction_costs(rows, base, cost[:, rows])
+
+        self.evaluate_blocks(evaluate_block, workers)
+        return cost
+
+    def direction_costs(self, rows: slice, base: np.ndarray, out: np.ndarray):
+        """
+        Evaluates the cost of stepping into each pixel of a block of rows in each direction, from the elevation
+        change and base, the cost of the pixels entered. out[d] receives the cost of steps in direction NEIGHBORS[d],
+        which enter a pixel from its neighbor at -NEIGHBORS[d]. Steps from outside the grid, or to or from a pixel
+        without an elevation, cost inf.
+        """
+        # The block's elevations with a border of the neighboring rows, or NaN beyond the grid
+        elevation = np.full((rows.stop - rows.start + 2, self.grid_width + 2), np.nan)
+        start = max(rows.start - 1, 0)
+        stop = min(rows.stop + 1, self.grid_height)
+        elevation[start - rows.start + 1:stop - rows.start + 1, 1:-1] = self.dem_layer[start:stop]
+        height, width = elevation.shape
+        here = elevation[1:-1, 1:-1]
+
+        for direction, (dx, dy) in enumerate(NEIGHBORS):
+            dz = here - elevation[1 - dy:height - 1 - dy, 1 - dx:width - 1 - dx]
+            slope = dz / (self.pixel_size[0] if dx else self.pixel_size[1])
+            if self.slope_expression is None:
+                edge_cost = base * tobler_factor(slope)
+            else:
+                vars_dict = self.get_expression_arrays(rows)
+                vars_dict.update(slope=slope, dz=dz, cost=base)
+                edge_cost = evaluate_formula(self.slope_expression_str, vars_dict, self.slope_expression)
+            out[direction] = np.where(np.isnan(dz), np.inf, edge_cost)
+
+    def surface_key(self, kind: str) -> str:
+        """
+        Identifies the "mask" or "cost" surface by the fingerprints of the bands it reads, the grid and its options.
+        """
+        options = self.surface_options[kind]
+        return query_key({
+            "surface": kind,
+            "grid": [self.grid_height, self.grid_width],
+            "options": options,
+            "bands": [[i, band] + list(self.band_fingerprints[(i, band)])
+                      for i, band in sorted(referenced_bands(**options))]
+        })
+
+    def stored_surface(self, kind: str, dtype: type, build: t.Callable[..., np.ndarray]) -> np.ndarray:
+        """
+        Maps the stored kind surface, or evaluates it with build and stores it, when a surface cache was given.
+        Otherwise evaluates it in memory. The returned array is read-only.
+        """
+        if self.surface_cache is None or self.band_fingerprints is None:
+            surface = build()
+            surface.setflags(write=False)
+            return surface
+
+        key = self.surface_key(kind)
+        shape = self.cost_shape if kind == "cost" else (self.grid_height, self.grid_width)
+        surface = self.surface_cache.get(key, shape, dtype)
+        if surface is None:
+            surface = self.surface_cache.put(key, shape, dtype, lambda out: build(out=out))
+        return surface
+
+    def shared_mask(self) -> np.ndarray:
+        """
+        Returns the result of build_mask, evaluated, or mapped from the surface cache, on the first call and reused,
+        read-only, by every later call.
+        """
+        with self._surfaces_lock:
+            if self._mask is None:
+                self._mask = self.stored_surface("mask", bool, self.build_mask)
+                self.release_clearance()
+            return self._mask
+
+    def shared_cost(self) -> np.ndarray:
+        """
+        Returns the result of build_cost, evaluated, or mapped from the surface cache, on the first call and reused,
+        read-only, by every later call.
+        """
+        with self._surfaces_lock:
+            if self._cost is None:
+                self._cost = self.stored_surface("cost", np.float64, self.build_cost)
+                self.release_clearance()
+            return self._cost
+
+    def release_clearance(self):
+        # Called with _surfaces_lock held. The distances are only needed until both shared surfaces exist
+        if self._mask is not None and self._cost is not None:
+            with self._distance_lock:
+                self._distance = None
+
+
+class PythonSearch:
+    """
+    A* in pure Python, evaluating cost and traversability lazily for each pixel the search reaches. This is the
+    reference implementation the other engines are checked against.
+
+    The search state is kept in full arrays, or in SparseGrids holding only the reached pixels when sparse is set.
+    When get_edge_cost is given, a step costs get_edge_cost(next_pos, direction), with direction indexing NEIGHBORS,
+    instead of get_cost(next_pos).
+    """
+    USES_HEURISTIC = True
+    STATE_BYTES_PER_PIXEL = PYTHON_STATE_BYTES_PER_PIXEL
+    STEP_SIZE = 1000
+
+    def __init__(self, is_traversable: t.Callable[[t.Tuple[int, int]], bool],
+                 get_cost: t.Callable[[t.Tuple[int, int]], float], width: int, height: int,
+                 sources: t.Sequence[t.Tuple[int, int]], end: t.Optional[t.Tuple[int, int]] = None,
+                 sparse: bool = False,
+                 get_edge_cost: t.Optional[t.Callable[[t.Tuple[int, int], int], float]] = None):
+        self.is_traversable = is_traversable
+        self.get_cost = get_cost
+        self.get_edge_cost = get_edge_cost
+        self.width = width
+        self.height = height
+        self.end = end
+        self.sparse = sparse
+
+        if sparse:
+            self.came_from = SparseGrid(0)
+            self.cost_so_far = SparseGrid(np.inf)
+        else:
+            self.came_from = np.zeros((height, width), np.ushort)
+            self.cost_so_far = np.full((height, width), np.inf, np.float64)
+
+        self.frontier = PriorityQueue()
+        for source in sources:
+            self.came_from[source[1], source[0]] = 0
+            self.cost_so_far[source[1], source[0]] = 0
+            self.frontier.put(source, self.heuristic(source))
+        self.min_heuristic = min(self.heuristic(source) for source in sources)
+
+        self.inadmissible_cost_seen = False
+        self.expansions = 0
+        self.pushes = len(sources)
+        self.stale_pops = 0
+        self.cost_evaluations = 0
+        self.peak_frontier = len(self.frontier)
+
+    def heuristic(self, pos: (int, int)) -> int:
+        return 0 if self.end is None else a_star_heuristic(pos, self.end)
+
+    def memory_bytes(self) -> int:
+        state_bytes = PYTHON_SPARSE_ENTRY_BYTES * len(self.cost_so_far) if self.sparse \
+            else self.STATE_BYTES_PER_PIXEL * self.width * self.height
+        return state_bytes + PYTHON_FRONTIER_ENTRY_BYTES * len(self.frontier)
+
+    def is_current(self, priority: float, pos: (int, int)) -> bool:
+        return priority == self.cost_so_far[pos[1], pos[0]] + self.heuristic(pos)
+
+    def compact(self):
+        self.frontier.compact(self.is_current)
+
+    def restore(self, cost_so_far: np.ndarray, came_from: np.ndarray, open_pixels: t.Sequence[t.Tuple[int, int]]):
+        """
+        Replaces the search state with the accumulated costs and direction codes of an earlier search, and makes
+        open_pixels the frontier, so that the search resumes where the earlier one stopped.
+        """
+        if self.sparse:
+            self.cost_so_far = SparseGrid(np.inf)
+            self.came_from = SparseGrid(0)
+            for y, x in zip(*np.nonzero(np.isfinite(cost_so_far))):
+                self.cost_so_far[y, x] = float(cost_so_far[y, x])
+                self.came_from[y, x] = int(came_from[y, x])
+        else:
+            self.cost_so_far = np.array(cost_so_far, np.float64)
+            self.came_from = np.array(came_from, np.ushort)
+
+        self.frontier = PriorityQueue()
+        for pos in open_pixels:
+            self.frontier.put(pos, self.cost_so_far[pos[1], pos[0]] + self.heuristic(pos))
+        self.min_heuristic = min((self.heuristic(pos) for pos in open_pixels), default=0)
+        self.pushes += len(open_pixels)
+        self.peak_frontier = max(self.peak_frontier, len(self.frontier))
+
+    def closed_mask(self) -> np.ndarray:
+        """
+        Flags the pixels which have been reached and are no longer on the frontier.
+        """
+        if self.sparse:
+            closed = np.zeros((self.height, self.width), bool)
+            if self.cost_so_far:
+                ys, xs = zip(*self.cost_so_far.keys())
+                closed[list(ys), list(xs)] = True
+        else:
+            closed = np.isfinite(self.cost_so_far)
+        open_pixels = [pos for priority, pos in self.frontier.elements if self.is_current(priority, pos)]
+        if open_pixels:
+            xs, ys = zip(*open_pixels)
+            closed[list(ys), list(xs)] = False
+        return closed
+
+    def step(self, max_expansions: int) -> int:
+        """
+        Advances the search by up to max_expansions expansions.
+
+        :returns: FOUND, EXHAUSTED or PAUSED
+        """
+        frontier = self.frontier
+        cost_so_far = self.cost_so_far
+        came_from = self.came_from
+        get_edge_cost = self.get_edge_cost
+
+        for _ in range(max_expansions):
+            if frontier.empty():
+                return EXHAUSTED
+            priority, current = frontier.pop()
+
+            if current == self.end:
+                return FOUND
+            if priority != cost_so_far[current[1], current[0]] + self.heuristic(current):
+                # Left behind when the pixel was pushed again with a lower cost, and already expanded at that cost
+                self.stale_pops += 1
+                continue
+            self.expansions += 1
+
+            neighbors = [n for n in get_neighbors(current, self.width, self.height) if self.is_traversable(n[0])]
+            for next_pos, direction in neighbors:
+                if get_edge_cost is None:
+                    add_cost = self.get_cost(next_pos)
+                else:
+                    add_cost = get_edge_cost(next_pos, DIRECTION_MAPPING[direction] - 1)
+                self.cost_evaluations += 1
+                if add_cost < 1:
+                    self.inadmissible_cost_seen = True
+
+                new_cost = cost_so_far[current[1], current[0]] + add_cost
+                if new_cost < cost_so_far[next_pos[1], next_pos[0]]:
+                    cost_so_far[next_pos[1], next_pos[0]] = new_cost
+                    heuristic = self.heuristic(next_pos)
+                    self.min_heuristic = min(self.min_heuristic, heuristic)
+                    frontier.put(next_pos, new_cost + heuristic)
+                    came_from[next_pos[1], next_pos[0]] = DIRECTION_MAPPING[direction]
+                    self.pushes += 1
+            self.peak_frontier = max(self.peak_frontier, len(frontier))
+
+        return PAUSED
+
+
+def search_state(search) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the accumulated cost of every pixel of a search, inf where unreached, and its came_from direction codes,
+    as arrays even when the search only stores the state of the pixels it reached.
+    """
+    if not getattr(search, "sparse", False):
+        return np.asarray(search.cost_so_far), np.asarray(search.came_from)
+    cost_so_far = np.full((search.height, search.width), np.inf, np.float64)
+    came_from = np.zeros((search.height, search.width), np.ushort)
+    for (y, x), cost in search.cost_so_far.items():
+        cost_so_far[y, x] = cost
+        came_from[y, x] = search.came_from[y, x]
+    return cost_so_far, came_from
+
+
+def search_footprint(search) -> np.ndarray:
+    """
+    Returns the accumulated cost of every pixel the search has closed, and NaN elsewhere.
+    """
+    closed = search.closed_mask()
+    footprint = np.full(closed.shape, np.nan, np.float64)
+    footprint[closed] = search_state(search)[0][closed]
+    return footprint
+
+
+class PathResult:
+    """
+    The outcome of a search: the path's vertices in pixel coordinates (or continuous pixel coordinates for the
+    eikonal engine), ordered from start to end, and its accumulated cost. The counters and the seconds spent in each
+    phase of the run describe how the search went. cost_so_far and came_from cover the window of the grid searched,
+    whose top left pixel is origin.
+    """
+
+    def __init__(self, pixels: t.List[t.Tuple[float, float]], cost: float, engine: str, expansions: int,
+                 cost_so_far=None, came_from=None, counters: t.Dict[str, int] = None,
+                 timings: t.Dict[str, float] = None, footprint: t.Optional[np.ndarray] = None,
+                 origin: t.Tuple[int, int] = (0, 0)):
+        self.pixels = pixels
+        self.cost = cost
+        self.engine = engine
+        self.expansions = expansions
+        self.cost_so_far = cost_so_far
+        self.came_from = came_from
+        self.counters = counters if counters is not None else {"expansions": expansions}
+        self.timings = timings if timings is not None else {}
+        self.footprint = footprint
+        self.origin = origin
+
+    def moved(self, x_offset: int, y_offset: int, grid_height: int, grid_width: int) -> "PathResult":
+        """
+        Moves a result found over a window of a grid, whose top left pixel is (x_offset, y_offset), into the grid's
+        pixel coordinates. The footprint is padded with NaN to cover the whole grid.
+        """
+        footprint = None
+        if self.footprint is not None:
+            footprint = np.full((grid_height, grid_width), np.nan)
+            height, width = self.footprint.shape
+            footprint[y_offset:y_offset + height, x_offset:x_offset + width] = self.footprint
+        return PathResult([(p[0] + x_offset, p[1] + y_offset) for p in self.pixels], self.cost, self.engine,
+                          self.expansions, self.cost_so_far, self.came_from, self.counters, self.timings, footprint,
+                          (self.origin[0] + x_offset, self.origin[1] + y_offset))
+
+
+def resolve_engine(engine: int, on_message: t.Callable[[str], None] = None) -> int:
+    from . import numba_search
+
+    if engine == ENGINE_AUTOMATIC:
+        return ENGINE_NUMBA if numba_search.NUMBA_AVAILABLE else ENGINE_PYTHON
+    if engine == ENGINE_NUMBA and not numba_search.NUMBA_AVAILABLE:
+        if on_message is not None:
+            on_message("[WARNING] Numba is not installed, falling back to the Python engine")
+        return ENGINE_PYTHON
+    return engine
+
+
+def create_search(engine: int, spec: SurfaceSpec, mask: t.Optional[np.ndarray],
+                  sources: t.Sequence[t.Tuple[int, int]], end: t.Optional[t.Tuple[int, int]] = None,
+                  memory_budget: t.Optional[float] = None, on_message: t.Callable[[str], None] = None):
+    """
+    Creates the search object for a resolved engine. Engines whose state arrays would not fit in memory_budget bytes
+    fall back to the Python engine, which in turn switches to sparse state if its own arrays would not fit.
+    """
+    from . import numba_search
+    from . import delta_stepping
+
+    num_pixels = spec.grid_width * spec.grid_height
+    # Direction-dependent costs hold one cost array per direction instead of one
+    extra_bytes_per_pixel = 8 * (len(NEIGHBORS) - 1) if spec.directional else 0
+    search_class = PythonSearch
+    if engine == ENGINE_NUMBA:
+        search_class = numba_search.NumbaSearch
+    elif engine == ENGINE_DELTA_STEPPING:
+        search_class = delta_stepping.DeltaSteppingSearch
+
+    state_bytes = (search_class.STATE_BYTES_PER_PIXEL + extra_bytes_per_pixel) * num_pixels
+    if search_class is not PythonSearch and memory_budget is not None and state_bytes > memory_budget:
+        if on_message is not None:
+            on_message("[WARNING] The {} engine needs {} of state arrays, more than the memory budget. "
+                       "Falling back to the Python engine".format(ENGINE_NAMES[engine], format_megabytes(state_bytes)))
+        search_class = PythonSearch
+
+    if search_class is PythonSearch:
+        dense_state_bytes = PythonSearch.STATE_BYTES_PER_PIXEL * num_pixels
+        sparse = memory_budget is not None and dense_state_bytes > memory_budget
+        if sparse and on_message is not None:
+            on_message("Full state arrays would need {}, more than the memory budget. "
+                       "Only storing the state of reached pixels".format(format_megabytes(dense_state_bytes)))
+        return PythonSearch(spec.is_traversable, spec.get_cost, spec.grid_width, spec.grid_height, sources, end,
+                            sparse=sparse, get_edge_cost=spec.get_edge_cost)
+
+    cost = spec.shared_cost()
+    if mask is None:
+        mask = spec.shared_mask()
+    if search_class.USES_HEURISTIC and end is not None and np.any(cost[..., mask] < 1):
+        if on_message is not None:
+            on_message("[WARNING] Custom cost expression is less than 1, path may not be optimal!")
+    return search_class(cost, mask, sources, end)
+
+
+def run_search(search, memory_budget: t.Optional[float] = None,
+               is_canceled: t.Callable[[], bool] = None,
+               on_progress: t.Callable[[float], None] = None,
+               on_message: t.Callable[[str], None] = None) -> int:
+    """
+    Advances a search to completion in steps of its engine's STEP_SIZE, checking for cancellation, reporting
+    progress and enforcing the memory budget between steps.
+
+    :returns: FOUND or EXHAUSTED
+    """
+    starting_heuristic = search.min_heuristic
+    warned_inadmissible_heuristic = False
+
+    while True:
+        if is_canceled is not None and is_canceled():
+            raise SearchCanceled("Task Cancelled")
+
+        status = search.step(search.STEP_SIZE)
+
+        if memory_budget is not None and search.memory_bytes() > memory_budget:
+            search.compact()
+            if search.memory_bytes() > memory_budget * COMPACTION_TARGET:
+                raise MemoryBudgetExceeded(memory_budget, search.memory_bytes(), search.expansions)
+
+        if not warned_inadmissible_heuristic and getattr(search, "inadmissible_cost_seen", False):
+            warned_inadmissible_heuristic = True
+            if on_message is not None:
+                on_message("[WARNING] Custom cost expression is less than 1, path may not be optimal!")
+        if on_progress is not None and starting_heuristic > 0:
+            on_progress((1 - search.min_heuristic / starting_heuristic) * 100)
+
+        if status != PAUSED:
+            return status
+
+
+def reconstruct_path(came_from, start: (int, int), end: (int, int)) -> t.List[t.Tuple[int, int]]:
+    """
+    Follows the came_from direction codes back from end to start.
+
+    :returns: The pixels where the path changes direction, plus its two ends, ordered from start to end
+    """
+    current_point = end
+    last_point = None
+    path = []
+    while True:
+        delta_code = came_from[current_point[1], current_point[0]]
+        if delta_code == 0:
+            next_point = None
+        else:
+            delta = DIRECTION_MAPPING_INV[delta_code]
+            next_point = (current_point[0] - delta[0], current_point[1] - delta[1])
+        if last_point is None or next_point is None or \
+                next_point[0] - current_point[0] != current_point[0] - last_point[0] or \
+                next_point[1] - current_point[1] != current_point[1] - last_point[1]:
+            path.append(current_point)
+
+        if current_point == start:
+            break
+        last_point = current_point
+        current_point = next_point
+
+    path.reverse()
+    return path
+
+
+def check_connected(mask: np.ndarray, start: (int, int), end: (int, int),
+                    on_message: t.Callable[[str], None] = None, exits: t.Optional[np.ndarray] = None):
+    """
+    Rejects start and end points in different connected components of the traversability mask before any search
+    is run. The component labels are cached by mask fingerprint, so repeated runs over the same mask skip the
+    labeling.
+
+    :param exits: For a mask covering a window of the grid, flags the pixels whose components may continue outside
+                  it, as returned by window_exits. Endpoints whose components both reach one are not rejected
+    """
+    labels = get_component_labels(mask)
+    start_component, end_component = components_of(labels, start, end)
+    if start_component != end_component:
+        if exits is not None and {start_component, end_component} <= set(np.unique(labels[exits]).tolist()):
+            return
+        if on_message is not None:
+            on_message("Starting point is in component {}, ending point is in component {}".format(
+                start_component, end_component))
+        raise ValueError("No path found: the starting and ending points are not connected")
+
+
+def region_window(spec: SurfaceSpec, start: (int, int), end: (int, int)) -> t.Optional[t.Tuple[slice, slice]]:
+    """
+    Returns the rows and columns of the bounding window of the spec's region, checking that the start and end
+    pixels are inside it, or None if the spec has no region or it spans the whole grid.
+    """
+    if spec.region is None:
+        return None
+    bounds = spec.region.bounds(spec.grid_height, spec.grid_width)
+    if bounds is None:
+        raise ValueError("The search region does not cover any pixel of the grid")
+    rows, columns = bounds
+    for name, pos in (("Starting", start), ("Ending", end)):
+        if not (columns.start <= pos[0] < columns.stop and rows.start <= pos[1] < rows.stop):
+            raise ValueError("{} point must be inside the search region".format(name))
+    if (rows.stop - rows.start, columns.stop - columns.start) == (spec.grid_height, spec.grid_width):
+        return None
+    return rows, columns
+
+
+def check_endpoints(spec: SurfaceSpec, start: (int, int), end: (int, int)):
+    if not spec.is_traversable(start):
+        raise ValueError("Starting point must be traversable")
+    if not spec.is_traversable(end):
+        raise ValueError("Ending point must be traversable")
+
+
+def search_window(spec: SurfaceSpec, start: (int, int), end: (int, int), margin: int) -> t.Tuple[slice, slice]:
+    """
+    Returns the rows and columns of the bounding box of the start and end pixels, grown by margin pixels on each side
+    and clipped to the grid.
+    """
+    rows = slice(max(min(start[1], end[1]) - margin, 0), min(max(start[1], end[1]) + margin + 1, spec.grid_height))
+    columns = slice(max(min(start[0], end[0]) - margin, 0), min(max(start[0], end[0]) + margin + 1, spec.grid_width))
+    return rows, columns
+
+
+def grown_window(spec: SurfaceSpec, rows: slice, columns: slice) -> t.Tuple[slice, slice]:
+    """
+    Grows a window WINDOW_GROWTH times in each dimension, as evenly on either side as the edges of the grid allow.
+    """
+    def grow(extent: slice, size: int) -> slice:
+        length = extent.stop - extent.start
+        new_length = min(length * WINDOW_GROWTH, size)
+        start = min(max(extent.start - (new_length - length) // 2, 0), size - new_length)
+        return slice(start, start + new_length)
+
+    return grow(rows, spec.grid_height), grow(columns, spec.grid_width)
+
+
+def window_exits(spec: SurfaceSpec, rows: slice, columns: slice) -> np.ndarray:
+    """
+    Flags the pixels on the sides of a window that have more of the grid beyond them. Coordinates are relative to
+    the window.
+    """
+    exits = np.zeros((rows.stop - rows.start, columns.stop - columns.start), bool)
+    exits[:, 0] |= columns.start > 0
+    exits[:, -1] |= columns.stop < spec.grid_width
+    exits[0, :] |= rows.start > 0
+    exits[-1, :] |= rows.stop < spec.grid_height
+    return exits
+
+
+def exit_distance(spec: SurfaceSpec, rows: slice, columns: slice, end: (int, int)) -> np.ndarray:
+    """
+    Returns, for every pixel of a window, the fewest steps of a path from it to end, a pixel of the window, which
+    leaves the window on the way, or inf where the window covers the grid. Coordinates are relative to the window.
+    """
+    height, width = rows.stop - rows.start, columns.stop - columns.start
+    ys, xs = np.ogrid[:height, :width]
+    distance = np.full((height, width), np.inf)
+    if columns.start > 0:
+        np.minimum(distance, xs + end[0] + 2 + np.abs(ys - end[1]), out=distance)
+    if columns.stop < spec.grid_width:
+        np.minimum(distance, 2 * width - xs - end[0] + np.abs(ys - end[1]), out=distance)
+    if rows.start > 0:
+        np.minimum(distance, ys + end[1] + 2 + np.abs(xs - end[0]), out=distance)
+    if rows.stop < spec.grid_height:
+        np.minimum(distance, 2 * height - ys - end[1] + np.abs(xs - end[0]), out=distance)
+    return distance
+
+
+def find_windowed_path(spec: SurfaceSpec, start: (int, int), end: (int, int), engine: int, margin: int,
+                       memory_budget: t.Optional[float] = None,
+                       is_canceled: t.Callable[[], bool] = None,
+                       on_progress: t.Callable[[float], None] = None,
+                       on_message: t.Callable[[str], None] = None,
+                       keep_footprint: bool = False) -> PathResult:
+    """
+    Searches a window around the start and end, as described in find_path, growing it while a cheaper path might
+    leave it. Each larger window's search resumes from the accumulated costs of the last one: its frontier is the
+    last frontier, plus the reached pixels on the last window's edge, whose neighbors outside it were never relaxed.
+    The first window's components are checked once, which rejects endpoints that could not be joined even by a path
+    leaving it, and each warning is only passed on to on_message once across the windows.
+
+    Once the search of a window stops, every path leaving the window passes through a pixel of that frontier at its
+    accumulated cost, and then takes at least exit_distance more steps. With every step costing at least 1, as the
+    A* heuristic already assumes, the path found is optimal over the whole grid when no frontier pixel's cost plus
+    its exit distance is below the path's cost. Otherwise the window grows.
+    """
+    timer = PhaseTimer()
+    counters = dict.fromkeys(COUNTER_NAMES, 0)
+    rows, columns = search_window(spec, start, end, margin)
+    previous = None
+    warnings = set()
+
+    def on_window_message(message: str):
+        # The engines warn about each window they search, which would repeat the same warning as the window grows
+        if message.startswith("[WARNING]"):
+            if message in warnings:
+                return
+            warnings.add(message)
+        if on_message is not None:
+            on_message(message)
+
+    while True:
+        height, width = rows.stop - rows.start, columns.stop - columns.start
+        on_window_message("Searching a window of {} by {} pixels".format(width, height))
+        window_start = (start[0] - columns.start, start[1] - rows.start)
+        window_end = (end[0] - columns.start, end[1] - rows.start)
+
+        with timer.phase("precompute"):
+            window_spec = spec.window(rows, columns)
+            mask = window_spec.shared_mask()
+            if previous is None:
+                check_endpoints(window_spec, window_start, window_end)
+                check_connected(mask, window_start, window_end, on_window_message,
+                                window_exits(spec, rows, columns))
+            search = create_search(engine, window_spec, mask, [window_start], window_end, memory_budget,
+                                   on_window_message)
+            if previous is not None:
+                # The state of the last window is carried over into its place within this one
+                cost_so_far = np.full((height, width), np.inf)
+                came_from = np.zeros((height, width), np.ushort)
+                last_rows, last_columns, last_cost, last_came_from, last_frontier = previous
+                inner = (slice(last_rows.start - rows.start, last_rows.stop - rows.start),
+                         slice(last_columns.start - columns.start, last_columns.stop - columns.start))
+                cost_so_far[inner] = last_cost
+                came_from[inner] = last_came_from
+                ys, xs = np.nonzero(last_frontier)
+                search.restore(cost_so_far, came_from, list(zip((xs + inner[1].start).tolist(),
+                                                                (ys + inner[0].start).tolist())))
+            low_cost_warning = "[WARNING] Custom cost expression is less than 1, path may not be optimal!"
+            if low_cost_warning not in warnings and not search.USES_HEURISTIC and \
+                    np.any(window_spec.shared_cost()[..., mask] < 1):
+                on_window_message(low_cost_warning)
+
+        with timer.phase("search"):
+            run_search(search, memory_budget, is_canceled, on_progress, on_window_message)
+        for name, value in search_counters(search).items():
+            counters[name] = max(counters[name], value) if name == "peak_frontier" else counters[name] + value
+
+        cost_so_far, came_from = search_state(search)
+        path_cost = cost_so_far[window_end[1], window_end[0]]
+        edge = np.ones((height, width), bool)
+        edge[1:-1, 1:-1] = False
+        frontier = np.isfinite(cost_so_far) & (~search.closed_mask() | edge)
+        frontier[window_end[1], window_end[0]] = np.isfinite(path_cost)
+        exit_costs = cost_so_far[frontier] + exit_distance(spec, rows, columns, window_end)[frontier]
+        if not np.any(exit_costs < path_cost):
+            break
+        previous = (rows, columns, cost_so_far, came_from, frontier)
+        rows, columns = grown_window(spec, rows, columns)
+
+    if math.isinf(path_cost):
+        raise ValueError("No path found")
+
+    with timer.phase("reconstruct"):
+        pixels = reconstruct_path(came_from, window_start, window_end)
+
+    result = PathResult(pixels, float(path_cost), ENGINE_NAMES[engine], counters["expansions"], cost_so_far,
+                        came_from, counters, timer.timings, search_footprint(search) if keep_footprint else None)
+    return result.moved(columns.start, rows.start, spec.grid_height, spec.grid_width)
+
+
+def find_path(spec: SurfaceSpec, start: (int, int), end: (int, int), engine: int = ENGINE_AUTOMATIC,
+              memory_budget: t.Optional[float] = None,
+              is_canceled: t.Callable[[], bool] = None,
+              on_progress: t.Callable[[float], None] = None,
+              on_message: t.Callable[[str], None] = None,
+              keep_footprint: bool = False,
+              window_margin: t.Optional[int] = None) -> PathResult:
+    """
+    Finds the cheapest 4-connected path between two pixels.
+
+    :param memory_budget: The maximum number of bytes of search state, or None for no limit
+    :param is_canceled: Polled between search steps; the search raises SearchCanceled once it returns True
+    :param on_progress: Called with the progress as a percentage
+    :param on_message: Called with warnings and other information for the user
+    :param keep_footprint: Whether to return the accumulated cost of every pixel the search closed, as computed by
+                           search_footprint
+    :param window_margin: When given, only the bounding box of the start and end, grown by this many pixels on each
+                          side, is read and searched at first, as described in find_windowed_path. The window grows
+                          while the path might leave it, so the path is as cheap as one found over the whole grid
+    :returns: The path, with the search's counters and the time spent precomputing the surfaces, searching and
+              reconstructing the path
+    """
+    window = region_window(spec, start, end)
+    if window is not None:
+        # Only the region's bounding window is evaluated and searched, with state arrays of its size
+        rows, columns = window
+        result = find_path(spec.window(rows, columns), (start[0] - columns.start, start[1] - rows.start),
+                           (end[0] - columns.start, end[1] - rows.start), engine, memory_budget, is_canceled,
+                           on_progress, on_message, keep_footprint, window_margin)
+        return result.moved(columns.start, rows.start, spec.grid_height, spec.grid_width)
+
+    engine = resolve_engine(engine, on_message)
+    if window_margin is not None:
+        return find_windowed_path(spec, start, end, engine, window_margin, memory_budget, is_canceled, on_progress,
+                                  on_message, keep_footprint)
+
+    check_endpoints(spec, start, end)
+    timer = PhaseTimer()
+
+    with timer.phase("precompute"):
+        mask = spec.shared_mask()
+        check_connected(mask, start, end, on_message)
+        search = create_search(engine, spec, mask, [start], end, memory_budget, on_message)
+
+    with timer.phase("search"):
+        status = run_search(search, memory_budget, is_canceled, on_progress, on_message)
+    if status == EXHAUSTED:
+        raise ValueError("No path found")
+
+    with timer.phase("reconstruct"):
+        pixels = reconstruct_path(search.came_from, start, end)
+
+    return PathResult(pixels, float(search.cost_so_far[end[1], end[0]]), ENGINE_NAMES[engine], search.expansions,
+                      search.cost_so_far, search.came_from, search_counters(search), timer.timings,
+                      search_footprint(search) if keep_footprint else None)
+
+
+def cost_distance(spec: SurfaceSpec, sources: t.Sequence[t.Tuple[int, int]], engine: int = ENGINE_AUTOMATIC,
+                  memory_budget: t.Optional[float] = None,
+                  is_canceled: t.Callable[[], bool] = None,
+                  on_message: t.Callable[[str], None] = None) -> t.Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the accumulated cost from the nearest of the sources to every reachable pixel.
+
+    :returns: The cost-distance array (inf where unreachable) and the came_from direction codes
+    """
+    engine = resolve_engine(engine, on_message)
+    search = create_search(engine, spec, None, sources, None, memory_budget, on_message)
+    run_search(search, memory_budget, is_canceled, on_message=on_message)
+    return np.asarray(search.cost_so_far), np.asarray(search.came_from)
+
+
+def find_eikonal_path(spec: SurfaceSpec, start: (float, float), end: (float, float),
+                      is_canceled: t.Callable[[], bool] = None,
+                      on_message: t.Callable[[str], None] = None) -> PathResult:
+    """
+    Finds the cheapest continuous path between two points given in continuous pixel coordinates, by solving the
+    eikonal equation over the cost surface and tracing the result by gradient descent.
+    """
+    from .fast_marching import FastSweepingSolver, trace_path
+
+    if spec.directional:
+        raise ValueError("The eikonal solver does not support direction-dependent costs")
+    start_pos = (min(int(start[0]), spec.grid_width - 1), min(int(start[1]), spec.grid_height - 1))
+    end_pos = (min(int(end[0]), spec.grid_width - 1), min(int(end[1]), spec.grid_height - 1))
+    window = region_window(spec, start_pos, end_pos)
+    if window is not None:
+        rows, columns = window
+        result = find_eikonal_path(spec.window(rows, columns), (start[0] - columns.start, start[1] - rows.start),
+                                   (end[0] - columns.start, end[1] - rows.start), is_canceled, on_message)
+        return result.moved(columns.start, rows.start, spec.grid_height, spec.grid_width)
+    check_endpoints(spec, start_pos, end_pos)
+
+    mask = spec.shared_mask()
+    check_connected(mask, start_pos, end_pos, on_message)
+    cost = spec.shared_cost()
+    if np.any(cost[mask] <= 0):
+        raise ValueError("Costs must be positive for the eikonal solver")
+
+    solver = FastSweepingSolver(cost, mask, [start_pos])
+    while not solver.converged:
+        if is_canceled is not None and is_canceled():
+            raise SearchCanceled("Task Cancelled")
+        if solver.sweeps >= MAX_EIKONAL_SWEEPS:
+            raise RuntimeError("Eikonal solver did not converge")
+        max_change = solver.sweep()
+        if on_message is not None:
+            on_message("Sweep {}: largest change {}".format(solver.sweeps, max_change))
+
+    arrival_time = solver.arrival_time
+    if math.isinf(arrival_time[end_pos[1], end_pos[0]]):
+        raise ValueError("No path found")
+
+    pixels = trace_path(arrival_time, start, end)
+    pixels.reverse()
+    footprint = np.where(np.isfinite(arrival_time), arrival_time, np.nan)
+    return PathResult(pixels, float(arrival_time[end_pos[1], end_pos[0]]), "Eikonal (fast sweeping)", 0,
+                      arrival_time, footprint=footprint)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import typing as t
+
+# Size of the stored results, in MB, beyond which the least recently used are evicted
+DEFAULT_QUERY_CACHE_MB = 64
+QUERY_CACHE_FILENAME = "pathfinder_query_cache.sqlite"
+# Seconds to wait for another process or thread holding the database lock
+SQLITE_TIMEOUT = 10
+
+
+def input_fingerprint(uri: str) -> t.Tuple[str, t.Optional[int], t.Optional[int]]:
+    """
+    Identifies an input by its URI and, for files, their modification time and size, so that a file rewritten on
+    disk no longer matches. A directory, such as a folder of raster tiles, is identified by the latest modification
+    time and the total size of the directory and the files in it.
+    """
+    try:
+        stat = os.stat(uri)
+    except OSError:
+        return uri, None, None
+    if not os.path.isdir(uri):
+        return uri, stat.st_mtime_ns, stat.st_size
+
+    mtime, size = stat.st_mtime_ns, 0
+    with os.scandir(uri) as entries:
+        for entry in entries:
+            if entry.is_file():
+                entry_stat = entry.stat()
+                mtime = max(mtime, entry_stat.st_mtime_ns)
+                size += entry_stat.st_size
+    return uri, mtime, size
+
+
+def query_key(query: t.Dict[str, t.Any]) -> str:
+    """
+    Hashes a query's normalized parameters, which must be JSON serializable. Keys are sorted, so the order the
+    parameters were gathered in does not matter.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(query, sort_keys=True, separators=(",", ":")).encode())
+    return digest.hexdigest()
+
+
+class QueryCache:
+    """
+    Stores finished queries' results as JSON in an SQLite database, keyed by query_key. Once the stored results
+    exceed max_bytes, the least recently used are evicted. A connection is opened per call, so one cache can be
+    used from several threads and processes at once.
+    """
+
+    def __init__(self, path: str, max_bytes: float = DEFAULT_QUERY_CACHE_MB * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS results ("
+                                   "key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+                                   "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        finally:
+            connection.close()
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+
+    def get(self, key: str) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Returns the stored result for key, or None, marking it as recently used.
+        """
+        connection = self.connect()
+        try:
+            with connection:
+                row = connection.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        finally:
+            connection.close()
+        return json.loads(row[0])
+
+    def put(self, key: str, result: t.Dict[str, t.Any]):
+        """
+        Stores a result, then evicts the least recently used results until the rest fit in max_bytes. A result
+        larger than max_bytes on its own is not stored.
+        """
+        data = json.dumps(result, separators=(",", ":"))
+        if len(data) > self.max_bytes:
+            return
+
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                   (key, data, len(data), time.time()))
+                total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                if total <= self.max_bytes:
+                    return
+                evicted = []
+                for old_key, size in connection.execute("SELECT key, size FROM results WHERE key != ? "
+                                                        "ORDER BY last_used, rowid", (key,)):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((old_key,))
+                    total -= size
+                connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+        finally:
+            connection.close()
+
+    def total_bytes(self) -> int:
+        connection = self.connect()
+        try:
+            return connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        finally:
+            connection.close()
+
+    def __len__(self):
+        connection = self.connect()
+        try:
+            return connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        finally:
+            connection.close()
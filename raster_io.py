@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Raster reading and writing through GDAL, shared by the Processing algorithms and the command-line interface.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import threading
+import typing as t
+from collections import OrderedDict
+import numpy as np
+from osgeo import gdal, gdal_array, ogr, osr
+
+from .query_cache import input_fingerprint, query_key
+from .pathfinder_core import Region
+
+# Number of raster bands, and of their validity masks, kept in memory by read_raster_cached and read_valid_mask_cached
+RASTER_CACHE_SIZE = 4
+# Referenced bands larger than this in total are read block by block while the surfaces are evaluated, instead of
+# being held in memory
+STREAMING_THRESHOLD_BYTES = 512 * 2 ** 20
+
+# Files in a directory which are read as the tiles of a mosaic
+MOSAIC_TILE_EXTENSIONS = (".tif", ".tiff", ".vrt", ".img", ".hgt", ".dt0", ".dt1", ".dt2", ".asc", ".bil", ".jp2")
+# Vector formats read as tile indexes, as written by gdaltindex, and the field holding each tile's path
+TILE_INDEX_EXTENSIONS = (".shp", ".gpkg", ".geojson", ".json", ".fgb", ".sqlite")
+TILE_INDEX_FIELD = "location"
+# Upper bound on GDAL's block cache in the command line and route server processes, and the number of tiles GDAL
+# keeps open at once. Tiles are only opened when a read touches them, so a search only opens the tiles around its route
+MOSAIC_BLOCK_CACHE_BYTES = 256 * 2 ** 20
+MOSAIC_OPEN_TILES = 64
+
+_raster_cache: "OrderedDict[tuple, t.Any]" = OrderedDict()
+_raster_cache_lock = threading.Lock()
+_mosaics: t.Dict[tuple, str] = {}
+_mosaics_lock = threading.Lock()
+
+
+def mosaic_tiles(uri: str) -> t.Optional[t.List[str]]:
+    """
+    Lists the rasters in a directory, or the tiles a tile index refers to, or returns None when uri is neither.
+    """
+    if os.path.isdir(uri):
+        return sorted(os.path.join(uri, name) for name in os.listdir(uri)
+                      if name.lower().endswith(MOSAIC_TILE_EXTENSIONS))
+    if not uri.lower().endswith(TILE_INDEX_EXTENSIONS):
+        return None
+    index = ogr.Open(uri)
+    if index is None or index.GetLayerCount() == 0:
+        return None
+    layer = index.GetLayer(0)
+    if layer.GetLayerDefn().GetFieldIndex(TILE_INDEX_FIELD) < 0:
+        return None
+    tiles = []
+    for feature in layer:
+        location = feature.GetField(TILE_INDEX_FIELD)
+        if location:
+            # gdaltindex stores the paths it was given, which may be relative to the index
+            tiles.append(location if os.path.isabs(location) or location.startswith("/vsi")
+                         else os.path.join(os.path.dirname(uri), location))
+    return tiles
+
+
+def limit_block_cache():
+    """
+    Bounds GDAL's block cache to MOSAIC_BLOCK_CACHE_BYTES and its pool of open datasets to MOSAIC_OPEN_TILES,
+    unless they are already set lower, so that the memory held for a mosaic stays bounded however many of its tiles
+    are read. The limits apply to the whole process, so only the command line and the route server, which own
+    theirs, set them. Inside QGIS they would also shrink the cache of every other layer.
+    """
+    if gdal.GetCacheMax() > MOSAIC_BLOCK_CACHE_BYTES:
+        gdal.SetCacheMax(MOSAIC_BLOCK_CACHE_BYTES)
+    if gdal.GetConfigOption("GDAL_MAX_DATASET_POOL_SIZE") is None:
+        gdal.SetConfigOption("GDAL_MAX_DATASET_POOL_SIZE", str(MOSAIC_OPEN_TILES))
+
+
+def mosaic_uri(uri: str) -> str:
+    """
+    Returns the name GDAL opens an input by. A directory of raster tiles or a tile index is opened as a VRT mosaic
+    of its tiles, built in GDAL's in-memory file system once per version of the input and of each of its tiles, so
+    that a tile rewritten behind an unchanged tile index is picked up. A VRT only opens the tiles a read touches. Any
+    other input, including a VRT, is opened as it is.
+    """
+    tiles = mosaic_tiles(uri)
+    if tiles is None:
+        return uri
+    if not tiles:
+        raise ValueError("{} does not hold any raster tiles".format(uri))
+
+    key = (input_fingerprint(uri),) + tuple(input_fingerprint(tile) for tile in tiles)
+    with _mosaics_lock:
+        if key not in _mosaics:
+            path = "/vsimem/pathfinder/mosaic_{}.vrt".format(query_key({"input": list(key)}))
+            mosaic = gdal.BuildVRT(path, tiles)
+            if mosaic is None:
+                raise ValueError("Could not build a mosaic of the tiles of {}".format(uri))
+            # Closing the dataset writes the VRT
+            mosaic = None
+            _mosaics[key] = path
+        return _mosaics[key]
+
+
+def open_raster(uri: str) -> "gdal.Dataset":
+    """
+    Opens a raster, or a mosaic of tiles as described in mosaic_uri.
+    """
+    dataset = gdal.Open(mosaic_uri(uri))
+    if dataset is None:
+        raise ValueError("Could not open raster {}".format(uri))
+    return dataset
+
+
+def read_raster(uri: str, band: int = 1) -> t.Tuple[np.ndarray, t.Tuple[float, ...], str]:
+    """
+    Reads one band of a raster.
+
+    :returns: The band's values, the dataset's GDAL geotransform and its projection as WKT
+    """
+    dataset = open_raster(uri)
+    return dataset.GetRasterBand(band).ReadAsArray(), dataset.GetGeoTransform(), dataset.GetProjection()
+
+
+def raster_info(uri: str) -> t.Tuple[int, int, int, t.Tuple[float, ...], str]:
+    """
+    Reads a raster's size and georeferencing without reading any of its values.
+
+    :returns: The width, height and band count, the GDAL geotransform and the projection as WKT
+    """
+    dataset = open_raster(uri)
+    return (dataset.RasterXSize, dataset.RasterYSize, dataset.RasterCount, dataset.GetGeoTransform(),
+            dataset.GetProjection())
+
+
+def raster_cache_key(uri: str, band: int = 1) -> tuple:
+    """
+    Identifies a raster band by its input_fingerprint, so that a file rewritten on disk is read again.
+    """
+    return input_fingerprint(uri) + (band,)
+
+
+def _read_cached(key: tuple, read: t.Callable[[], t.Any]) -> t.Any:
+    with _raster_cache_lock:
+        if key in _raster_cache:
+            _raster_cache.move_to_end(key)
+            return _raster_cache[key]
+
+    value = read()
+    with _raster_cache_lock:
+        _raster_cache[key] = value
+        while len(_raster_cache) > RASTER_CACHE_SIZE:
+            _raster_cache.popitem(last=False)
+    return value
+
+
+def read_raster_cached(uri: str, band: int = 1) -> t.Tuple[np.ndarray, t.Tuple[float, ...], str]:
+    """
+    Like read_raster, but keeps the most recently used bands in memory. The returned array is read-only because it
+    is shared with every other caller, including searches running in background tasks.
+    """
+    def read():
+        array, geotransform, projection = read_raster(uri, band)
+        array.setflags(write=False)
+        return array, geotransform, projection
+
+    return _read_cached(raster_cache_key(uri, band), read)
+
+
+def has_valid_mask(uri: str, band: int = 1) -> bool:
+    """
+    Whether GDAL marks any pixels of a band as holding no data, through the band's nodata value, a mask of the
+    dataset or an alpha band.
+    """
+    dataset = open_raster(uri)
+    return dataset.GetRasterBand(band).GetMaskFlags() != gdal.GMF_ALL_VALID
+
+
+def read_valid_mask(uri: str, band: int = 1) -> np.ndarray:
+    """
+    Reads which pixels of a band hold data, from the band's GDAL mask band.
+
+    :returns: A boolean array, False where the band has no data
+    """
+    return RasterValidMask(uri, band)[:]
+
+
+def read_valid_mask_cached(uri: str, band: int = 1) -> np.ndarray:
+    """
+    Like read_valid_mask, but keeps the most recently used masks in memory alongside the bands of
+    read_raster_cached. The returned array is read-only.
+    """
+    def read():
+        mask = read_valid_mask(uri, band)
+        mask.setflags(write=False)
+        return mask
+
+    return _read_cached(raster_cache_key(uri, band) + ("valid",), read)
+
+
+class RasterBand:
+    """
+    One band of a raster on disk, read on demand. Indexing with rows, or with rows and columns, reads only the
+    window it covers, so SurfaceSpec can evaluate a raster too large for memory block by block. Each thread reads
+    through its own GDAL dataset, since a dataset must not be shared between threads; GDAL releases the GIL while it
+    reads, so blocks are read in parallel.
+    """
+
+    def __init__(self, uri: str, band: int = 1):
+        self.uri = uri
+        self.band = band
+        self._local = threading.local()
+        raster_band = self._raster_band()
+        self.shape = (raster_band.YSize, raster_band.XSize)
+        self.dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(raster_band.DataType))
+        # Rows of the band's native blocks, which are the cheapest windows to read
+        self.block_rows = raster_band.GetBlockSize()[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def _raster_band(self) -> "gdal.Band":
+        dataset = getattr(self._local, "dataset", None)
+        if dataset is None:
+            dataset = open_raster(self.uri)
+            self._local.dataset = dataset
+        return dataset.GetRasterBand(self.band)
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows, columns = key if isinstance(key, tuple) else (key, slice(None))
+        # Contiguous columns are read as part of the window, others are picked from the full rows
+        column_start, column_stop = 0, self.shape[1]
+        if isinstance(columns, slice) and columns.step in (None, 1):
+            column_start, column_stop, _ = columns.indices(self.shape[1])
+            column_stop = max(column_stop, column_start)
+            columns = slice(None)
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(self.shape[0])
+            if step != 1:
+                raise ValueError("Rows of a raster band are read in contiguous windows")
+            window = self._raster_band().ReadAsArray(column_start, start, column_stop - column_start,
+                                                     max(stop - start, 0))
+            return window[:, columns]
+        row = rows + self.shape[0] if rows < 0 else rows
+        return self._raster_band().ReadAsArray(column_start, row, column_stop - column_start, 1)[0, columns]
+
+
+class RasterValidMask(RasterBand):
+    """
+    Which pixels of a band on disk hold data, read on demand like a RasterBand. GDAL derives the band's mask band
+    from its nodata value, a mask of the whole dataset or an alpha band, whichever the raster has. Indexing gives
+    booleans, False where the band has no data.
+    """
+
+    def __init__(self, uri: str, band: int = 1):
+        super().__init__(uri, band)
+        self.dtype = np.dtype(bool)
+
+    def _raster_band(self) -> "gdal.Band":
+        return super()._raster_band().GetMaskBand()
+
+    def __getitem__(self, key) -> np.ndarray:
+        return super().__getitem__(key) != 0
+
+
+def open_bands(sources: t.Dict[t.Hashable, t.Tuple[str, int]], cached: bool = True,
+               streaming: bool = False) -> t.Dict[t.Hashable, t.Union[np.ndarray, RasterBand]]:
+    """
+    Opens raster bands, given as (uri, band) pairs, for a SurfaceSpec. The bands are read into memory, through
+    read_raster_cached if cached, unless together they are larger than STREAMING_THRESHOLD_BYTES or streaming is
+    set. Otherwise they are returned as RasterBands, which SurfaceSpec reads block by block while it evaluates the
+    surfaces, and which a search window reads only the window of.
+    """
+    bands = {key: RasterBand(uri, band) for key, (uri, band) in sources.items()}
+    if streaming or sum(band.nbytes for band in bands.values()) > STREAMING_THRESHOLD_BYTES:
+        return bands
+    read = read_raster_cached if cached else read_raster
+    return {key: read(band.uri, band.band)[0] for key, band in bands.items()}
+
+
+def open_valid_masks(sources: t.Dict[t.Hashable, t.Tuple[str, int]], cached: bool = True,
+                     streaming: bool = False) -> t.Dict[t.Hashable, t.Union[np.ndarray, RasterValidMask]]:
+    """
+    Opens the validity masks of the raster bands, given as (uri, band) pairs, which have nodata pixels, for a
+    SurfaceSpec's valid_masks. Like open_bands, the masks are read into memory unless together they are larger
+    than STREAMING_THRESHOLD_BYTES or streaming is set. Bands where every pixel is valid are left out.
+    """
+    masks = {key: RasterValidMask(uri, band) for key, (uri, band) in sources.items() if has_valid_mask(uri, band)}
+    if streaming or sum(mask.nbytes for mask in masks.values()) > STREAMING_THRESHOLD_BYTES:
+        return masks
+    read = read_valid_mask_cached if cached else read_valid_mask
+    return {key: read(mask.uri, mask.band) for key, mask in masks.items()}
+
+
+def read_region_geometries(uri: str, projection: str = "") -> t.List[str]:
+    """
+    Reads the geometries of every feature of a vector dataset, such as a permit area or a guide line, reprojected
+    into projection when both it and the dataset's layers are georeferenced.
+
+    :returns: The geometries as WKT
+    """
+    dataset = ogr.Open(uri)
+    if dataset is None:
+        raise ValueError("Could not open vector dataset {}".format(uri))
+    target = None
+    if projection:
+        target = osr.SpatialReference()
+        target.ImportFromWkt(projection)
+        target.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    geometries = []
+    for layer in dataset:
+        source = layer.GetSpatialRef()
+        transform = None
+        if target is not None and source is not None and not source.IsSame(target):
+            source.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            transform = osr.CoordinateTransformation(source, target)
+        for feature in layer:
+            geometry = feature.GetGeometryRef()
+            if geometry is None:
+                continue
+            geometry = geometry.Clone()
+            if transform is not None:
+                geometry.Transform(transform)
+            geometries.append(geometry.ExportToWkt())
+    return geometries
+
+
+def memory_vector_driver() -> "ogr.Driver":
+    """
+    Returns the driver for in-memory vector layers: MEM, which GDAL 3.11 extended to vector data, or the Memory
+    driver it replaced in older versions.
+    """
+    driver = ogr.GetDriverByName("MEM")
+    if driver is None or driver.GetMetadataItem(gdal.DCAP_VECTOR) != "YES":
+        driver = ogr.GetDriverByName("Memory")
+    return driver
+
+
+def rasterize_region(geometries: t.Sequence[str], geotransform: t.Sequence[float], grid_shape: t.Tuple[int, int],
+                     buffer: float = 0) -> Region:
+    """
+    Burns polygons or lines, given as WKT in the grid's map coordinates and grown by buffer map units, into the
+    grid with gdal.RasterizeLayer. Every pixel the geometries touch is inside the region. Only the window of the
+    grid around the geometries is rasterized, so the region's mask is no larger than the corridor.
+    """
+    if geotransform[2] != 0 or geotransform[4] != 0:
+        raise ValueError("Search regions need a north-up raster, without rotation")
+
+    layer_source = memory_vector_driver().CreateDataSource("")
+    layer = layer_source.CreateLayer("region")
+    x_min = y_min = np.inf
+    x_max = y_max = -np.inf
+    for wkt in geometries:
+        geometry = ogr.CreateGeometryFromWkt(wkt)
+        if geometry is None:
+            raise ValueError("Invalid region geometry")
+        if buffer > 0:
+            geometry = geometry.Buffer(buffer)
+        if geometry.IsEmpty():
+            continue
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(geometry)
+        layer.CreateFeature(feature)
+        envelope = geometry.GetEnvelope()
+        x_min, x_max = min(x_min, envelope[0]), max(x_max, envelope[1])
+        y_min, y_max = min(y_min, envelope[2]), max(y_max, envelope[3])
+
+    height, width = grid_shape
+    if not np.isfinite(x_min):
+        return Region(np.zeros((0, 0), bool))
+    # The envelope's window of pixels, for a north-up geotransform, widened by a pixel for touched edges
+    columns = sorted(((x_min - geotransform[0]) / geotransform[1], (x_max - geotransform[0]) / geotransform[1]))
+    rows = sorted(((y_min - geotransform[3]) / geotransform[5], (y_max - geotransform[3]) / geotransform[5]))
+    x_offset = min(max(int(np.floor(columns[0])) - 1, 0), width)
+    y_offset = min(max(int(np.floor(rows[0])) - 1, 0), height)
+    window_width = min(int(np.ceil(columns[1])) + 1, width) - x_offset
+    window_height = min(int(np.ceil(rows[1])) + 1, height) - y_offset
+    if window_width <= 0 or window_height <= 0:
+        return Region(np.zeros((0, 0), bool))
+
+    dataset = gdal.GetDriverByName("MEM").Create("", window_width, window_height, 1, gdal.GDT_Byte)
+    dataset.SetGeoTransform((geotransform[0] + x_offset * geotransform[1], geotransform[1], geotransform[2],
+                             geotransform[3] + y_offset * geotransform[5], geotransform[4], geotransform[5]))
+    gdal.RasterizeLayer(dataset, [1], layer, burn_values=[1], options=["ALL_TOUCHED=TRUE"])
+    return Region(dataset.GetRasterBand(1).ReadAsArray() != 0, x_offset, y_offset)
+
+
+def write_raster(path: str, array: np.ndarray, geotransform: t.Sequence[float], projection: str,
+                 nodata: t.Optional[float] = None):
+    """
+    Writes a 2D array as a single-band GeoTIFF in one call, georeferenced with a GDAL geotransform and a WKT
+    projection.
+    """
+    height, width = array.shape
+    data_type = gdal.GDT_Float64 if array.dtype == np.float64 else gdal.GDT_Float32
+    dataset = gdal.GetDriverByName("GTiff").Create(path, width, height, 1, data_type)
+    if dataset is None:
+        raise ValueError("Could not create raster {}".format(path))
+    dataset.SetGeoTransform(tuple(geotransform))
+    dataset.SetProjection(projection)
+    band = dataset.GetRasterBand(1)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    band.WriteArray(array)
+    dataset.FlushCache()
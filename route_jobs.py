@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import typing as t
+
+from .pathfinder_core import SurfaceSpec, PathResult, SearchCanceled, find_path, world_to_pixel, pixel_to_world
+
+# Attributes of the features in a route layer, as names and the kind of value each holds
+ROUTE_FIELDS = (("route_id", "integer"), ("cost", "double"), ("engine", "string"), ("expansions", "integer"),
+                ("search_time", "double"))
+
+
+class RouteJob:
+    """
+    The part of a background route that does not involve QGIS: its endpoints in pixels, the search and its outcome,
+    and the geometry and attributes of the route it found. RouteTask runs one in a worker thread of the task manager
+    and adds its route to the route layer once it has finished.
+    """
+
+    def __init__(self, spec: SurfaceSpec, geotransform, route_id: int, start: t.Tuple[float, float],
+                 end: t.Tuple[float, float], engine: int, memory_budget: t.Optional[float] = None):
+        self.spec = spec
+        self.geotransform = geotransform
+        self.route_id = route_id
+        self.start = world_to_pixel(start[0], start[1], geotransform, spec.grid_width, spec.grid_height)
+        self.end = world_to_pixel(end[0], end[1], geotransform, spec.grid_width, spec.grid_height)
+        self.engine = engine
+        self.memory_budget = memory_budget
+
+        self.result: t.Optional[PathResult] = None
+        self.error: t.Optional[str] = None
+        self.messages: t.List[str] = []
+
+    def run(self, is_canceled: t.Callable[[], bool] = None, on_progress: t.Callable[[float], None] = None) -> bool:
+        """
+        Searches for the route, keeping the messages of the search. A search that fails keeps its error, while a
+        cancelled one keeps neither a result nor an error.
+
+        :returns: Whether a route was found
+        """
+        try:
+            self.result = find_path(self.spec, self.start, self.end, self.engine, self.memory_budget,
+                                    is_canceled=is_canceled, on_progress=on_progress,
+                                    on_message=self.messages.append)
+        except SearchCanceled:
+            return False
+        except (ValueError, RuntimeError) as e:
+            self.error = str(e)
+            return False
+        return True
+
+    def vertices(self) -> t.List[t.Tuple[float, float]]:
+        """
+        Returns the map coordinates of the found route's vertices, at the centers of their pixels.
+        """
+        return [pixel_to_world(p, self.geotransform) for p in self.result.pixels]
+
+    def attributes(self) -> list:
+        """
+        Returns the found route's attributes, in the order of ROUTE_FIELDS.
+        """
+        return [self.route_id, self.result.cost, self.result.engine, self.result.expansions,
+                self.result.timings.get("search", 0.0)]
+
+
+class RouteLayers:
+    """
+    Remembers the route layer of each CRS, so that every route in a CRS is added to one layer. A layer which has
+    been removed from the project is replaced by a new one.
+    """
+
+    def __init__(self):
+        self.layer_ids: t.Dict[str, str] = {}
+
+    def layer(self, crs: str, find_layer: t.Callable[[str], t.Any], create_layer: t.Callable[[], t.Any]):
+        """
+        Returns the layer of a CRS, given as WKT.
+
+        :param find_layer: Looks a layer up by its id, returning None if it is not in the project
+        :param create_layer: Creates a new layer and adds it to the project
+        """
+        layer = find_layer(self.layer_ids[crs]) if crs in self.layer_ids else None
+        if layer is None:
+            layer = create_layer()
+            self.layer_ids[crs] = layer.id()
+        return layer
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import typing as t
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .pathfinder_core import (ENGINE_AUTOMATIC, SurfaceSpec, referenced_bands, cost_distance, find_path,
+                              find_eikonal_path, world_to_continuous_pixel, continuous_pixel_to_world, pixel_to_world,
+                              geotransform_pixel_size)
+from .pathfinder_constants import DEFAULT_MEMORY_BUDGET_MB
+from .pathfinder_cli import ENGINE_CHOICES, ENGINE_EIKONAL, read_inputs, read_region, surface_options
+from .connectivity import get_component_labels
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Cost-distance surfaces kept per raster surface, keyed by their sources and engine
+COST_DISTANCE_CACHE_SIZE = 8
+MAX_BODY_BYTES = 2 ** 20
+
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  413: "Payload Too Large", 500: "Internal Server Error"}
+
+Point = t.Tuple[float, float]
+
+
+class HTTPError(ValueError):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Surface:
+    """
+    A cost surface held resident by the server: the input arrays, the spec deriving cost and traversability from
+    them and the grid's georeferencing. Searches run concurrently in the server's worker threads, sharing the
+    spec's read-only surfaces and a cache of recent cost-distance results.
+    """
+
+    def __init__(self, name: str, spec: SurfaceSpec, geotransform: t.Sequence[float], projection: str = ""):
+        self.name = name
+        self.spec = spec
+        self.geotransform = tuple(geotransform)
+        self.projection = projection
+        self._cost_distance_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def warm(self):
+        """
+        Precomputes the cost and traversability surfaces and the connected components, so that the first query
+        does not pay for them.
+        """
+        get_component_labels(self.spec.shared_mask())
+        self.spec.shared_cost()
+
+    def describe(self) -> t.Dict[str, t.Any]:
+        return {"width": self.spec.grid_width, "height": self.spec.grid_height,
+                "geotransform": list(self.geotransform), "projection": self.projection}
+
+    def to_continuous_pixel(self, point: t.Any) -> Point:
+        try:
+            x, y = (float(v) for v in point)
+        except (TypeError, ValueError):
+            raise HTTPError(400, "Points must be [x, y] pairs, got {!r}".format(point))
+        pix = world_to_continuous_pixel(x, y, self.geotransform)
+        if not (0 <= pix[0] <= self.spec.grid_width and 0 <= pix[1] <= self.spec.grid_height):
+            raise HTTPError(400, "Point {} is outside surface '{}'".format([x, y], self.name))
+        return pix
+
+    def to_pixel(self, point: t.Any) -> t.Tuple[int, int]:
+        pix = self.to_continuous_pixel(point)
+        return min(int(pix[0]), self.spec.grid_width - 1), min(int(pix[1]), self.spec.grid_height - 1)
+
+    def cost_distance(self, sources: t.Sequence[t.Tuple[int, int]], engine: int,
+                      memory_budget: t.Optional[float]) -> np.ndarray:
+        """
+        Returns the read-only cost-distance array from the sources, reusing a cached result for the same sources
+        and engine.
+        """
+        key = (tuple(sorted(set(sources))), engine)
+        with self._cache_lock:
+            if key in self._cost_distance_cache:
+                self._cost_distance_cache.move_to_end(key)
+                return self._cost_distance_cache[key]
+
+        costs, _ = cost_distance(self.spec, sources, engine, memory_budget)
+        costs.setflags(write=False)
+        with self._cache_lock:
+            self._cost_distance_cache[key] = costs
+            while len(self._cost_distance_cache) > COST_DISTANCE_CACHE_SIZE:
+                self._cost_distance_cache.popitem(last=False)
+        return costs
+
+
+def load_surfaces(config: t.Dict[str, t.Any], base_dir: str = ".") -> t.Dict[str, Surface]:
+    """
+    Reads the rasters of every surface in a server configuration. Each entry of config["surfaces"] takes the
+    command-line options: "inputs" (paths relative to base_dir, of rasters, folders of tiles or tile indexes),
+    "traversability_layer", "min", "max", "traversability_expression", "cost_layer", "cost_expression",
+    "dem_layer", "slope_expression", "min_clearance", "proximity_cost", "proximity_distance", "region" (a vector
+    dataset relative to base_dir) and "region_buffer".
+    """
+    surfaces = {}
+    for name, surface_config in config.get("surfaces", {}).items():
+        spec_options = surface_options(
+            len(surface_config["inputs"]),
+            surface_config.get("traversability_layer", 1),
+            surface_config.get("min", 1),
+            surface_config.get("max"),
+            surface_config.get("traversability_expression", ""),
+            surface_config.get("cost_layer", 2),
+            surface_config.get("cost_expression", ""),
+            surface_config.get("dem_layer", 0),
+            surface_config.get("slope_expression", ""),
+            surface_config.get("min_clearance", 0),
+            surface_config.get("proximity_cost", 0),
+            surface_config.get("proximity_distance", 0)
+        )
+        bands, valid_masks, grid_shape, geotransform, projection = read_inputs(
+            [os.path.join(base_dir, uri) for uri in surface_config["inputs"]], referenced_bands(**spec_options))
+        region = surface_config.get("region")
+        region = read_region(os.path.join(base_dir, region) if region else None, surface_config.get("region_buffer", 0),
+                             geotransform, grid_shape, projection)
+        spec = SurfaceSpec(bands=bands, grid_shape=grid_shape, pixel_size=geotransform_pixel_size(geotransform),
+                           valid_masks=valid_masks, region=region, **spec_options)
+        surfaces[name] = Surface(name, spec, geotransform, projection)
+    if not surfaces:
+        raise ValueError("The configuration does not define any surfaces")
+    return surfaces
+
+
+def row_runs_to_polygons(inside: np.ndarray, geotransform: t.Sequence[float]) -> t.List[t.List[t.List[list]]]:
+    """
+    Outlines the flagged pixels as one rectangle per horizontal run, as GeoJSON MultiPolygon coordinates.
+    """
+    polygons = []
+    for y in np.flatnonzero(inside.any(axis=1)):
+        row = np.concatenate(([False], inside[y], [False]))
+        changes = np.flatnonzero(row[1:] != row[:-1])
+        for x_start, x_end in zip(changes[::2], changes[1::2]):
+            corners = [(x_start, y), (x_end, y), (x_end, y + 1), (x_start, y + 1), (x_start, y)]
+            polygons.append([[list(continuous_pixel_to_world(c, geotransform)) for c in corners]])
+    return polygons
+
+
+class RouteServer:
+    """
+    Answers route, cost-distance and isochrone queries over HTTP with JSON bodies:
+
+    - GET /surfaces lists the surfaces and their grids
+    - POST /route {"surface", "start": [x, y], "end": [x, y], "engine"} returns the path as a GeoJSON feature
+    - POST /cost-distance {"surface", "sources": [[x, y], ...], "targets": [[x, y], ...]} returns the cost from the
+      nearest source to each target, null where unreachable
+    - POST /isochrone {"surface", "sources": [[x, y], ...], "max_cost"} returns the pixels reachable within
+      max_cost as a GeoJSON MultiPolygon feature
+
+    Points are in the map coordinates of the surface. The event loop only parses requests; searches run in a
+    thread pool, where the compiled and vectorized engines release the GIL and every worker shares the resident
+    surfaces without copying them, as a process pool would have to.
+    """
+
+    def __init__(self, surfaces: t.Dict[str, Surface], engine: int = ENGINE_AUTOMATIC,
+                 memory_budget: t.Optional[float] = None, workers: t.Optional[int] = None):
+        self.surfaces = surfaces
+        self.engine = engine
+        self.memory_budget = memory_budget
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="route-server")
+        self.server: t.Optional[asyncio.AbstractServer] = None
+        self.handlers = {
+            ("GET", "/surfaces"): self.list_surfaces,
+            ("POST", "/route"): self.route,
+            ("POST", "/cost-distance"): self.cost_distance,
+            ("POST", "/isochrone"): self.isochrone
+        }
+
+    def warm(self):
+        for surface in self.surfaces.values():
+            surface.warm()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> int:
+        """
+        Starts listening, on an ephemeral port if port is 0.
+
+        :returns: The port listened on
+        """
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves HTTP/1.1 requests on one connection until the client closes it or asks to.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    method, path, _ = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY_BYTES:
+                        raise HTTPError(413, "Request bodies are limited to {} bytes".format(MAX_BODY_BYTES))
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = 200, await loop.run_in_executor(
+                        self.executor, self.dispatch, method, path.split("?")[0], body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except ValueError as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    # Keep serving other requests; the client gets the reason instead of a dropped connection
+                    status, payload = 500, {"error": "{}: {}".format(type(e).__name__, e)}
+                if status == 413:
+                    keep_alive = False
+
+                content = json.dumps(payload).encode()
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                             "Connection: {}\r\n\r\n".format(status, STATUS_REASONS[status], len(content),
+                                                             "keep-alive" if keep_alive else "close").encode())
+                writer.write(content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, method: str, path: str, body: bytes) -> t.Dict[str, t.Any]:
+        """
+        Runs a request's handler in a worker thread.
+        """
+        handler = self.handlers.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in self.handlers):
+                raise HTTPError(405, "{} does not accept {}".format(path, method))
+            raise HTTPError(404, "No endpoint {}".format(path))
+        try:
+            request = json.loads(body) if body else {}
+        except ValueError:
+            raise HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return handler(request)
+
+    def get_surface(self, request: t.Dict[str, t.Any]) -> Surface:
+        name = request.get("surface")
+        if name is None and len(self.surfaces) == 1:
+            return next(iter(self.surfaces.values()))
+        if name not in self.surfaces:
+            raise HTTPError(404, "No surface named {!r}".format(name))
+        return self.surfaces[name]
+
+    def get_engine(self, request: t.Dict[str, t.Any], allow_eikonal: bool = False):
+        name = request.get("engine")
+        if name is None:
+            return self.engine
+        if name not in ENGINE_CHOICES or (name == ENGINE_EIKONAL and not allow_eikonal):
+            raise HTTPError(400, "Unknown engine {!r}".format(name))
+        return ENGINE_CHOICES[name]
+
+    @staticmethod
+    def get_points(request: t.Dict[str, t.Any], key: str) -> t.List[t.Any]:
+        points = request.get(key)
+        if not isinstance(points, list) or not points:
+            raise HTTPError(400, "'{}' must be a non-empty list of [x, y] points".format(key))
+        return points
+
+    def list_surfaces(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        return {"surfaces": {name: surface.describe() for name, surface in self.surfaces.items()}}
+
+    def route(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        surface = self.get_surface(request)
+        engine = self.get_engine(request, allow_eikonal=True)
+        if engine == ENGINE_EIKONAL:
+            result = find_eikonal_path(surface.spec, surface.to_continuous_pixel(request.get("start")),
+                                       surface.to_continuous_pixel(request.get("end")))
+            coordinates = [continuous_pixel_to_world(p, surface.geotransform) for p in result.pixels]
+        else:
+            result = find_path(surface.spec, surface.to_pixel(request.get("start")),
+                               surface.to_pixel(request.get("end")), engine, self.memory_budget)
+            coordinates = [pixel_to_world(p, surface.geotransform) for p in result.pixels]
+
+        return {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [list(c) for c in coordinates]},
+            "properties": {"cost": result.cost, "engine": result.engine, "expansions": result.expansions}
+        }
+
+    def cost_distance(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        surface = self.get_surface(request)
+        sources = [surface.to_pixel(p) for p in self.get_points(request, "sources")]
+        targets = [surface.to_pixel(p) for p in self.get_points(request, "targets")]
+        costs = surface.cost_distance(sources, self.get_engine(request), self.memory_budget)
+        return {"costs": [float(costs[y, x]) if np.isfinite(costs[y, x]) else None for x, y in targets]}
+
+    def isochrone(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        surface = self.get_surface(request)
+        sources = [surface.to_pixel(p) for p in self.get_points(request, "sources")]
+        try:
+            max_cost = float(request["max_cost"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPError(400, "'max_cost' must be a number")
+        costs = surface.cost_distance(sources, self.get_engine(request), self.memory_budget)
+        inside = costs <= max_cost
+        return {
+            "type": "Feature",
+            "geometry": {"type": "MultiPolygon", "coordinates": row_runs_to_polygons(inside, surface.geotransform)},
+            "properties": {"max_cost": max_cost, "pixels": int(np.count_nonzero(inside))}
+        }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="route_server",
+        description="Serves route, cost-distance and isochrone queries over HTTP, keeping the configured rasters "
+                    "and their cost surfaces in memory"
+    )
+    parser.add_argument("config", help="JSON file mapping surface names to their inputs and options, under "
+                                       "the key 'surfaces'")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on (default: {})".format(
+        DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on (default: {})".format(
+        DEFAULT_PORT))
+    parser.add_argument("--workers", type=int, help="Searches run at once (default: based on the CPU count)")
+    parser.add_argument("--engine", choices=tuple(name for name in ENGINE_CHOICES if name != ENGINE_EIKONAL),
+                        default="auto", help="Default search engine (default: auto)")
+    parser.add_argument("--memory-budget", type=float, default=DEFAULT_MEMORY_BUDGET_MB, metavar="MB",
+                        help="Maximum memory for each search's state, in MB (default: {})".format(
+                            DEFAULT_MEMORY_BUDGET_MB))
+    return parser
+
+
+async def serve(server: RouteServer, host: str, port: int):
+    port = await server.start(host, port)
+    print("Listening on http://{}:{}".format(host, port), file=sys.stderr)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        with open(args.config) as f:
+            config = json.load(f)
+        from .raster_io import limit_block_cache
+
+        # This process reads nothing but the inputs, so GDAL's caches only need to hold their tiles
+        limit_block_cache()
+        surfaces = load_surfaces(config, os.path.dirname(os.path.abspath(args.config)))
+    except (OSError, ValueError, KeyError) as e:
+        print("Error: {}".format(e), file=sys.stderr)
+        return 1
+
+    server = RouteServer(surfaces, ENGINE_CHOICES[args.engine], args.memory_budget * 2 ** 20, args.workers)
+    server.warm()
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
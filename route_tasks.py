@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import typing as t
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (Qgis,
+                       QgsApplication,
+                       QgsCoordinateReferenceSystem,
+                       QgsFeature,
+                       QgsField,
+                       QgsGeometry,
+                       QgsMessageLog,
+                       QgsPoint,
+                       QgsProject,
+                       QgsTask,
+                       QgsVectorLayer)
+
+from .pathfinder_core import SurfaceSpec
+from .route_jobs import ROUTE_FIELDS, RouteJob, RouteLayers
+
+ROUTE_LAYER_NAME = "Pathfinder routes"
+MESSAGE_TAG = "Pathfinder"
+FIELD_TYPES = {"integer": QVariant.LongLong, "double": QVariant.Double, "string": QVariant.String}
+
+# Tasks which have been submitted and not yet finished. The task manager owns the C++ side of each task, but the
+# Python side would be garbage collected (and run() lost) without a reference held here
+_active_tasks: t.Set["RouteTask"] = set()
+
+# Route layers by CRS, shared by every task whose raster grid uses that CRS
+_route_layers = RouteLayers()
+
+
+def tr(string):
+    return QCoreApplication.translate('Processing', string)
+
+
+def create_route_layer(crs: QgsCoordinateReferenceSystem) -> QgsVectorLayer:
+    layer = QgsVectorLayer("LineString", tr(ROUTE_LAYER_NAME), "memory")
+    layer.setCrs(crs)
+    layer.dataProvider().addAttributes([QgsField(name, FIELD_TYPES[kind]) for name, kind in ROUTE_FIELDS])
+    layer.updateFields()
+    QgsProject.instance().addMapLayer(layer)
+    return layer
+
+
+def shared_route_layer(crs: QgsCoordinateReferenceSystem) -> QgsVectorLayer:
+    """
+    Returns the memory layer that finished routes in the given CRS are added to, creating it and adding it to the
+    project if it does not exist yet or has been removed from the project.
+    """
+    return _route_layers.layer(crs.toWkt(), QgsProject.instance().mapLayer, lambda: create_route_layer(crs))
+
+
+class RouteTask(QgsTask):
+    """
+    Finds one path in a background thread of the task manager. Progress and cancellation go through the task, so
+    the route shows up, and can be cancelled, in the QGIS task list like any other background job. The search
+    itself is a RouteJob.
+
+    Tasks created over the same SurfaceSpec share its read-only cost and traversability surfaces, and the input
+    rasters they were built from, so several routes over one surface run concurrently without copying them. The
+    path is added to the route layer in finished(), which the task manager calls on the main thread.
+    """
+
+    def __init__(self, spec: SurfaceSpec, geotransform, route_layer: QgsVectorLayer, route_id: int,
+                 start: t.Tuple[float, float], end: t.Tuple[float, float], engine: int,
+                 memory_budget: t.Optional[float] = None):
+        super().__init__(tr("Pathfinder route {}").format(route_id), QgsTask.CanCancel)
+        self.route_layer = route_layer
+        self.job = RouteJob(spec, geotransform, route_id, start, end, engine, memory_budget)
+
+    def run(self) -> bool:
+        """
+        Runs in a worker thread, so it must not touch layers or any other part of the GUI.
+        """
+        return self.job.run(is_canceled=self.isCanceled, on_progress=self.setProgress)
+
+    def finished(self, result: bool):
+        """
+        Runs on the main thread once run() has returned or the task was cancelled before it started.
+        """
+        _active_tasks.discard(self)
+        for message in self.job.messages:
+            QgsMessageLog.logMessage(tr("Route {}: {}").format(self.job.route_id, tr(message)), MESSAGE_TAG,
+                                     Qgis.Info)
+        if not result:
+            if self.job.error is not None:
+                QgsMessageLog.logMessage(tr("Route {} failed: {}").format(self.job.route_id, tr(self.job.error)),
+                                         MESSAGE_TAG, Qgis.Warning)
+            return
+
+        # The layer may have been removed from the project while the search ran
+        if QgsProject.instance().mapLayer(self.route_layer.id()) is None:
+            return
+
+        feature = QgsFeature(self.route_layer.fields())
+        feature.setGeometry(QgsGeometry.fromPolyline([QgsPoint(x, y) for x, y in self.job.vertices()]))
+        feature.setAttributes(self.job.attributes())
+        self.route_layer.dataProvider().addFeatures([feature])
+        self.route_layer.updateExtents()
+        self.route_layer.triggerRepaint()
+
+
+def submit_route(spec: SurfaceSpec, geotransform, route_layer: QgsVectorLayer, route_id: int,
+                 start: t.Tuple[float, float], end: t.Tuple[float, float], engine: int,
+                 memory_budget: t.Optional[float] = None) -> RouteTask:
+    """
+    Queues a route search with the QGIS task manager, which runs it alongside any other queued routes.
+
+    :param start: The starting point in the CRS of the raster grid
+    :param end: The ending point in the CRS of the raster grid
+    """
+    task = RouteTask(spec, geotransform, route_layer, route_id, start, end, engine, memory_budget)
+    _active_tasks.add(task)
+    QgsApplication.taskManager().addTask(task)
+    return task
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ Pathfinder
+                                 A QGIS plugin
+ Finds near-optimal paths in raster images
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2022-01-15
+        copyright            : (C) 2022 by Noah Mollerstuen
+        email                : noah@mollerstuen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import tempfile
+import typing as t
+import numpy as np
+
+# Size of the stored surfaces, in MB, beyond which the least recently used are evicted
+DEFAULT_SURFACE_CACHE_MB = 4096
+SURFACE_CACHE_DIRNAME = "pathfinder_surfaces"
+SURFACE_SUFFIX = ".npy"
+
+
+class SurfaceCache:
+    """
+    Stores evaluated cost and traversability surfaces as .npy files in a directory, keyed by query_key. Stored
+    surfaces are memory mapped read-only instead of read, so a cached surface needs no evaluation and little memory,
+    and every process using the directory shares the same pages. A file's modification time records when it was
+    last used; once the files exceed max_bytes, the least recently used are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: float = DEFAULT_SURFACE_CACHE_MB * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SURFACE_SUFFIX)
+
+    def get(self, key: str, shape: t.Tuple[int, ...], dtype: np.dtype) -> t.Optional[np.ndarray]:
+        """
+        Maps the stored surface for key, or returns None, marking it as recently used. A file which does not hold
+        an array of the given shape and dtype is treated as missing.
+        """
+        path = self.path(key)
+        try:
+            surface = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if surface.shape != tuple(shape) or surface.dtype != np.dtype(dtype):
+            return None
+        return surface
+
+    def put(self, key: str, shape: t.Tuple[int, ...], dtype: np.dtype,
+            fill: t.Callable[[np.ndarray], t.Any]) -> np.ndarray:
+        """
+        Evaluates a surface with fill straight into a new file, stores it under key and returns it mapped read-only,
+        then evicts the least recently used surfaces until the rest fit in max_bytes. The file is written under a
+        temporary name and renamed into place, so other processes never map a partly written surface. A surface
+        larger than max_bytes on its own is evaluated in memory and not stored.
+        """
+        if int(np.prod(shape)) * np.dtype(dtype).itemsize > self.max_bytes:
+            surface = np.empty(shape, dtype)
+            fill(surface)
+            surface.setflags(write=False)
+            return surface
+
+        handle, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(handle)
+        try:
+            out = np.lib.format.open_memmap(temporary, "w+", dtype, shape)
+            fill(out)
+            out.flush()
+            del out
+            os.replace(temporary, self.path(key))
+        except OSError:
+            # Another process stored the same surface and has it mapped, which Windows does not let us replace
+            os.remove(temporary)
+            surface = self.get(key, shape, dtype)
+            if surface is None:
+                raise
+            return surface
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        self.evict(keep=key)
+        return np.load(self.path(key), mmap_mode="r")
+
+    def entries(self) -> t.List[t.Tuple[float, int, str]]:
+        """
+        Lists the stored surfaces as (last used, size in bytes, path), least recently used first.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SURFACE_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep: t.Optional[str] = None):
+        """
+        Deletes the least recently used surfaces, other than keep's, until the rest fit in max_bytes.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == self.path(keep):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped by a search on Windows; it is evicted by a later call
+                continue
+            total -= size
+
+    def total_bytes(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def __len__(self):
+        return len(self.entries())
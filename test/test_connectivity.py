@@ -0,0 +1,129 @@
+# coding=utf-8
+"""Tests of the connected component labels checked before a search.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from .. import connectivity, pathfinder_core
+from ..connectivity import (LABEL_CACHE_SIZE, label_components, get_component_labels, components_of,
+                            mask_fingerprint, _label_union_find)
+from ..pathfinder_core import ENGINE_PYTHON, SurfaceSpec, find_path
+
+
+class ConnectivityTest(unittest.TestCase):
+    """Labels components and caches the labels by mask fingerprint."""
+
+    def setUp(self):
+        connectivity._label_cache.clear()
+
+    def tearDown(self):
+        connectivity._label_cache.clear()
+
+    @unittest.skipIf(connectivity.ndimage is None, "SciPy is not installed")
+    def test_union_find_matches_scipy(self):
+        """The NumPy fallback numbers components in the same raster order as
+        scipy.ndimage.label."""
+        rng = np.random.default_rng(29)
+        for trial in range(40):
+            mask = rng.random((rng.integers(1, 30), rng.integers(1, 30))) < rng.uniform(0.2, 0.8)
+            for neighbors in (4, 8):
+                with self.subTest(trial=trial, connectivity=neighbors):
+                    structure = connectivity.ndimage.generate_binary_structure(2, 1 if neighbors == 4 else 2)
+                    expected, _ = connectivity.ndimage.label(mask, structure=structure)
+                    np.testing.assert_array_equal(_label_union_find(mask, neighbors), expected)
+
+    def test_label_components(self):
+        mask = np.array([[1, 1, 0, 1],
+                         [0, 0, 0, 1],
+                         [1, 0, 1, 0]], bool)
+        labels = label_components(mask)
+        self.assertEqual(labels.dtype, np.int32)
+        self.assertEqual(components_of(labels, (0, 0), (1, 0), (3, 1), (2, 2), (2, 0)), [1, 1, 2, 4, 0])
+        self.assertEqual(components_of(label_components(mask, 8), (3, 1), (2, 2)), [2, 2])
+        with self.assertRaises(ValueError):
+            label_components(mask, 6)
+
+    def test_cache(self):
+        """Identical masks reuse their labels, and the least recently used
+        labels are evicted."""
+        rng = np.random.default_rng(30)
+        masks = [rng.random((8, 8)) < 0.6 for _ in range(LABEL_CACHE_SIZE + 1)]
+        with mock.patch.object(connectivity, "label_components", wraps=connectivity.label_components) as labeler:
+            first = get_component_labels(masks[0])
+            self.assertFalse(first.flags.writeable)
+            self.assertIs(get_component_labels(masks[0].copy()), first)
+            self.assertEqual(labeler.call_count, 1)
+
+            # The connectivity is part of the fingerprint
+            get_component_labels(masks[0], 8)
+            self.assertEqual(labeler.call_count, 2)
+            self.assertNotEqual(mask_fingerprint(masks[0]), mask_fingerprint(masks[0], 8))
+
+            # Touching the first mask keeps it while the others push the 8-connected labels out
+            for mask in masks[1:LABEL_CACHE_SIZE - 1]:
+                get_component_labels(mask)
+            get_component_labels(masks[0])
+            get_component_labels(masks[-1])
+            self.assertEqual(len(connectivity._label_cache), LABEL_CACHE_SIZE)
+            self.assertIn(mask_fingerprint(masks[0]), connectivity._label_cache)
+            self.assertNotIn(mask_fingerprint(masks[0], 8), connectivity._label_cache)
+
+            calls = labeler.call_count
+            get_component_labels(masks[0], 8)
+            self.assertEqual(labeler.call_count, calls + 1)
+
+    def test_concurrent_lookups(self):
+        """Searches in background tasks can share the cache."""
+        rng = np.random.default_rng(31)
+        masks = [rng.random((20, 20)) < 0.6 for _ in range(2 * LABEL_CACHE_SIZE)]
+        expected = [label_components(mask) for mask in masks]
+        errors = []
+
+        def look_up(offset):
+            try:
+                for i in range(50):
+                    index = (i + offset) % len(masks)
+                    np.testing.assert_array_equal(get_component_labels(masks[index]), expected[index])
+            except AssertionError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=look_up, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(connectivity._label_cache), LABEL_CACHE_SIZE)
+
+    def test_disconnected_endpoints(self):
+        """find_path rejects endpoints in different components before it
+        creates a search."""
+        mask = np.ones((6, 6))
+        mask[:, 3] = 0
+        spec = SurfaceSpec([mask, np.ones((6, 6))], traversability_layer=0, traversability_min=1, cost_layer=1)
+        messages = []
+        with mock.patch.object(pathfinder_core, "create_search") as create_search:
+            with self.assertRaisesRegex(ValueError, "not connected"):
+                find_path(spec, (0, 0), (5, 5), ENGINE_PYTHON, on_message=messages.append)
+            create_search.assert_not_called()
+        self.assertTrue(any("component" in message for message in messages))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ConnectivityTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,781 @@
+# coding=utf-8
+"""Differential tests of the search engines against the reference A*.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+These tests only need NumPy, so they run headless with
+    python -m pytest test/test_engines.py
+The pure Python A* of the grid pathfinder is the reference; every other engine
+must match its path cost, or stay within its stated bound.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import ast
+import copy
+import heapq
+import math
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from .. import pathfinder_core, numba_search
+from ..pathfinder_core import (ENGINE_PYTHON, ENGINE_NUMBA, ENGINE_DELTA_STEPPING, NEIGHBORS, SurfaceSpec,
+                               PythonSearch, find_path, find_eikonal_path, cost_distance,
+                               run_search, referenced_bands, translated_error, MemoryBudgetExceeded, Region)
+from ..formulas import (parse_formula, formula_variables, evaluate_formula, compile_pixel_formula, FormulaError,
+                         FormulaSyntaxError)
+from ..numba_search import NUMBA_AVAILABLE
+
+TENBYTEN_PATH = os.path.join(os.path.dirname(__file__), 'tenbytenraster.asc')
+
+# Engines compared with the reference, with the costs they are exact for. The Numba engine runs the same A*, so it is
+# only optimal when the Manhattan heuristic is admissible; delta-stepping is Dijkstra and exact for any positive cost
+ENGINES = [ENGINE_DELTA_STEPPING] + ([ENGINE_NUMBA] if NUMBA_AVAILABLE else [])
+RANDOM_TRIALS = 40
+COST_TOLERANCE = 1e-9
+
+
+def read_ascii_grid(path):
+    """Reads an ESRI ASCII grid without GDAL."""
+    header = {}
+    with open(path) as f:
+        lines = f.read().splitlines()
+    row = 0
+    while lines[row].split()[0].upper() in ('NCOLS', 'NROWS', 'XLLCENTER', 'YLLCENTER', 'XLLCORNER', 'YLLCORNER',
+                                            'DX', 'DY', 'CELLSIZE', 'NODATA_VALUE'):
+        key, value = lines[row].split()
+        header[key.upper()] = float(value)
+        row += 1
+    height = int(header['NROWS'])
+    return np.array([[float(v) for v in line.split()] for line in lines[row:row + height]])
+
+
+def random_expression(rng, variables, depth):
+    """Builds a random expression from the formula grammar: constants,
+    variables, arithmetic, negation and comparisons."""
+    if depth == 0 or rng.random() < 0.25:
+        if rng.random() < 0.3:
+            return '{:.2f}'.format(rng.uniform(0, 5))
+        return str(rng.choice(variables))
+
+    kind = rng.integers(5)
+    left = random_expression(rng, variables, depth - 1)
+    right = random_expression(rng, variables, depth - 1)
+    if kind == 0:
+        return '({} {} {})'.format(left, rng.choice(['+', '-', '*']), right)
+    if kind == 1:
+        # Dividing by a positive denominator keeps the expression finite
+        return '({} / (1 + {} * {}))'.format(left, right, right)
+    if kind == 2:
+        return '(-{})'.format(left)
+    if kind == 3:
+        return '({} {} {})'.format(left, rng.choice(['<', '<=', '>', '>=', '==', '!=']), right)
+    return '({} ** 2)'.format(left)
+
+
+def random_problem(rng, max_size=24):
+    """Generates a random raster stack, start and end pixels, made
+    traversable."""
+    height, width = (int(v) for v in rng.integers(2, max_size, 2))
+    inp_arrs = [rng.integers(0, 10, (height, width)).astype(np.float64),
+                rng.uniform(1, 10, (height, width))]
+    inp_arrs[0][inp_arrs[0] == 0] = 1 if rng.random() < 0.5 else 0
+    start = (int(rng.integers(width)), int(rng.integers(height)))
+    end = (int(rng.integers(width)), int(rng.integers(height)))
+    for x, y in (start, end):
+        inp_arrs[0][y, x] = max(inp_arrs[0][y, x], 1)
+    return inp_arrs, start, end
+
+
+class RowReader:
+    """Hands out rows of an array on demand, like raster_io.RasterBand."""
+
+    def __init__(self, arr, block_rows):
+        self.arr = arr
+        self.shape = arr.shape
+        self.dtype = arr.dtype
+        self.block_rows = block_rows
+
+    def __getitem__(self, key):
+        return np.array(self.arr[key])
+
+
+def path_cost(spec, pixels):
+    """Walks a path through its vertices, checking every step is to a
+    traversable 4-neighbour, and returns the summed cost."""
+    total = 0.0
+    current = pixels[0]
+    for vertex in pixels[1:]:
+        if vertex[0] != current[0] and vertex[1] != current[1]:
+            raise AssertionError('Path segment {} -> {} is not axis aligned'.format(current, vertex))
+        while current != vertex:
+            current = (current[0] + int(np.sign(vertex[0] - current[0])),
+                       current[1] + int(np.sign(vertex[1] - current[1])))
+            if not spec.is_traversable(current):
+                raise AssertionError('Path crosses untraversable pixel {}'.format(current))
+            total += float(spec.get_cost(current))
+    return total
+
+
+def path_pixels(pixels):
+    """Expands a path's vertices into every pixel it passes through."""
+    walked = [pixels[0]]
+    for vertex in pixels[1:]:
+        current = walked[-1]
+        while current != vertex:
+            current = (current[0] + int(np.sign(vertex[0] - current[0])),
+                       current[1] + int(np.sign(vertex[1] - current[1])))
+            walked.append(current)
+    return walked
+
+
+def reference_cost(spec, start, end):
+    """Runs the reference A*, returning None when there is no path."""
+    try:
+        return find_path(spec, start, end, ENGINE_PYTHON).cost
+    except ValueError:
+        return None
+
+
+def reference_dijkstra(spec, start):
+    """Runs the reference search without a heuristic, which is exact for any
+    non-negative cost."""
+    search = PythonSearch(spec.is_traversable, spec.get_cost, spec.grid_width, spec.grid_height, [start])
+    run_search(search)
+    return search.cost_so_far
+
+
+class EngineDifferentialTest(unittest.TestCase):
+    """Compares every engine with the reference A* on random problems."""
+
+    def assertMatchesReference(self, spec, start, end, engines=ENGINES):
+        expected = reference_cost(spec, start, end)
+        for engine in engines:
+            with self.subTest(engine=engine, start=start, end=end):
+                if expected is None:
+                    self.assertRaises(ValueError, find_path, spec, start, end, engine)
+                    continue
+                result = find_path(spec, start, end, engine)
+                self.assertAlmostEqual(result.cost, expected, delta=COST_TOLERANCE * max(1, expected))
+                self.assertEqual(result.pixels[0], start)
+                self.assertEqual(result.pixels[-1], end)
+                self.assertAlmostEqual(path_cost(spec, result.pixels), result.cost,
+                                       delta=COST_TOLERANCE * max(1, expected))
+        return expected
+
+    def assertFootprintCoversPath(self, result):
+        """Every pixel of the path was closed, with its accumulated cost, and
+        the end's is the path's cost."""
+        for x, y in path_pixels(result.pixels):
+            self.assertTrue(np.isfinite(result.footprint[y, x]), (x, y))
+        end = result.pixels[-1]
+        self.assertAlmostEqual(result.footprint[end[1], end[0]], result.cost,
+                               delta=COST_TOLERANCE * max(1, result.cost))
+
+    def test_random_layers(self):
+        """Engines match the reference with layer traversability and cost."""
+        rng = np.random.default_rng(35)
+        for _ in range(RANDOM_TRIALS):
+            inp_arrs, start, end = random_problem(rng)
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1,
+                               traversability_max=float(rng.integers(5, 10)), cost_layer=1)
+            self.assertMatchesReference(spec, start, end)
+
+    def test_random_expressions(self):
+        """Engines match the reference with random formulas, which also checks
+        the per-pixel and whole-array formula evaluation agree."""
+        rng = np.random.default_rng(36)
+        variables = ['x', 'y', 'val1', 'val2']
+        for _ in range(RANDOM_TRIALS):
+            inp_arrs, start, end = random_problem(rng)
+            # Squaring keeps every cost at least 1, where the reference A* is optimal
+            cost_expression = '1 + {} ** 2'.format(random_expression(rng, variables, 3))
+            traversability_expression = '(val1 >= 1) * (1 + {} ** 2)'.format(random_expression(rng, variables, 2))
+            spec = SurfaceSpec(inp_arrs, traversability_expression=traversability_expression,
+                               cost_expression=cost_expression)
+            with self.subTest(cost=cost_expression, traversability=traversability_expression):
+                self.assertMatchesReference(spec, start, end)
+
+    def test_costs_below_one(self):
+        """Delta-stepping stays exact when costs below 1 make the Manhattan
+        heuristic inadmissible; the A* engines still return valid paths, no
+        cheaper than the optimum."""
+        rng = np.random.default_rng(37)
+        for _ in range(RANDOM_TRIALS):
+            inp_arrs, start, end = random_problem(rng)
+            inp_arrs[1] = inp_arrs[1] / 10
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1)
+            optimum = reference_dijkstra(spec, start)[end[1], end[0]]
+            if math.isinf(optimum):
+                continue
+            self.assertAlmostEqual(find_path(spec, start, end, ENGINE_DELTA_STEPPING).cost, optimum,
+                                   delta=COST_TOLERANCE)
+            for engine in [ENGINE_PYTHON] + ([ENGINE_NUMBA] if NUMBA_AVAILABLE else []):
+                result = find_path(spec, start, end, engine)
+                self.assertGreaterEqual(result.cost, optimum - COST_TOLERANCE)
+                self.assertAlmostEqual(path_cost(spec, result.pixels), result.cost, delta=COST_TOLERANCE)
+
+    def test_eikonal_bounds(self):
+        """The continuous route is never dearer than the grid path, and a
+        4-connected path is at most a factor sqrt(2) longer than the route it
+        approximates."""
+        rng = np.random.default_rng(38)
+        for _ in range(RANDOM_TRIALS):
+            inp_arrs, start, end = random_problem(rng)
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1)
+            grid_cost = reference_cost(spec, start, end)
+            if grid_cost is None or start == end:
+                continue
+            result = find_eikonal_path(spec, (start[0] + 0.5, start[1] + 0.5), (end[0] + 0.5, end[1] + 0.5))
+            self.assertLessEqual(result.cost, grid_cost + COST_TOLERANCE)
+            self.assertGreaterEqual(result.cost, grid_cost / math.sqrt(2) - COST_TOLERANCE)
+
+    def test_cost_distance(self):
+        """Cost-distance surfaces from several sources match the reference."""
+        rng = np.random.default_rng(39)
+        for _ in range(RANDOM_TRIALS // 4):
+            inp_arrs, start, end = random_problem(rng)
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1)
+            sources = [start, end]
+            expected, _ = cost_distance(spec, sources, ENGINE_PYTHON)
+            for engine in ENGINES:
+                actual, _ = cost_distance(spec, sources, engine)
+                np.testing.assert_allclose(actual, expected, rtol=COST_TOLERANCE)
+
+    def test_initial_heuristic(self):
+        """Every engine starts from the smallest heuristic of its sources, which
+        the progress reported by run_search is measured against."""
+        spec = SurfaceSpec([np.ones((10, 10))], cost_layer=0)
+        sources, end = [(0, 0), (7, 8), (9, 0)], (9, 9)
+        for engine in [ENGINE_PYTHON] + ENGINES:
+            with self.subTest(engine=engine):
+                search = pathfinder_core.create_search(engine, spec, None, sources, end)
+                self.assertEqual(search.min_heuristic, 3)
+
+    def test_default_delta(self):
+        """Delta-stepping's default bucket width is the mean of the finite
+        step costs into traversable pixels."""
+        from ..delta_stepping import DeltaSteppingSearch
+        rng = np.random.default_rng(41)
+        cost = rng.uniform(0.5, 4, (4, 12, 15))
+        cost[rng.random(cost.shape) < 0.1] = np.inf
+        mask = rng.random((12, 15)) < 0.7
+        search = DeltaSteppingSearch(cost, mask, [(0, 0)])
+        traversable = cost[:, mask]
+        self.assertAlmostEqual(search.delta, traversable[np.isfinite(traversable)].mean())
+
+        search = DeltaSteppingSearch(cost, np.zeros((12, 15), bool), [(0, 0)])
+        self.assertEqual(search.delta, 1.0)
+
+    def test_sparse_state(self):
+        """The Python engine finds the same costs with the sparse state it
+        uses when full state arrays do not fit in the memory budget."""
+        rng = np.random.default_rng(40)
+        for _ in range(RANDOM_TRIALS // 4):
+            inp_arrs, start, end = random_problem(rng)
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1)
+            expected = reference_dijkstra(spec, start)
+            search = PythonSearch(spec.is_traversable, spec.get_cost, spec.grid_width, spec.grid_height, [start],
+                                  sparse=True)
+            run_search(search)
+            for (y, x), cost in search.cost_so_far.items():
+                self.assertAlmostEqual(cost, expected[y, x], delta=COST_TOLERANCE)
+            self.assertEqual(len(search.cost_so_far), np.count_nonzero(np.isfinite(expected)))
+
+    def test_compaction(self):
+        """A memory budget that is only met by dropping stale frontier entries
+        leaves the path and its cost unchanged."""
+        rng = np.random.default_rng(32)
+        # A cup facing the start traps the search, and steps cheaper than the heuristic make it reopen pixels on
+        # the way out, which leaves many stale frontier entries
+        mask = np.ones((30, 30))
+        mask[5:26, 20] = mask[5, 8:21] = mask[25, 8:21] = 0
+        spec = SurfaceSpec([mask, rng.uniform(0.3, 1.3, (30, 30))], traversability_layer=0, traversability_min=1,
+                           cost_layer=1)
+        start, end = (0, 15), (29, 15)
+        engines = [(ENGINE_PYTHON, PythonSearch)] + \
+            ([(ENGINE_NUMBA, numba_search.NumbaSearch)] if NUMBA_AVAILABLE else [])
+        for engine, search_class in engines:
+            with self.subTest(engine=engine), mock.patch.object(search_class, "STEP_SIZE", 5), \
+                    mock.patch.object(numba_search, "INITIAL_HEAP_SIZE", 4):
+                expected = find_path(spec, start, end, engine)
+
+                # The smallest budget which compaction always gets back under, and the largest memory between steps
+                search = pathfinder_core.create_search(engine, spec, None, [start], end)
+                compacted_bytes = peak_bytes = 0
+                while True:
+                    status = search.step(search.STEP_SIZE)
+                    compacted = copy.deepcopy(search)
+                    compacted.compact()
+                    compacted_bytes = max(compacted_bytes, compacted.memory_bytes())
+                    peak_bytes = max(peak_bytes, search.memory_bytes())
+                    if status != pathfinder_core.PAUSED:
+                        break
+                budget = compacted_bytes / pathfinder_core.COMPACTION_TARGET
+                self.assertGreater(peak_bytes, budget)
+
+                with mock.patch.object(search_class, "compact", autospec=True,
+                                       side_effect=search_class.compact) as compact:
+                    result = find_path(spec, start, end, engine, memory_budget=budget)
+                self.assertTrue(compact.called)
+                self.assertEqual(result.pixels, expected.pixels)
+                self.assertAlmostEqual(result.cost, expected.cost, delta=COST_TOLERANCE)
+                self.assertEqual(result.counters["expansions"], expected.counters["expansions"])
+
+    def test_budget_error_translation(self):
+        """A search over its memory budget reaches the user as a translated
+        RuntimeError carrying the budget report, as the algorithms raise it."""
+        spec = SurfaceSpec([np.ones((200, 200))], cost_layer=0)
+        with self.assertRaises(MemoryBudgetExceeded) as raised:
+            find_path(spec, (0, 0), (199, 199), ENGINE_PYTHON, memory_budget=1e4)
+        error = translated_error(raised.exception, lambda message: 'translated: ' + message)
+        self.assertIs(type(error), RuntimeError)
+        self.assertEqual(str(error), 'translated: ' + str(raised.exception))
+        self.assertIn('Memory budget of', str(error))
+        self.assertIs(type(translated_error(ValueError('No path found'), str)), ValueError)
+
+    def test_tenbytenraster(self):
+        """Engines match the reference on the 10x10 test raster, whose values
+        rise from 0 to 9 across each row."""
+        values = read_ascii_grid(TENBYTEN_PATH)
+        self.assertEqual(values.shape, (10, 10))
+        spec = SurfaceSpec([values], traversability_layer=0, traversability_min=1, cost_expression='1 + val1')
+        # Column 0 is untraversable, so the cheapest path runs down column 1,
+        # then enters each of columns 2 to 9 once
+        cost = self.assertMatchesReference(spec, (1, 0), (9, 9))
+        self.assertAlmostEqual(cost, 9 * (1 + 1) + sum(1 + v for v in range(2, 10)))
+        self.assertMatchesReference(spec, (5, 5), (2, 8))
+        self.assertRaises(ValueError, find_path, spec, (0, 0), (9, 9))
+
+    def test_band_variables(self):
+        """Further bands are named valN_B, and only the bands the options refer
+        to are listed for loading."""
+        rng = np.random.default_rng(41)
+        inp_arrs, start, end = random_problem(rng)
+        expression = '1 + (val2 - 1) * 2 + val1_1 * 0'
+        self.assertEqual(referenced_bands(cost_expression=expression), {(0, 1), (1, 1)})
+        self.assertEqual(referenced_bands(traversability_layer=0, traversability_expression='val3 > 1',
+                                          cost_expression='val2_3 * x'), {(0, 1), (1, 3)})
+        # Constant subexpressions are folded when parsed
+        self.assertEqual(formula_variables(parse_formula('2 * 3 + val1')), {'val1'})
+        self.assertIsInstance(parse_formula('2 * 3 - 1').body, ast.Constant)
+
+        expected = find_path(SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1,
+                                         cost_expression=expression), start, end, ENGINE_PYTHON).cost
+        # The same surface, with input 2's values in band 3 of input 1 and no band 1 of input 2
+        spec = SurfaceSpec(bands={(0, 1): inp_arrs[0], (0, 3): inp_arrs[1]}, traversability_layer=0,
+                           traversability_min=1, cost_expression=expression.replace('val2', 'val1_3'))
+        for engine in [ENGINE_PYTHON] + ENGINES:
+            self.assertAlmostEqual(find_path(spec, start, end, engine).cost, expected, delta=COST_TOLERANCE)
+
+    def test_compiled_formulas(self):
+        """Compiled per-pixel formulas match the interpreter, values and errors
+        alike."""
+        rng = np.random.default_rng(42)
+        inp_arrs, _, _ = random_problem(rng)
+        spec = SurfaceSpec(inp_arrs)
+        arrays = dict(spec.band_variables)
+        height, width = inp_arrs[0].shape
+        for trial in range(RANDOM_TRIALS):
+            expression = random_expression(rng, ['val1', 'val2', 'x', 'y'], 4)
+            node = parse_formula(expression)
+            evaluate = compile_pixel_formula(expression, node, arrays)
+            with self.subTest(expression=expression):
+                for x, y in zip(rng.integers(width, size=8), rng.integers(height, size=8)):
+                    expected = evaluate_formula(expression, spec.get_expression_vars((x, y)), node)
+                    self.assertEqual(evaluate(int(x), int(y)), expected)
+
+        for expression in ('val9 + 1', '"a" + 1', 'val1 % 2', 'val1 / (x - x)', 'val1 < 2 < val2 and 1'):
+            with self.subTest(expression=expression):
+                try:
+                    node = parse_formula(expression)
+                except FormulaSyntaxError:
+                    continue
+                with self.assertRaises(FormulaError) as interpreted:
+                    evaluate_formula(expression, spec.get_expression_vars((0, 0)), node)
+                with self.assertRaises(type(interpreted.exception)) as compiled:
+                    compile_pixel_formula(expression, node, arrays)(0, 0)
+                self.assertEqual(str(compiled.exception), str(interpreted.exception))
+
+    def test_lookup_tables(self):
+        """Expressions over 8 and 16-bit bands evaluate through a lookup table
+        to the same surfaces as over the bands' float values."""
+        rng = np.random.default_rng(43)
+        for dtypes in ([np.uint8], [np.int8], [np.uint16], [np.int16], [np.uint8, np.int8]):
+            for _ in range(RANDOM_TRIALS // 4):
+                height, width = (int(v) for v in rng.integers(2, 300, 2))
+                info = [np.iinfo(dtype) for dtype in dtypes]
+                inp_arrs = [rng.integers(i.min, i.max, (height, width), endpoint=True).astype(dtype)
+                            for i, dtype in zip(info, dtypes)]
+                variables = ['val{}'.format(i + 1) for i in range(len(dtypes))] + ['val1_1']
+                cost_expression = '1 + {} ** 2'.format(random_expression(rng, variables, 3))
+                traversability_expression = random_expression(rng, variables, 2)
+                spec = SurfaceSpec(inp_arrs, traversability_expression=traversability_expression,
+                                   cost_expression=cost_expression)
+                float_spec = SurfaceSpec([arr.astype(np.float64) for arr in inp_arrs],
+                                         traversability_expression=traversability_expression,
+                                         cost_expression=cost_expression)
+                with self.subTest(dtypes=dtypes, cost=cost_expression, traversability=traversability_expression):
+                    inputs = {referenced[0] for referenced in referenced_bands(cost_expression=cost_expression)}
+                    uses_table = bool(inputs) and \
+                        256 ** sum(inp_arrs[i].dtype.itemsize for i in inputs) <= height * width
+                    self.assertEqual(spec.lookup_table(cost_expression, spec.cost_expression) is not None,
+                                     uses_table)
+                    with np.errstate(all='ignore'):
+                        np.testing.assert_array_equal(spec.build_cost(), float_spec.build_cost())
+                        np.testing.assert_array_equal(spec.build_mask(), float_spec.build_mask())
+
+        # The coordinates, float bands and oversized tables are evaluated over the grid
+        inp_arrs = [np.zeros((300, 300), np.uint16), np.zeros((300, 300), np.uint8), np.zeros((300, 300))]
+        spec = SurfaceSpec(inp_arrs)
+        for expression in ('val2 + x', 'val2 + val3', 'val1 + val2', '3 + 4'):
+            self.assertIsNone(spec.lookup_table(expression, parse_formula(expression)))
+
+    def test_block_evaluation(self):
+        """Surfaces evaluated block by block on several threads, from bands
+        read on demand and into a memory-mapped output, match the whole-grid
+        evaluation."""
+        rng = np.random.default_rng(44)
+        blocks = 0
+        with mock.patch.object(pathfinder_core, 'BLOCK_PIXELS', 64), tempfile.TemporaryDirectory() as directory:
+            for trial in range(RANDOM_TRIALS // 4):
+                inp_arrs, start, end = random_problem(rng, max_size=60)
+                inp_arrs.append(rng.integers(0, 4, inp_arrs[0].shape).astype(np.uint8))
+                cost_expression = '1 + {} ** 2'.format(random_expression(rng, ['x', 'y', 'val1', 'val2'], 3))
+                options = dict(traversability_expression='(val1 >= 1) * (val3 != 2)', cost_expression=cost_expression)
+                spec = SurfaceSpec(inp_arrs, **options)
+                streamed = SurfaceSpec([RowReader(arr, int(rng.integers(1, 4))) for arr in inp_arrs], **options)
+                self.assertFalse(streamed.in_memory)
+                blocks += len(streamed.block_slices())
+
+                with self.subTest(cost=cost_expression):
+                    path = os.path.join(directory, 'cost{}.npy'.format(trial))
+                    out = np.lib.format.open_memmap(path, 'w+', np.float64, inp_arrs[0].shape)
+                    self.assertIs(streamed.build_cost(out=out, workers=4), out)
+                    out.flush()
+                    np.testing.assert_array_equal(np.load(path), spec.build_cost(workers=1))
+                    np.testing.assert_array_equal(streamed.build_mask(workers=4), spec.build_mask(workers=1))
+                    del out
+                    for engine in [ENGINE_PYTHON] + ENGINES:
+                        self.assertEqual(find_path(streamed, start, end, engine).cost
+                                         if reference_cost(spec, start, end) is not None else None,
+                                         reference_cost(spec, start, end))
+        self.assertGreater(blocks, 5 * RANDOM_TRIALS // 4)
+
+    def test_direction_costs(self):
+        """Engines match a Dijkstra search which works out each step's cost
+        from the elevations on the fly, for Tobler's function and a custom
+        slope expression."""
+        rng = np.random.default_rng(45)
+        slope_expression = 'cost * (1 + (slope > 0) * slope * 4) + (dz < -1) * 2'
+
+        def step_cost(dem, base, pixel_size, expression, current, next_pos):
+            dx = next_pos[0] - current[0]
+            dz = dem[next_pos[1], next_pos[0]] - dem[current[1], current[0]]
+            slope = dz / (pixel_size[0] if dx else pixel_size[1])
+            cost = base[next_pos[1], next_pos[0]]
+            if expression:
+                return cost * (1 + (slope > 0) * slope * 4) + (dz < -1) * 2
+            return cost * math.exp(3.5 * abs(slope + 0.05))
+
+        for trial in range(RANDOM_TRIALS // 2):
+            inp_arrs, start, end = random_problem(rng)
+            dem = np.cumsum(rng.normal(0, 1, inp_arrs[0].shape), axis=int(rng.integers(2)))
+            inp_arrs.append(dem)
+            pixel_size = tuple(float(v) for v in rng.uniform(2, 30, 2))
+            expression = slope_expression if trial % 2 else ''
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1,
+                               dem_layer=2, slope_expression=expression, pixel_size=pixel_size)
+            self.assertEqual(spec.build_cost().shape, (4,) + dem.shape)
+            self.assertEqual(referenced_bands(**spec.surface_options['cost']), {(1, 1), (2, 1)})
+
+            distance = {start: 0.0}
+            frontier = [(0.0, start)]
+            while frontier:
+                current_cost, current = heapq.heappop(frontier)
+                if current_cost > distance[current]:
+                    continue
+                for dx, dy in NEIGHBORS:
+                    next_pos = (current[0] + dx, current[1] + dy)
+                    if not (0 <= next_pos[0] < dem.shape[1] and 0 <= next_pos[1] < dem.shape[0]) or \
+                            not spec.is_traversable(next_pos):
+                        continue
+                    new_cost = current_cost + step_cost(dem, inp_arrs[1], pixel_size, expression, current, next_pos)
+                    if new_cost < distance.get(next_pos, np.inf):
+                        distance[next_pos] = new_cost
+                        heapq.heappush(frontier, (new_cost, next_pos))
+
+            for engine in [ENGINE_PYTHON] + ENGINES:
+                with self.subTest(trial=trial, engine=engine):
+                    if end not in distance:
+                        self.assertRaises(ValueError, find_path, spec, start, end, engine)
+                        continue
+                    self.assertAlmostEqual(find_path(spec, start, end, engine).cost, distance[end],
+                                           delta=COST_TOLERANCE * max(1, distance[end]))
+
+        self.assertRaises(ValueError, find_eikonal_path, spec, start, end)
+
+    def test_clearance(self):
+        """Clearance and proximity costs match a brute-force search for the
+        nearest untraversable pixel, with and without SciPy, and engines
+        agree on the resulting surfaces."""
+        from .. import clearance
+        rng = np.random.default_rng(46)
+        for trial in range(RANDOM_TRIALS // 2):
+            inp_arrs, start, end = random_problem(rng)
+            pixel_size = tuple(float(v) for v in rng.uniform(0.5, 3, 2))
+            min_clearance = float(rng.uniform(0, 4)) if trial % 2 else 0.0
+            proximity_cost, proximity_distance = float(rng.uniform(0, 5)), float(rng.uniform(0, 8))
+
+            traversable = inp_arrs[0] >= 1
+            ys, xs = np.nonzero(~traversable)
+            rows, cols = np.mgrid[:traversable.shape[0], :traversable.shape[1]]
+            nearest = np.sqrt(((cols[..., np.newaxis] - xs) * pixel_size[0]) ** 2 +
+                              ((rows[..., np.newaxis] - ys) * pixel_size[1]) ** 2).min(axis=-1, initial=np.inf)
+            expected_mask = traversable & (nearest >= min_clearance)
+            expected_cost = inp_arrs[1] + proximity_cost * np.clip(1 - nearest / proximity_distance, 0, 1)
+
+            for ndimage in (clearance.ndimage, None):
+                with self.subTest(trial=trial, scipy=ndimage is not None), \
+                        mock.patch.object(clearance, 'ndimage', ndimage):
+                    spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1,
+                                       pixel_size=pixel_size, min_clearance=min_clearance,
+                                       proximity_cost=proximity_cost, proximity_distance=proximity_distance)
+                    np.testing.assert_array_equal(spec.build_mask(), expected_mask)
+                    np.testing.assert_allclose(spec.build_cost(), expected_cost)
+                    self.assertEqual(spec.is_traversable(start), bool(expected_mask[start[1], start[0]]))
+            self.assertEqual(referenced_bands(**spec.surface_options['cost']), {(0, 1), (1, 1)})
+            self.assertMatchesReference(spec, start, end)
+
+        # Obstacles are measured in map units, so the clearance depends on the pixel size
+        mask = np.ones((5, 9), bool)
+        mask[2, 0] = False
+        spec = SurfaceSpec([mask.astype(np.uint8)], traversability_layer=0, traversability_min=1,
+                           pixel_size=(2.0, 1.0), min_clearance=4)
+        self.assertEqual(spec.build_mask()[2].tolist(), [False, False, True] + [True] * 6)
+        self.assertEqual(spec.build_mask()[0].tolist(), [False, False, True] + [True] * 6)
+
+    def test_valid_masks(self):
+        """Pixels which any band marks as nodata are untraversable, whether
+        the masks are in memory or read block by block."""
+        rng = np.random.default_rng(47)
+        for trial in range(RANDOM_TRIALS // 2):
+            inp_arrs, start, end = random_problem(rng)
+            height, width = inp_arrs[0].shape
+            # An empty border, as around a reprojected raster, and scattered nodata pixels in the cost band
+            border = np.zeros((height, width), bool)
+            border[int(rng.integers(height // 2 + 1)):, int(rng.integers(width // 2 + 1)):] = True
+            holes = rng.random((height, width)) > 0.1
+            valid_masks = {(0, 1): border, (1, 1): holes}
+            if trial % 2:
+                valid_masks = {key: RowReader(mask, 3) for key, mask in valid_masks.items()}
+
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1,
+                               valid_masks=valid_masks)
+            expected = (inp_arrs[0] >= 1) & border & holes
+            with self.subTest(trial=trial):
+                np.testing.assert_array_equal(spec.build_mask(), expected)
+                self.assertEqual(spec.is_traversable(start), bool(expected[start[1], start[0]]))
+                self.assertEqual(referenced_bands(**spec.surface_options['mask']), {(0, 1), (1, 1)})
+            self.assertMatchesReference(spec, start, end)
+
+    def test_windows(self):
+        """A window of a spec evaluates to the same window of its surfaces,
+        including coordinates, clearances, terrain costs and nodata."""
+        rng = np.random.default_rng(48)
+        for trial in range(RANDOM_TRIALS // 2):
+            inp_arrs, _, _ = random_problem(rng)
+            height, width = inp_arrs[0].shape
+            inp_arrs.append(np.cumsum(rng.normal(0, 1, (height, width)), axis=0))
+            options = dict(traversability_expression='(val1 >= 1) * (x + y != 7)',
+                           cost_expression='val2 + x * 0.1', pixel_size=(1.5, 1.0),
+                           min_clearance=float(rng.uniform(0, 3)), proximity_cost=2.0, proximity_distance=3.0,
+                           dem_layer=2 if trial % 2 else None)
+            valid_masks = {(1, 1): rng.random((height, width)) > 0.05}
+            bands = {(i, 1): RowReader(arr, 2) if trial % 3 == 0 else arr for i, arr in enumerate(inp_arrs)}
+            spec = SurfaceSpec(bands=bands, valid_masks=valid_masks, **options)
+
+            rows = slice(int(rng.integers(height)), None)
+            rows = slice(rows.start, int(rng.integers(rows.start + 1, height + 1)))
+            columns = slice(int(rng.integers(width)), None)
+            columns = slice(columns.start, int(rng.integers(columns.start + 1, width + 1)))
+            window = spec.window(rows, columns)
+            with self.subTest(trial=trial):
+                self.assertEqual((window.grid_height, window.grid_width),
+                                 (rows.stop - rows.start, columns.stop - columns.start))
+                np.testing.assert_array_equal(window.build_mask(), spec.build_mask()[rows, columns])
+                expected_cost = spec.build_cost()[..., rows, columns].copy()
+                if spec.directional:
+                    # Within a window, steps from outside it cost inf like steps from outside the grid
+                    for direction, (dx, dy) in enumerate(NEIGHBORS):
+                        if dy:
+                            expected_cost[direction, 0 if dy > 0 else -1, :] = np.inf
+                        if dx:
+                            expected_cost[direction, :, 0 if dx > 0 else -1] = np.inf
+                np.testing.assert_allclose(window.build_cost(), expected_cost)
+                pos = (int(rng.integers(window.grid_width)), int(rng.integers(window.grid_height)))
+                self.assertEqual(window.is_traversable(pos),
+                                 spec.is_traversable((pos[0] + columns.start, pos[1] + rows.start)))
+
+    def test_region(self):
+        """Searches restricted to a region only search its bounding window,
+        and match the reference over the whole grid with the region applied
+        to the traversability."""
+        rng = np.random.default_rng(49)
+        for trial in range(RANDOM_TRIALS // 2):
+            inp_arrs, start, end = random_problem(rng)
+            height, width = inp_arrs[0].shape
+            # A region from a window which may hang over the edges of the grid, and covers both endpoints in every
+            # other trial
+            if trial % 2:
+                x_offset, y_offset = int(rng.integers(-3, width // 2 + 1)), int(rng.integers(-3, height // 2 + 1))
+                region_shape = (int(rng.integers(1, height + 4)), int(rng.integers(1, width + 4)))
+            else:
+                x_offset = min(start[0], end[0]) - int(rng.integers(0, 4))
+                y_offset = min(start[1], end[1]) - int(rng.integers(0, 4))
+                region_shape = (max(start[1], end[1]) - y_offset + int(rng.integers(1, 4)),
+                                max(start[0], end[0]) - x_offset + int(rng.integers(1, 4)))
+            region_mask = rng.random(region_shape) > 0.1
+            for x, y in (start, end):
+                if 0 <= y - y_offset < region_shape[0] and 0 <= x - x_offset < region_shape[1]:
+                    region_mask[y - y_offset, x - x_offset] = True
+            region = Region(region_mask, x_offset, y_offset)
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1, region=region)
+
+            expected = np.zeros((height, width), bool)
+            for y, x in zip(*np.nonzero(region_mask)):
+                if 0 <= y + y_offset < height and 0 <= x + x_offset < width:
+                    expected[y + y_offset, x + x_offset] = True
+            np.testing.assert_array_equal(spec.build_mask(), expected & (inp_arrs[0] >= 1))
+            reference = SurfaceSpec.from_surfaces(inp_arrs[1], expected & (inp_arrs[0] >= 1))
+
+            bounds = region.bounds(height, width)
+            inside = bounds is not None and all(bounds[1].start <= p[0] < bounds[1].stop and
+                                                bounds[0].start <= p[1] < bounds[0].stop for p in (start, end))
+            for engine in [ENGINE_PYTHON] + ENGINES:
+                with self.subTest(trial=trial, engine=engine):
+                    expected_cost = reference_cost(reference, start, end)
+                    if not inside or expected_cost is None:
+                        self.assertRaises(ValueError, find_path, spec, start, end, engine)
+                        continue
+                    result = find_path(spec, start, end, engine, keep_footprint=True)
+                    self.assertAlmostEqual(result.cost, expected_cost, delta=COST_TOLERANCE * max(1, expected_cost))
+                    self.assertEqual((result.pixels[0], result.pixels[-1]), (start, end))
+                    self.assertAlmostEqual(path_cost(reference, result.pixels), result.cost,
+                                           delta=COST_TOLERANCE * max(1, expected_cost))
+                    # The state arrays cover the region's bounding window only
+                    self.assertEqual(result.cost_so_far.shape, (bounds[0].stop - bounds[0].start,
+                                                                bounds[1].stop - bounds[1].start))
+                    self.assertEqual(result.origin, (bounds[1].start, bounds[0].start))
+                    self.assertEqual(result.footprint.shape, (height, width))
+                    self.assertFootprintCoversPath(result)
+
+    def test_footprint(self):
+        """The footprint holds the accumulated cost of exactly the pixels the
+        search closed, which include the start, the end and the whole path."""
+        rng = np.random.default_rng(34)
+        for trial in range(RANDOM_TRIALS // 2):
+            inp_arrs, start, end = random_problem(rng)
+            spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=1, cost_layer=1)
+            if reference_cost(spec, start, end) is None:
+                continue
+            for engine in [ENGINE_PYTHON] + ENGINES:
+                with self.subTest(trial=trial, engine=engine):
+                    result = find_path(spec, start, end, engine, keep_footprint=True)
+                    self.assertFootprintCoversPath(result)
+                    self.assertEqual(result.footprint[start[1], start[0]], 0)
+
+                    search = pathfinder_core.create_search(engine, spec, None, [start], end)
+                    run_search(search)
+                    closed = search.closed_mask()
+                    np.testing.assert_array_equal(np.isfinite(result.footprint), closed)
+                    np.testing.assert_array_equal(result.footprint[closed], np.asarray(search.cost_so_far)[closed])
+
+    def test_search_window(self):
+        """Searches of a growing window around the endpoints match the reference over the whole grid."""
+        rng = np.random.default_rng(50)
+        for trial in range(RANDOM_TRIALS):
+            inp_arrs, start, end = random_problem(rng, max_size=40)
+            options = dict(traversability_layer=0, traversability_min=1, cost_layer=1)
+            if trial % 4 == 3:
+                options.update(proximity_cost=3.0, proximity_distance=2.0)
+            spec = SurfaceSpec(inp_arrs, **options)
+            expected = reference_cost(spec, start, end)
+            margin = int(rng.integers(0, 4))
+            for engine in [ENGINE_PYTHON] + ENGINES:
+                with self.subTest(trial=trial, engine=engine, margin=margin):
+                    if expected is None:
+                        self.assertRaises(ValueError, find_path, spec, start, end, engine, window_margin=margin)
+                        continue
+                    result = find_path(spec, start, end, engine, window_margin=margin, keep_footprint=True)
+                    self.assertAlmostEqual(result.cost, expected, delta=COST_TOLERANCE * max(1, expected))
+                    self.assertEqual((result.pixels[0], result.pixels[-1]), (start, end))
+                    self.assertAlmostEqual(path_cost(spec, result.pixels), result.cost,
+                                           delta=COST_TOLERANCE * max(1, expected))
+                    self.assertEqual(result.footprint.shape, spec.build_mask().shape)
+                    self.assertFootprintCoversPath(result)
+
+    def test_search_window_checks(self):
+        """A windowed search only rejects endpoints its first window proves are
+        disconnected, and passes each warning on once however often the
+        window grows."""
+        mask = np.ones((30, 30))
+        # The start is walled in, and a wall between the other endpoints makes the path leave the first window
+        mask[3:8, 3] = mask[3:8, 7] = mask[3, 3:8] = mask[7, 3:8] = 0
+        mask[5:26, 17] = 0
+        spec = SurfaceSpec([mask, np.full((30, 30), 0.5)], traversability_layer=0, traversability_min=1,
+                           cost_layer=1)
+        with mock.patch.object(pathfinder_core, "create_search") as create_search:
+            with self.assertRaisesRegex(ValueError, "not connected"):
+                find_path(spec, (5, 5), (12, 12), ENGINE_PYTHON, window_margin=2)
+            create_search.assert_not_called()
+
+        expected = reference_cost(spec, (15, 15), (20, 15))
+        for engine in [ENGINE_PYTHON] + ENGINES:
+            with self.subTest(engine=engine):
+                messages = []
+                result = find_path(spec, (15, 15), (20, 15), engine, window_margin=1, on_message=messages.append)
+                self.assertAlmostEqual(result.cost, expected, delta=COST_TOLERANCE)
+                self.assertGreater(sum(message.startswith("Searching a window") for message in messages), 1)
+                warnings = [message for message in messages if message.startswith("[WARNING]")]
+                self.assertEqual(len(warnings), 1)
+                self.assertIn("less than 1", warnings[0])
+
+    def test_search_window_reads(self):
+        """A route across a small part of a large grid only reads a window around it."""
+        rows_read = []
+
+        class CountingReader(RowReader):
+            def __getitem__(self, key):
+                window = super().__getitem__(key)
+                rows_read.append(window.size)
+                return window
+
+        rng = np.random.default_rng(51)
+        cost = rng.uniform(1, 2, (400, 300))
+        spec = SurfaceSpec(bands={(0, 1): CountingReader(cost, 16)}, cost_expression='val1')
+        expected = reference_cost(SurfaceSpec([cost], cost_layer=0), (140, 200), (160, 230))
+        result = find_path(spec, (140, 200), (160, 230), ENGINE_DELTA_STEPPING, window_margin=8)
+        self.assertAlmostEqual(result.cost, expected, delta=COST_TOLERANCE * expected)
+        self.assertLess(sum(rows_read), cost.size / 10)
+
+    def test_neighbor_order(self):
+        """Direction codes index NEIGHBORS, which the compiled and vectorized
+        engines mirror."""
+        from ..pathfinder_core import NEIGHBOR_DX, NEIGHBOR_DY
+        self.assertEqual(list(zip(NEIGHBOR_DX, NEIGHBOR_DY)), list(NEIGHBORS))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(EngineDifferentialTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
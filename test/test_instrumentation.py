@@ -0,0 +1,112 @@
+# coding=utf-8
+"""Tests of the search counters, phase timings and profiles.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from .. import pathfinder_core
+from ..instrumentation import COUNTER_NAMES, PhaseTimer, search_counters, profiled
+from ..pathfinder_core import (ENGINE_PYTHON, ENGINE_NUMBA, ENGINE_DELTA_STEPPING, SurfaceSpec, find_path,
+                               run_search)
+from ..numba_search import NUMBA_AVAILABLE
+
+ENGINES = [ENGINE_PYTHON, ENGINE_DELTA_STEPPING] + ([ENGINE_NUMBA] if NUMBA_AVAILABLE else [])
+
+
+class InstrumentationTest(unittest.TestCase):
+    """Counts search work, times phases and writes profiles."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_corridor_counters(self):
+        """On a one pixel wide corridor A* expands every pixel but the end, and
+        delta-stepping settles the end too."""
+        spec = SurfaceSpec([np.ones((1, 6))], cost_layer=0)
+        expected = {
+            ENGINE_PYTHON: {"expansions": 5, "pushes": 6, "stale_pops": 0, "cost_evaluations": 9,
+                            "peak_frontier": 1},
+            ENGINE_DELTA_STEPPING: {"expansions": 6, "pushes": 6, "stale_pops": 0, "cost_evaluations": 10,
+                                    "peak_frontier": 1},
+        }
+        expected[ENGINE_NUMBA] = expected[ENGINE_PYTHON]
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result = find_path(spec, (0, 0), (5, 0), engine)
+                self.assertEqual(result.counters, expected[engine])
+                self.assertEqual(result.expansions, expected[engine]["expansions"])
+
+    def test_search_counters(self):
+        """find_path reports the counters of the search it ran."""
+        rng = np.random.default_rng(33)
+        inp_arrs = [rng.random((15, 20)), rng.uniform(1, 5, (15, 20))]
+        start, end = (0, 0), (19, 14)
+        inp_arrs[0][start[1], start[0]] = inp_arrs[0][end[1], end[0]] = 1
+        spec = SurfaceSpec(inp_arrs, traversability_layer=0, traversability_min=0.2, cost_layer=1)
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result = find_path(spec, start, end, engine)
+                search = pathfinder_core.create_search(engine, spec, spec.shared_mask(), [start], end)
+                run_search(search)
+                self.assertEqual(tuple(result.counters), COUNTER_NAMES)
+                self.assertEqual(result.counters, search_counters(search))
+                self.assertGreaterEqual(result.counters["pushes"], result.counters["expansions"])
+                self.assertGreater(result.counters["cost_evaluations"], 0)
+
+    def test_phase_timer(self):
+        timer = PhaseTimer()
+        with timer.phase("load"):
+            time.sleep(0.01)
+        with timer.phase("search"):
+            pass
+        with self.assertRaises(RuntimeError):
+            with timer.phase("load"):
+                raise RuntimeError()
+        self.assertEqual(list(timer.timings), ["load", "search"])
+        self.assertGreaterEqual(timer.timings["load"], 0.01)
+
+    def test_profiled(self):
+        """profiled writes cProfile statistics for .prof paths and a
+        tracemalloc snapshot otherwise."""
+        stats_path = os.path.join(self.directory, "run.prof")
+        with profiled(stats_path):
+            find_path(SurfaceSpec([np.ones((5, 5))], cost_layer=0), (0, 0), (4, 4), ENGINE_PYTHON)
+        stats = pstats.Stats(stats_path)
+        self.assertTrue(any(function[2] == "find_path" for function in stats.stats))
+
+        snapshot_path = os.path.join(self.directory, "run.tracemalloc")
+        with profiled(snapshot_path):
+            np.ones(1000)
+        self.assertIsInstance(tracemalloc.Snapshot.load(snapshot_path), tracemalloc.Snapshot)
+        self.assertFalse(tracemalloc.is_tracing())
+
+        with profiled(""):
+            pass
+        self.assertEqual(sorted(os.listdir(self.directory)), ["run.prof", "run.tracemalloc"])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(InstrumentationTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,135 @@
+# coding=utf-8
+"""Guards the plugin's startup cost.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+QGIS imports the plugin and registers its algorithms on every launch, so the
+modules it loads then must not import NumPy, GDAL or the search engines. Those
+are imported by the algorithms when they first run.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import ast
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from . import qgis
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_PACKAGE = __name__.rsplit('.', 2)[0]
+
+# Modules QGIS imports when it loads the plugin and registers the algorithms
+STARTUP_MODULES = ('__init__', 'image_pathfinder', 'image_pathfinder_provider')
+HEAVY_PACKAGES = ('numpy', 'osgeo', 'numba', 'scipy')
+ENGINE_MODULES = ('pathfinder_core', 'formulas', 'connectivity', 'numba_search', 'delta_stepping', 'fast_marching',
+                  'raster_io', 'route_jobs', 'route_tasks')
+# Seconds the plugin may add to QGIS startup, beyond importing qgis.core itself
+IMPORT_TIME_LIMIT = 0.25
+
+
+def is_type_checking(test):
+    return isinstance(test, ast.Attribute) and test.attr == 'TYPE_CHECKING' or \
+        isinstance(test, ast.Name) and test.id == 'TYPE_CHECKING'
+
+
+def module_level_imports(path):
+    """Lists the imports a module runs when it is imported, as (level, name)
+    pairs; imports inside functions and TYPE_CHECKING blocks only run later, if
+    ever."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+
+    imports = []
+
+    def visit(node):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            return
+        if isinstance(node, ast.If) and is_type_checking(node.test):
+            for child in node.orelse:
+                visit(child)
+            return
+        if isinstance(node, ast.Import):
+            imports.extend((0, alias.name) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module is None:
+                imports.extend((node.level, alias.name) for alias in node.names)
+            else:
+                imports.append((node.level, node.module))
+        for child in ast.iter_child_nodes(node):
+            visit(child)
+
+    visit(tree)
+    return imports
+
+
+def startup_import_graph():
+    """Follows the plugin's own imports from the startup modules, returning
+    every plugin module and external package reached."""
+    modules = set()
+    packages = set()
+    pending = list(STARTUP_MODULES)
+    while pending:
+        module = pending.pop()
+        if module in modules:
+            continue
+        modules.add(module)
+        for level, name in module_level_imports(os.path.join(PLUGIN_DIR, module + '.py')):
+            if level == 0:
+                packages.add(name.split('.')[0])
+            elif level == 1 and name:
+                pending.append(name.split('.')[0])
+    return modules, packages
+
+
+class LazyImportTest(unittest.TestCase):
+    """Checks loading the plugin leaves the heavy modules unimported."""
+
+    def test_startup_imports(self):
+        modules, packages = startup_import_graph()
+        self.assertIn('grid_pathfinder_algorithm', modules)
+        for package in HEAVY_PACKAGES:
+            self.assertNotIn(package, packages)
+        for module in ENGINE_MODULES:
+            self.assertNotIn(module, modules)
+
+    @unittest.skipIf(qgis is None, 'QGIS is not installed')
+    def test_import_time(self):
+        """Imports the provider and creates its algorithms in a fresh
+        interpreter, timing it after qgis.core is already loaded."""
+        script = (
+            'import json, sys, time\n'
+            'import qgis.core\n'
+            'started = time.perf_counter()\n'
+            'from {0}.image_pathfinder_provider import PathfinderProvider\n'
+            'from {0} import grid_pathfinder_algorithm, eikonal_pathfinder_algorithm, background_routes_algorithm\n'
+            'algorithms = [grid_pathfinder_algorithm.GridPathfinderAlgorithm(),\n'
+            '              eikonal_pathfinder_algorithm.EikonalPathfinderAlgorithm(),\n'
+            '              background_routes_algorithm.BackgroundRoutesAlgorithm()]\n'
+            'elapsed = time.perf_counter() - started\n'
+            'print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))\n'
+        ).format(PLUGIN_PACKAGE)
+        output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(PLUGIN_DIR),
+                                stdout=subprocess.PIPE, check=True).stdout
+        report = json.loads(output.decode().strip().splitlines()[-1])
+
+        loaded = {name.split('.')[0] for name in report['modules']}
+        for package in HEAVY_PACKAGES:
+            self.assertNotIn(package, loaded)
+        for module in ENGINE_MODULES:
+            self.assertNotIn('{}.{}'.format(PLUGIN_PACKAGE, module), report['modules'])
+        self.assertLess(report['elapsed'], IMPORT_TIME_LIMIT)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LazyImportTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,89 @@
+# coding=utf-8
+"""Tests of the stored query results.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..query_cache import QueryCache, input_fingerprint, query_key
+
+
+class QueryCacheTest(unittest.TestCase):
+    """Stores, finds and evicts query results."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key_ignores_order(self):
+        self.assertEqual(query_key({"a": 1, "b": [1, 2]}), query_key({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(query_key({"a": 1}), query_key({"a": 2}))
+
+    def test_fingerprint_changes_with_file(self):
+        raster = os.path.join(self.directory, "raster.asc")
+        with open(raster, "w") as f:
+            f.write("1")
+        before = input_fingerprint(raster)
+        with open(raster, "w") as f:
+            f.write("12")
+        self.assertNotEqual(before, input_fingerprint(raster))
+        self.assertEqual(input_fingerprint("missing.tif"), ("missing.tif", None, None))
+
+    def test_fingerprint_changes_with_tiles(self):
+        tiles = os.path.join(self.directory, "tiles")
+        os.mkdir(tiles)
+        with open(os.path.join(tiles, "n45e006.asc"), "w") as f:
+            f.write("1")
+        before = input_fingerprint(tiles)
+        # Rewriting a tile in place leaves the directory itself unchanged
+        with open(os.path.join(tiles, "n45e006.asc"), "w") as f:
+            f.write("12")
+        self.assertNotEqual(before, input_fingerprint(tiles))
+
+    def test_round_trip(self):
+        cache = QueryCache(self.path)
+        self.assertIsNone(cache.get("key"))
+        result = {"coordinates": [[0.5, 1.5], [2.5, 1.5]], "cost": 3.0}
+        cache.put("key", result)
+        self.assertEqual(QueryCache(self.path).get("key"), result)
+
+    def test_evicts_least_recently_used(self):
+        result = {"coordinates": [[0.0, 0.0]] * 10}
+        cache = QueryCache(self.path)
+        cache.put("size", result)
+        size = cache.total_bytes()
+
+        cache = QueryCache(self.path, max_bytes=size * 3)
+        for key in ("a", "b", "c"):
+            cache.put(key, result)
+        cache.get("a")
+        cache.put("d", result)
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertLessEqual(cache.total_bytes(), size * 3)
+
+        # A result too large for the cache on its own is not stored
+        cache.put("large", {"coordinates": [[0.0, 0.0]] * 100})
+        self.assertIsNone(cache.get("large"))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(QueryCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,163 @@
+# coding=utf-8
+"""Tests of reading rasters, mosaics and regions with GDAL.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    from osgeo import gdal
+except ImportError:
+    # raster_io needs GDAL, which the headless engine tests do without
+    gdal = None
+
+if gdal is not None:
+    from .. import raster_io
+
+
+def write_tile(path, arr, x_origin, y_origin):
+    """Writes a single band GeoTIFF with one unit pixels, whose top left corner is at (x_origin, y_origin)."""
+    height, width = arr.shape
+    dataset = gdal.GetDriverByName("GTiff").Create(path, width, height, 1, gdal.GDT_Float64)
+    dataset.SetGeoTransform((x_origin, 1, 0, y_origin, 0, -1))
+    dataset.GetRasterBand(1).WriteArray(arr)
+    dataset = None
+
+
+@unittest.skipIf(gdal is None, 'GDAL is not installed')
+class RasterIOTest(unittest.TestCase):
+    """Opens rasters, their validity masks and mosaics of tiles, and rasterizes search regions."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_mosaic_directory(self):
+        """A directory of tiles is read as one raster."""
+        tiles = os.path.join(self.directory, "tiles")
+        os.mkdir(tiles)
+        left = np.arange(6, dtype=np.float64).reshape(2, 3)
+        write_tile(os.path.join(tiles, "b.tif"), left + 10, 3, 2)
+        write_tile(os.path.join(tiles, "a.tif"), left, 0, 2)
+        with open(os.path.join(tiles, "readme.txt"), "w") as f:
+            f.write("not a tile")
+
+        self.assertEqual(raster_io.mosaic_tiles(tiles), [os.path.join(tiles, "a.tif"), os.path.join(tiles, "b.tif")])
+        self.assertIsNone(raster_io.mosaic_tiles(os.path.join(tiles, "a.tif")))
+
+        uri = raster_io.mosaic_uri(tiles)
+        self.assertTrue(uri.startswith("/vsimem/"))
+        self.assertEqual(raster_io.mosaic_uri(tiles), uri)
+        np.testing.assert_array_equal(raster_io.open_raster(tiles).GetRasterBand(1).ReadAsArray(),
+                                      np.hstack([left, left + 10]))
+
+        empty = os.path.join(self.directory, "empty")
+        os.mkdir(empty)
+        with self.assertRaises(ValueError):
+            raster_io.mosaic_uri(empty)
+
+    def test_mosaic_tile_index(self):
+        """A tile index is read as a mosaic of the tiles it lists, rebuilt
+        when one of them is rewritten."""
+        write_tile(os.path.join(self.directory, "a.tif"), np.zeros((2, 2)), 0, 2)
+        write_tile(os.path.join(self.directory, "b.tif"), np.ones((2, 2)), 2, 2)
+        index = os.path.join(self.directory, "index.geojson")
+        with open(index, "w") as f:
+            json.dump({"type": "FeatureCollection", "features": [
+                {"type": "Feature", "geometry": None, "properties": {raster_io.TILE_INDEX_FIELD: name}}
+                for name in ("a.tif", "b.tif")]}, f)
+
+        self.assertEqual(raster_io.mosaic_tiles(index), [os.path.join(self.directory, "a.tif"),
+                                                         os.path.join(self.directory, "b.tif")])
+        uri = raster_io.mosaic_uri(index)
+        self.assertEqual(raster_io.mosaic_uri(index), uri)
+
+        # The index is unchanged, but the rewritten tile is newer
+        tile = os.path.join(self.directory, "b.tif")
+        modified = os.stat(tile).st_mtime_ns
+        write_tile(tile, np.full((2, 2), 5.0), 2, 2)
+        os.utime(tile, ns=(modified + 10 ** 9, modified + 10 ** 9))
+        rewritten = raster_io.mosaic_uri(index)
+        self.assertNotEqual(rewritten, uri)
+        np.testing.assert_array_equal(raster_io.open_raster(index).GetRasterBand(1).ReadAsArray(),
+                                      [[0, 0, 5, 5], [0, 0, 5, 5]])
+
+    def test_valid_masks(self):
+        """Pixels holding the nodata value are invalid, whether the mask is
+        read into memory or on demand, and bands without nodata have no mask."""
+        arr = np.arange(20, dtype=np.float64).reshape(4, 5)
+        arr[1, 2] = arr[3, 0] = -9999
+        with_nodata = os.path.join(self.directory, "with_nodata.tif")
+        raster_io.write_raster(with_nodata, arr, (0, 1, 0, 4, 0, -1), "", nodata=-9999)
+        complete = os.path.join(self.directory, "complete.tif")
+        raster_io.write_raster(complete, arr, (0, 1, 0, 4, 0, -1), "")
+        expected = arr != -9999
+
+        self.assertTrue(raster_io.has_valid_mask(with_nodata))
+        self.assertFalse(raster_io.has_valid_mask(complete))
+
+        mask = raster_io.RasterValidMask(with_nodata)
+        self.assertEqual((mask.shape, mask.dtype), ((4, 5), np.dtype(bool)))
+        np.testing.assert_array_equal(mask[:], expected)
+        np.testing.assert_array_equal(mask[1:4, 1:3], expected[1:4, 1:3])
+        np.testing.assert_array_equal(mask[-1], expected[-1])
+
+        sources = {"with_nodata": (with_nodata, 1), "complete": (complete, 1)}
+        masks = raster_io.open_valid_masks(sources)
+        self.assertEqual(list(masks), ["with_nodata"])
+        np.testing.assert_array_equal(masks["with_nodata"], expected)
+        self.assertFalse(masks["with_nodata"].flags.writeable)
+        self.assertTrue(raster_io.open_valid_masks(sources, cached=False)["with_nodata"].flags.writeable)
+
+        streamed = raster_io.open_valid_masks(sources, streaming=True)
+        self.assertIsInstance(streamed["with_nodata"], raster_io.RasterValidMask)
+        np.testing.assert_array_equal(streamed["with_nodata"][2:4], expected[2:4])
+
+    def test_rasterize_region(self):
+        """Every pixel a region's geometries touch is inside it, and the mask
+        only covers their window of the grid."""
+        geotransform = (100, 2, 0, 50, 0, -2)
+        polygon = "POLYGON ((105 41, 109 41, 109 45, 105 45, 105 41))"
+        region = raster_io.rasterize_region([polygon], geotransform, (20, 30))
+        # The window of the polygon's envelope, widened by a pixel
+        self.assertEqual((region.x_offset, region.y_offset, region.mask.shape), (1, 1, (5, 5)))
+        inside = np.ones((20, 30), bool)
+        region.restrict(inside)
+        expected = np.zeros((20, 30), bool)
+        # x from 105 to 109 touches columns 2 to 4, and y from 45 down to 41 touches rows 2 to 4
+        expected[2:5, 2:5] = True
+        np.testing.assert_array_equal(inside, expected)
+
+        line = raster_io.rasterize_region(["LINESTRING (101 49, 159 49)"], geotransform, (20, 30), buffer=2.5)
+        self.assertEqual(line.bounds(20, 30), (slice(0, 2), slice(0, 30)))
+
+        empty = raster_io.rasterize_region(["POLYGON EMPTY"], geotransform, (20, 30))
+        self.assertIsNone(empty.bounds(20, 30))
+        outside = raster_io.rasterize_region(["POINT (0 0)"], geotransform, (20, 30), buffer=1)
+        self.assertIsNone(outside.bounds(20, 30))
+
+        with self.assertRaises(ValueError):
+            raster_io.rasterize_region([polygon], (100, 2, 0.5, 50, 0, -2), (20, 30))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RasterIOTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,114 @@
+# coding=utf-8
+"""Tests of the background route searches, without QGIS.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import itertools
+import unittest
+
+import numpy as np
+
+from ..pathfinder_constants import ENGINE_PYTHON, ENGINE_NAMES
+from ..pathfinder_core import SurfaceSpec
+from ..route_jobs import ROUTE_FIELDS, RouteJob, RouteLayers
+
+# A 10 by 10 grid of 2 by 2 map unit pixels, with its top left corner at (10, 40)
+GEOTRANSFORM = (10, 2, 0, 40, 0, -2)
+
+
+class FakeLayer:
+    """Stands in for a QgsVectorLayer, which the layer registry only asks for
+    its id."""
+    ids = itertools.count()
+
+    def __init__(self, crs):
+        self.crs = crs
+        self.layer_id = "layer_{}".format(next(self.ids))
+
+    def id(self):
+        return self.layer_id
+
+
+class RouteJobTest(unittest.TestCase):
+    """Runs route searches and shares route layers by CRS."""
+
+    def setUp(self):
+        mask = np.ones((10, 10))
+        # A wall splits off the last two columns
+        mask[:, 7] = 0
+        self.spec = SurfaceSpec([mask, np.full((10, 10), 2.0)], traversability_layer=0, traversability_min=1,
+                                cost_layer=1)
+
+    def test_endpoints(self):
+        """Endpoints are converted to the pixels holding them, with points on
+        the far edges in the last row or column."""
+        job = RouteJob(self.spec, GEOTRANSFORM, 1, (11, 39), (24.5, 20), ENGINE_PYTHON)
+        self.assertEqual((job.start, job.end), ((0, 0), (7, 9)))
+
+    def test_found_route(self):
+        job = RouteJob(self.spec, GEOTRANSFORM, 7, (11, 39), (21, 39), ENGINE_PYTHON)
+        progress = []
+        self.assertTrue(job.run(is_canceled=lambda: False, on_progress=progress.append))
+        self.assertIsNone(job.error)
+        self.assertEqual(job.vertices(), [(11, 39), (21, 39)])
+
+        attributes = job.attributes()
+        self.assertEqual(len(attributes), len(ROUTE_FIELDS))
+        self.assertEqual(attributes[:4], [7, 10.0, ENGINE_NAMES[ENGINE_PYTHON], job.result.expansions])
+        self.assertGreaterEqual(attributes[4], 0)
+        self.assertEqual(dict(zip((name for name, _ in ROUTE_FIELDS), attributes))["cost"], 10.0)
+
+    def test_failed_route(self):
+        """A route that cannot be found keeps the error and the search's
+        messages, to be logged on the main thread."""
+        job = RouteJob(self.spec, GEOTRANSFORM, 2, (11, 39), (29, 21), ENGINE_PYTHON)
+        self.assertFalse(job.run())
+        self.assertIsNone(job.result)
+        self.assertIn("not connected", job.error)
+        self.assertTrue(any("component" in message for message in job.messages))
+
+    def test_canceled_route(self):
+        """A cancelled route is neither found nor reported as an error."""
+        job = RouteJob(self.spec, GEOTRANSFORM, 3, (11, 39), (21, 21), ENGINE_PYTHON)
+        self.assertFalse(job.run(is_canceled=lambda: True))
+        self.assertIsNone(job.result)
+        self.assertIsNone(job.error)
+
+    def test_route_layers(self):
+        """Routes in one CRS share a layer, which is replaced once it has been
+        removed from the project."""
+        project = {}
+
+        def create_layer(crs):
+            layer = FakeLayer(crs)
+            project[layer.id()] = layer
+            return layer
+
+        layers = RouteLayers()
+        first = layers.layer("EPSG:3857", project.get, lambda: create_layer("EPSG:3857"))
+        self.assertIs(layers.layer("EPSG:3857", project.get, lambda: create_layer("EPSG:3857")), first)
+        other = layers.layer("EPSG:4326", project.get, lambda: create_layer("EPSG:4326"))
+        self.assertIsNot(other, first)
+        self.assertEqual(len(project), 2)
+
+        del project[first.id()]
+        replaced = layers.layer("EPSG:3857", project.get, lambda: create_layer("EPSG:3857"))
+        self.assertIsNot(replaced, first)
+        self.assertEqual(replaced.crs, "EPSG:3857")
+        self.assertIs(layers.layer("EPSG:3857", project.get, lambda: create_layer("EPSG:3857")), replaced)
+        self.assertIs(layers.layer("EPSG:4326", project.get, lambda: create_layer("EPSG:4326")), other)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RouteJobTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
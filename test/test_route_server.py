@@ -0,0 +1,147 @@
+# coding=utf-8
+"""Tests of the route server over localhost.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+The server runs on an ephemeral localhost port, in an event loop on a
+background thread, over surfaces built in memory so that GDAL is not needed.
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import asyncio
+import http.client
+import json
+import threading
+import unittest
+
+import numpy as np
+
+from ..pathfinder_core import ENGINE_PYTHON, SurfaceSpec, find_path, cost_distance, world_to_pixel
+from ..route_server import RouteServer, Surface
+from .test_engines import TENBYTEN_PATH, read_ascii_grid
+
+# Pixels of 10 map units, with the top left corner at (1000, 2000)
+GEOTRANSFORM = (1000.0, 10.0, 0.0, 2000.0, 0.0, -10.0)
+
+
+def pixel_center(pix):
+    return [GEOTRANSFORM[0] + (pix[0] + 0.5) * GEOTRANSFORM[1], GEOTRANSFORM[3] + (pix[1] + 0.5) * GEOTRANSFORM[5]]
+
+
+class RouteServerTest(unittest.TestCase):
+    """Queries a running server and compares its answers with the engines."""
+
+    @classmethod
+    def setUpClass(cls):
+        values = read_ascii_grid(TENBYTEN_PATH)
+        cls.spec = SurfaceSpec([values], traversability_layer=0, traversability_min=1, cost_expression='1 + val1')
+        cls.server = RouteServer({"tenbyten": Surface("tenbyten", cls.spec, GEOTRANSFORM)}, workers=2)
+        cls.server.warm()
+
+        cls.loop = asyncio.new_event_loop()
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+        cls.port = asyncio.run_coroutine_threadsafe(cls.server.start("127.0.0.1", 0), cls.loop).result(10)
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.server.stop(), cls.loop).result(10)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join(10)
+        cls.loop.close()
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        try:
+            connection.request(method, path, json.dumps(body) if body is not None else None,
+                               {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_surfaces(self):
+        status, payload = self.request("GET", "/surfaces")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["surfaces"]["tenbyten"]["width"], 10)
+        self.assertEqual(payload["surfaces"]["tenbyten"]["geotransform"], list(GEOTRANSFORM))
+
+    def test_route(self):
+        status, feature = self.request("POST", "/route", {"surface": "tenbyten", "start": pixel_center((1, 0)),
+                                                          "end": pixel_center((9, 9)), "engine": "python"})
+        self.assertEqual(status, 200)
+        expected = find_path(self.spec, (1, 0), (9, 9), ENGINE_PYTHON)
+        self.assertAlmostEqual(feature["properties"]["cost"], expected.cost)
+        self.assertEqual(feature["geometry"]["coordinates"][0], pixel_center((1, 0)))
+        self.assertEqual(feature["geometry"]["coordinates"][-1], pixel_center((9, 9)))
+
+    def test_concurrent_routes(self):
+        """Routes requested at once over one connection each all match the engine."""
+        pairs = [((1, y), (9, 9 - y)) for y in range(10)]
+        results = [None] * len(pairs)
+
+        def query(i):
+            results[i] = self.request("POST", "/route", {"start": pixel_center(pairs[i][0]),
+                                                         "end": pixel_center(pairs[i][1])})
+
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(len(pairs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        for (start, end), (status, feature) in zip(pairs, results):
+            self.assertEqual(status, 200)
+            self.assertAlmostEqual(feature["properties"]["cost"], find_path(self.spec, start, end).cost)
+
+    def test_cost_distance(self):
+        sources = [(1, 0), (5, 5)]
+        expected, _ = cost_distance(self.spec, sources, ENGINE_PYTHON)
+        targets = [(0, 0), (9, 9), (3, 7)]
+        status, payload = self.request("POST", "/cost-distance", {
+            "sources": [pixel_center(p) for p in sources], "targets": [pixel_center(p) for p in targets]})
+        self.assertEqual(status, 200)
+        self.assertIsNone(payload["costs"][0])
+        for (x, y), cost in zip(targets[1:], payload["costs"][1:]):
+            self.assertAlmostEqual(cost, expected[y, x])
+
+    def test_isochrone(self):
+        expected, _ = cost_distance(self.spec, [(1, 0)], ENGINE_PYTHON)
+        status, feature = self.request("POST", "/isochrone", {"sources": [pixel_center((1, 0))], "max_cost": 20})
+        self.assertEqual(status, 200)
+        self.assertEqual(feature["properties"]["pixels"], np.count_nonzero(expected <= 20))
+
+        # Every pixel centre inside a polygon is within the cost limit
+        covered = 0
+        for polygon in feature["geometry"]["coordinates"]:
+            xs = [c[0] for c in polygon[0]]
+            ys = [c[1] for c in polygon[0]]
+            for x in np.arange(min(xs) + 5, max(xs), 10):
+                for y in np.arange(min(ys) + 5, max(ys), 10):
+                    pix = world_to_pixel(x, y, GEOTRANSFORM, 10, 10)
+                    self.assertLessEqual(expected[pix[1], pix[0]], 20)
+                    covered += 1
+        self.assertEqual(covered, feature["properties"]["pixels"])
+
+    def test_errors(self):
+        self.assertEqual(self.request("POST", "/nowhere", {})[0], 404)
+        self.assertEqual(self.request("GET", "/route")[0], 405)
+        self.assertEqual(self.request("POST", "/route", {"surface": "missing"})[0], 404)
+        status, payload = self.request("POST", "/route", {"start": [0, 0], "end": pixel_center((9, 9))})
+        self.assertEqual(status, 400)
+        self.assertIn("outside", payload["error"])
+        status, payload = self.request("POST", "/route", {"start": pixel_center((0, 0)),
+                                                          "end": pixel_center((9, 9))})
+        self.assertEqual(status, 400)
+        self.assertIn("traversable", payload["error"])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RouteServerTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
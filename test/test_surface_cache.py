@@ -0,0 +1,109 @@
+# coding=utf-8
+"""Tests of the stored cost and traversability surfaces.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Noah Mollerstuen'
+__date__ = '2022-01-15'
+__copyright__ = '(C) 2022 by Noah Mollerstuen'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..pathfinder_core import SurfaceSpec
+from ..surface_cache import SurfaceCache
+
+
+class SurfaceCacheTest(unittest.TestCase):
+    """Stores, maps and evicts evaluated surfaces."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        cache = SurfaceCache(self.directory)
+        self.assertIsNone(cache.get("key", (3, 4), np.float64))
+        stored = cache.put("key", (3, 4), np.float64, lambda out: out.fill(2.5))
+        self.assertFalse(stored.flags.writeable)
+
+        mapped = SurfaceCache(self.directory).get("key", (3, 4), np.float64)
+        self.assertIsInstance(mapped, np.memmap)
+        np.testing.assert_array_equal(mapped, np.full((3, 4), 2.5))
+        self.assertFalse(mapped.flags.writeable)
+        # A surface of another shape or type is not a match
+        self.assertIsNone(cache.get("key", (4, 3), np.float64))
+        self.assertIsNone(cache.get("key", (3, 4), bool))
+        self.assertEqual(len(cache), 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = SurfaceCache(self.directory)
+        cache.put("size", (10, 10), np.float64, lambda out: out.fill(1))
+        size = cache.total_bytes()
+        os.remove(cache.path("size"))
+
+        cache = SurfaceCache(self.directory, max_bytes=size * 3)
+        for age, key in enumerate(("a", "b", "c")):
+            cache.put(key, (10, 10), np.float64, lambda out: out.fill(1))
+            os.utime(cache.path(key), (1000 + age, 1000 + age))
+        cache.get("a", (10, 10), np.float64)
+        cache.put("d", (10, 10), np.float64, lambda out: out.fill(1))
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get("b", (10, 10), np.float64))
+        self.assertIsNotNone(cache.get("a", (10, 10), np.float64))
+        self.assertLessEqual(cache.total_bytes(), size * 3)
+
+        # A surface too large for the cache on its own is evaluated but not stored
+        large = cache.put("large", (100, 100), np.float64, lambda out: out.fill(3))
+        np.testing.assert_array_equal(large, np.full((100, 100), 3.0))
+        self.assertIsNone(cache.get("large", (100, 100), np.float64))
+        self.assertEqual([name for name in os.listdir(self.directory) if not name.endswith(".npy")], [])
+
+    def test_specs_share_surfaces(self):
+        rng = np.random.default_rng(44)
+        inp_arrs = [rng.uniform(1, 5, (20, 30)), rng.integers(0, 3, (20, 30)).astype(np.uint8)]
+        fingerprints = {(0, 1): ["a.tif", 1, 100], (1, 1): ["b.tif", 1, 100]}
+        options = dict(traversability_expression='val2 != 0', cost_expression='val1 * 2')
+
+        first = SurfaceSpec(inp_arrs, surface_cache=SurfaceCache(self.directory), band_fingerprints=fingerprints,
+                            **options)
+        np.testing.assert_array_equal(first.shared_cost(), inp_arrs[0] * 2)
+        np.testing.assert_array_equal(first.shared_mask(), inp_arrs[1] != 0)
+
+        # Unchanged inputs are mapped from the cache rather than evaluated, so different values are not seen
+        zeros = [np.zeros_like(arr) for arr in inp_arrs]
+        second = SurfaceSpec(zeros, surface_cache=SurfaceCache(self.directory), band_fingerprints=fingerprints,
+                             **options)
+        np.testing.assert_array_equal(second.shared_cost(), inp_arrs[0] * 2)
+        np.testing.assert_array_equal(second.shared_mask(), inp_arrs[1] != 0)
+
+        # A changed input only invalidates the surfaces which read it
+        changed = dict(fingerprints)
+        changed[(0, 1)] = ["a.tif", 2, 100]
+        third = SurfaceSpec(zeros, surface_cache=SurfaceCache(self.directory), band_fingerprints=changed, **options)
+        np.testing.assert_array_equal(third.shared_cost(), np.zeros((20, 30)))
+        np.testing.assert_array_equal(third.shared_mask(), inp_arrs[1] != 0)
+
+        # So do changed options
+        fourth = SurfaceSpec(zeros, surface_cache=SurfaceCache(self.directory), band_fingerprints=fingerprints,
+                             traversability_expression='val2 != 0', cost_expression='val1 * 3')
+        np.testing.assert_array_equal(fourth.shared_cost(), np.zeros((20, 30)))
+        np.testing.assert_array_equal(fourth.shared_mask(), inp_arrs[1] != 0)
+        self.assertEqual(len(SurfaceCache(self.directory)), 4)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SurfaceCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)